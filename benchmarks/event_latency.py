@@ -0,0 +1,297 @@
+"""
+Measures the latency from logging a scalar (or image) with the Logger until it is
+visible to a client of the server, i.e. until it is part of an event of /events.
+This includes the file watcher, updating the data, and publishing the event.
+
+A probe process logs at the given rate and records the time of every call, while
+the client records when each step appears in the events for the first time. It is
+repeated for every combination of rates and tree sizes (number of other experiments
+that already exist), since a larger tree makes each update more expensive.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from load_test import percentile, start_server
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+default_rates = [1.0, 10.0, 50.0]
+default_experiments = [10, 100]
+default_steps = 100
+default_duration = 20.0
+default_port = 4345
+
+probe_name = "latency-probe"
+probe_category = "latency"
+
+
+def populate(log_dir: str, num_experiments: int, num_steps: int):
+    from lavd import Logger
+
+    rng = random.Random(0)
+    for i in range(num_experiments):
+        logger = Logger("experiment-{}".format(i), log_dir=log_dir)
+        for step in range(1, num_steps + 1):
+            logger.log_scalar(rng.random(), "loss", step=step)
+
+
+def write_probe(
+    log_dir: str,
+    kind: str,
+    rate: float,
+    duration: float,
+    queue: multiprocessing.Queue,
+):
+    """
+    Logs a scalar or image with increasing steps at the given rate, and puts the time
+    right before each call into the queue.
+    """
+    from lavd import Logger
+
+    logger = Logger(probe_name, log_dir=log_dir)
+    image = None
+    if kind == "images":
+        from PIL import Image
+
+        image = Image.new("RGB", (64, 64))
+    start = time.perf_counter()
+    for i in range(int(rate * duration)):
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        step = i + 1
+        written_at = time.time()
+        if image is None:
+            logger.log_scalar(float(step), probe_category, step=step)
+        else:
+            logger.log_image(image, probe_category, step=step)
+        queue.put((step, written_at))
+    queue.put(None)
+
+
+class EventWatcher:
+    """
+    Records when each step of the probe is first seen in the events.
+    """
+
+    def __init__(self, kind: str):
+        super().__init__()
+        self.kind = kind
+        self.buffer = b""
+        self.seen: Dict[int, float] = {}
+        self.num_events = 0
+
+    def on_chunk(self, chunk: bytes):
+        # The time it arrived, regardless of how long it takes to parse it.
+        received_at = time.time()
+        self.buffer += chunk
+        *events, self.buffer = self.buffer.split(b"\n\n")
+        for event in events:
+            if b"event: data" not in event:
+                continue
+            self.num_events += 1
+            data = json.loads(
+                b"\n".join(
+                    line[len(b"data:") :]
+                    for line in event.split(b"\n")
+                    if line.startswith(b"data:")
+                )
+            )
+            steps = (
+                data.get(probe_name, {})
+                .get(self.kind, {})
+                .get(probe_category, {})
+                .get("steps", {})
+            )
+            for step in steps:
+                self.seen.setdefault(int(step), received_at)
+
+
+async def measure(
+    server: subprocess.Popen,
+    port: int,
+    kind: str,
+    rate: float,
+    duration: float,
+    log_dir: str,
+    query: str,
+) -> Optional[List[float]]:
+    """
+    Measures the latencies of the steps logged by the probe, the ones that were never
+    visible are infinite.
+    """
+    watcher = EventWatcher(kind)
+    http = AsyncHTTPClient(force_instance=True)
+    events = http.fetch(
+        HTTPRequest(
+            "http://localhost:{}/events{}".format(port, query),
+            streaming_callback=watcher.on_chunk,
+            request_timeout=0,
+        ),
+        raise_error=False,
+    )
+    # Makes sure the client is connected before anything is logged.
+    await asyncio.sleep(1)
+    queue: multiprocessing.Queue = multiprocessing.Queue()
+    probe = multiprocessing.Process(
+        target=write_probe, args=(log_dir, kind, rate, duration, queue), daemon=True
+    )
+    probe.start()
+    written: Dict[int, float] = {}
+    while True:
+        # The queue is blocking, hence it is read in a thread, so that the events are
+        # still received in the meantime.
+        entry = await asyncio.get_running_loop().run_in_executor(None, queue.get)
+        if entry is None:
+            break
+        step, written_at = entry
+        written[step] = written_at
+    probe.join()
+    # The last steps need some time to become visible.
+    deadline = time.perf_counter() + 10
+    while len(watcher.seen) < len(written) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+    # Stopping the server closes the event stream.
+    server.terminate()
+    await asyncio.gather(events, return_exceptions=True)
+    if len(written) == 0:
+        return None
+    return [
+        watcher.seen[step] - written_at
+        for step, written_at in written.items()
+        if step in watcher.seen
+    ] + [float("inf")] * sum(1 for step in written if step not in watcher.seen)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-r",
+        "--rates",
+        dest="rates",
+        nargs="+",
+        type=float,
+        default=default_rates,
+        help="Rates in writes per second of the probe [Default: {}]".format(
+            " ".join(str(rate) for rate in default_rates)
+        ),
+    )
+    parser.add_argument(
+        "-e",
+        "--experiments",
+        dest="experiments",
+        nargs="+",
+        type=int,
+        default=default_experiments,
+        help="Numbers of other experiments in the log directory [Default: {}]".format(
+            " ".join(str(n) for n in default_experiments)
+        ),
+    )
+    parser.add_argument(
+        "-s",
+        "--steps",
+        dest="steps",
+        type=int,
+        default=default_steps,
+        help="Number of steps of the other experiments [Default: {}]".format(
+            default_steps
+        ),
+    )
+    parser.add_argument(
+        "-k",
+        "--kind",
+        dest="kind",
+        choices=["scalars", "images"],
+        default="scalars",
+        help="Kind that is logged by the probe, images require Pillow "
+        "[Default: scalars]",
+    )
+    parser.add_argument(
+        "-d",
+        "--duration",
+        dest="duration",
+        type=float,
+        default=default_duration,
+        help="Duration in seconds of the logging of each configuration "
+        "[Default: {}]".format(default_duration),
+    )
+    parser.add_argument(
+        "--probe-only",
+        dest="probe_only",
+        action="store_true",
+        help="Only subscribe to the probe, instead of all experiments like the "
+        "dashboard",
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        dest="port",
+        type=int,
+        default=default_port,
+        help="Port of the server [Default: {}]".format(default_port),
+    )
+    return parser.parse_args()
+
+
+def main():
+    options = parse_args()
+    query = "?name={}".format(probe_name) if options.probe_only else ""
+    print(
+        "{:>11} {:>9} {:>7} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+            "experiments",
+            "rate [/s]",
+            "writes",
+            "missing",
+            "p50 [ms]",
+            "p90 [ms]",
+            "p99 [ms]",
+            "max [ms]",
+        )
+    )
+    for num_experiments in options.experiments:
+        for rate in options.rates:
+            with tempfile.TemporaryDirectory(prefix="lavd-event-latency-") as log_dir:
+                populate(log_dir, num_experiments, options.steps)
+                server = start_server(log_dir, options.port, workers=1)
+                try:
+                    latencies = asyncio.run(
+                        measure(
+                            server,
+                            options.port,
+                            options.kind,
+                            rate,
+                            options.duration,
+                            log_dir,
+                            query,
+                        )
+                    )
+                finally:
+                    if server.poll() is None:
+                        server.terminate()
+                    server.wait()
+            if latencies is None:
+                continue
+            visible = [latency for latency in latencies if latency != float("inf")]
+            print(
+                "{:>11} {:>9g} {:>7} {:>8} {:>8.0f} {:>8.0f} {:>8.0f} {:>8.0f}".format(
+                    num_experiments,
+                    rate,
+                    len(latencies),
+                    len(latencies) - len(visible),
+                    percentile(visible, 50) * 1000,
+                    percentile(visible, 90) * 1000,
+                    percentile(visible, 99) * 1000,
+                    max(visible, default=float("nan")) * 1000,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
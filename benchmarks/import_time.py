@@ -0,0 +1,143 @@
+"""
+Measures how long it takes to import lavd, using `python -X importtime`, which
+reports the cumulative import time of every module.
+
+Every measurement runs in a fresh interpreter, since imported modules are cached.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+default_modules = ["lavd", "lavd.server"]
+default_repeat = 10
+default_top = 10
+
+py_dir = Path(__file__).absolute().parent.parent / "py"
+
+
+def measure_import(module: str) -> Tuple[float, int, Dict[str, int]]:
+    """
+    Imports the module in a new interpreter.
+
+    Returns:
+        wall_time_import_time_and_dependencies (Tuple[float, int, Dict[str, int]]):
+            Wall time of the whole interpreter in seconds, the cumulative import time
+            of the module in microseconds and the cumulative import time of each of
+            its direct dependencies.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.fspath(py_dir), *filter(None, [env.get("PYTHONPATH")])]
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+        env=env,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    wall_time = time.perf_counter() - start
+    imports: List[Tuple[str, int, int]] = []
+    for line in result.stderr.decode("utf-8").splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            # The header of the table
+            continue
+        # Nested imports are indented by two spaces per level.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(cumulative), depth))
+    import_time = 0
+    dependencies = {}
+    # Modules are listed after all their dependencies, hence the dependencies are
+    # the nested imports right before the module.
+    for i, (name, cumulative, depth) in enumerate(imports):
+        if name == module and depth == 0:
+            import_time = cumulative
+            for dep_name, dep_cumulative, dep_depth in reversed(imports[:i]):
+                if dep_depth == 0:
+                    break
+                if dep_depth == 1:
+                    dependencies[dep_name] = dep_cumulative
+            break
+    return wall_time, import_time, dependencies
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-m",
+        "--module",
+        dest="modules",
+        nargs="+",
+        default=default_modules,
+        help="Modules to import [Default: {}]".format(" ".join(default_modules)),
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        dest="repeat",
+        type=int,
+        default=default_repeat,
+        help="Number of times each import is measured [Default: {}]".format(
+            default_repeat
+        ),
+    )
+    parser.add_argument(
+        "-t",
+        "--top",
+        dest="top",
+        type=int,
+        default=default_top,
+        help="Number of slowest dependencies to show [Default: {}]".format(default_top),
+    )
+    return parser.parse_args()
+
+
+def main():
+    options = parse_args()
+    for module in options.modules:
+        wall_times: List[float] = []
+        import_times: List[int] = []
+        dependencies: Dict[str, List[int]] = {}
+        for _ in range(options.repeat):
+            wall_time, import_time, deps = measure_import(module)
+            wall_times.append(wall_time)
+            import_times.append(import_time)
+            for name, us in deps.items():
+                dependencies.setdefault(name, []).append(us)
+        print("import {}".format(module))
+        print(
+            "    import time: {:.1f} ms (median of {})".format(
+                statistics.median(import_times) / 1000, options.repeat
+            )
+        )
+        print(
+            "    interpreter: {:.1f} ms (median wall time, including start up)".format(
+                statistics.median(wall_times) * 1000
+            )
+        )
+        # Only the direct dependencies are shown, nested ones are already included
+        # in their parent.
+        slowest = sorted(
+            (
+                (statistics.median(times) / 1000, name)
+                for name, times in dependencies.items()
+            ),
+            reverse=True,
+        )[: options.top]
+        print("    slowest dependencies:")
+        for ms, name in slowest:
+            print("        {:>8.1f} ms  {}".format(ms, name))
+
+
+if __name__ == "__main__":
+    main()
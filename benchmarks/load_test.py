@@ -0,0 +1,511 @@
+"""
+Load test of the lavd server, to find out how many users and experiments that are
+being logged one instance can support.
+
+Every configuration starts writer processes that log with the Logger at the given
+rates (scalars, images and log lines per second), a server for their log directory,
+and simulated browser clients. Each client keeps /events open, and repeatedly
+fetches /api/all and some of the items (the same requests the dashboard makes),
+with some pause in between.
+
+Multiple numbers of writers and clients can be given, which are all combined, e.g.
+--writers 1 4 --clients 10 50 100 runs six configurations, one after another.
+
+The CPU and memory usage of the server (including its workers) uses psutil if it is
+installed, otherwise /proc, which is only available on Linux.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+try:
+    import psutil
+
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+py_dir = Path(__file__).absolute().parent.parent / "py"
+# The writers use the Logger of this repository, not an installed version.
+sys.path.insert(0, os.fspath(py_dir))
+
+default_writers = [1]
+default_clients = [10]
+default_duration = 20.0
+default_port = 4344
+default_scalar_rate = 50.0
+default_image_rate = 1.0
+default_line_rate = 20.0
+default_interval = 5.0
+default_items = 3
+
+# Number of different scalars that each writer logs, the step increases once all of
+# them have been logged.
+num_metrics = 4
+
+
+class Rates(NamedTuple):
+    scalars: float = default_scalar_rate
+    images: float = default_image_rate
+    lines: float = default_line_rate
+
+
+class Stats:
+    """
+    Latencies (in seconds), sizes and errors of the requests, grouped by kind.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.latencies: Dict[str, List[float]] = {}
+        self.bytes: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.num_events = 0
+
+    def add(self, kind: str, latency: float, size: int, error: bool = False):
+        if error:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            return
+        self.latencies.setdefault(kind, []).append(latency)
+        self.bytes[kind] = self.bytes.get(kind, 0) + size
+
+
+class Usage(NamedTuple):
+    cpu_percent: float
+    max_rss: int
+
+
+def percentile(values: List[float], q: float) -> float:
+    # Nearest rank, which is always one of the values.
+    if len(values) == 0:
+        return float("nan")
+    sorted_values = sorted(values)
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return sorted_values[index]
+
+
+def write_logs(log_dir: str, name: str, rates: Rates, duration: float):
+    """
+    Logs with the given rates for the duration, in its own process.
+    """
+    from lavd import Logger
+
+    try:
+        from PIL import Image
+
+        has_pil = True
+    except ImportError:
+        has_pil = False
+    logger = Logger(name, log_dir=log_dir)
+    rng = random.Random(name)
+    counts = [0, 0, 0]
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < duration:
+        # Everything that is due is logged at once, ten times per second.
+        for i, rate in enumerate(rates):
+            due = int(rate * elapsed) - counts[i]
+            for _ in range(due):
+                count = counts[i]
+                if i == 0:
+                    logger.log_scalar(
+                        rng.random(),
+                        "metric-{}".format(count % num_metrics),
+                        step=count // num_metrics + 1,
+                    )
+                elif i == 1 and has_pil:
+                    colour = tuple(rng.randrange(256) for _ in range(3))
+                    logger.log_image(
+                        Image.new("RGB", (64, 64), colour), "sample", step=count + 1
+                    )
+                elif i == 2:
+                    logger.log("train", "line {} of {}".format(count, name))
+                counts[i] += 1
+        time.sleep(0.1)
+        elapsed = time.perf_counter() - start
+
+
+def start_server(log_dir: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.fspath(py_dir), *filter(None, [env.get("PYTHONPATH")])]
+    )
+    command = [sys.executable, "-m", "lavd.server", log_dir, "-p", str(port)]
+    if workers > 1:
+        command.extend(["--workers", str(workers)])
+    server = subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.perf_counter() + 60
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen("http://localhost:{}/api/all".format(port)):
+                return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("The server did not start on port {}".format(port))
+
+
+def process_tree(pid: int) -> List[int]:
+    pids = [pid]
+    try:
+        with open("/proc/{pid}/task/{pid}/children".format(pid=pid)) as fd:
+            for child in fd.read().split():
+                pids.extend(process_tree(int(child)))
+    except OSError:
+        pass
+    return pids
+
+
+def measure_usage(pid: int) -> Tuple[float, int]:
+    """
+    Measures the resources of the process, including its children (e.g. workers).
+
+    Returns:
+        cpu_time_and_rss (Tuple[float, int]):
+            CPU time in seconds, and resident memory in bytes.
+    """
+    cpu_time = 0.0
+    rss = 0
+    if HAS_PSUTIL:
+        try:
+            process = psutil.Process(pid)
+            for proc in [process, *process.children(recursive=True)]:
+                times = proc.cpu_times()
+                cpu_time += times.user + times.system
+                rss += proc.memory_info().rss
+        except psutil.Error:
+            pass
+        return cpu_time, rss
+    clock_ticks = os.sysconf("SC_CLK_TCK")
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for proc_pid in process_tree(pid):
+        try:
+            with open("/proc/{}/stat".format(proc_pid)) as fd:
+                # The name of the process is in parentheses and may contain spaces.
+                fields = fd.read().rsplit(")", 1)[1].split()
+            cpu_time += (int(fields[11]) + int(fields[12])) / clock_ticks
+            with open("/proc/{}/statm".format(proc_pid)) as fd:
+                rss += int(fd.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            pass
+    return cpu_time, rss
+
+
+async def monitor(pid: int, deadline: float) -> Usage:
+    start_cpu, max_rss = measure_usage(pid)
+    start = time.perf_counter()
+    cpu_time = start_cpu
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(0.5)
+        cpu_time, rss = measure_usage(pid)
+        max_rss = max(max_rss, rss)
+    elapsed = time.perf_counter() - start
+    return Usage(cpu_percent=100 * (cpu_time - start_cpu) / elapsed, max_rss=max_rss)
+
+
+def item_urls(data: Dict) -> List[str]:
+    urls = []
+    for name, name_data in data.items():
+        for kind, kind_data in name_data.items():
+            if kind == "command" or not isinstance(kind_data, dict):
+                continue
+            for category, category_data in kind_data.items():
+                if "global" in category_data:
+                    urls.append("/api/{}/{}/global/{}".format(kind, name, category))
+                for step in category_data.get("steps", {}):
+                    urls.append("/api/{}/{}/{}/{}".format(kind, name, step, category))
+    return urls
+
+
+async def fetch(
+    http: AsyncHTTPClient, base_url: str, path: str, kind: str, stats: Stats
+) -> Optional[bytes]:
+    start = time.perf_counter()
+    response = await http.fetch(base_url + path, raise_error=False)
+    latency = time.perf_counter() - start
+    if response.code != 200:
+        stats.add(kind, latency, 0, error=True)
+        return None
+    stats.add(kind, latency, len(response.body))
+    return response.body
+
+
+async def simulate_client(
+    http: AsyncHTTPClient,
+    base_url: str,
+    stats: Stats,
+    deadline: float,
+    interval: float,
+    num_items: int,
+    rng: random.Random,
+):
+    # Clients do not all start at the same time.
+    await asyncio.sleep(rng.uniform(0, interval))
+
+    def on_events_chunk(chunk: bytes):
+        stats.num_events += chunk.count(b"event: data")
+        stats.bytes["events"] = stats.bytes.get("events", 0) + len(chunk)
+
+    # The event stream is only closed when the server is stopped.
+    events = http.fetch(
+        HTTPRequest(
+            base_url + "/events",
+            streaming_callback=on_events_chunk,
+            request_timeout=0,
+        ),
+        raise_error=False,
+    )
+    while time.perf_counter() < deadline:
+        body = await fetch(http, base_url, "/api/all", "/api/all", stats)
+        if body is not None:
+            urls = item_urls(json.loads(body))
+            for url in rng.sample(urls, min(num_items, len(urls))):
+                await fetch(http, base_url, url, "items", stats)
+        await asyncio.sleep(interval * rng.uniform(0.5, 1.5))
+    return events
+
+
+async def simulate_clients(
+    port: int,
+    server_pid: int,
+    num_clients: int,
+    duration: float,
+    interval: float,
+    num_items: int,
+) -> Tuple[Stats, Usage, List]:
+    # Each client holds a connection for the events and makes one request at a time.
+    http = AsyncHTTPClient(force_instance=True, max_clients=2 * num_clients + 16)
+    stats = Stats()
+    deadline = time.perf_counter() + duration
+    rng = random.Random(0)
+    results = await asyncio.gather(
+        monitor(server_pid, deadline),
+        *[
+            simulate_client(
+                http,
+                "http://localhost:{}".format(port),
+                stats,
+                deadline,
+                interval,
+                num_items,
+                random.Random(rng.random()),
+            )
+            for _ in range(num_clients)
+        ],
+    )
+    usage, *events = results
+    return stats, usage, events
+
+
+def run_configuration(
+    num_writers: int, num_clients: int, options: argparse.Namespace
+) -> Tuple[Stats, Usage]:
+    rates = Rates(
+        scalars=options.scalar_rate,
+        images=options.image_rate,
+        lines=options.line_rate,
+    )
+    with tempfile.TemporaryDirectory(prefix="lavd-load-test-") as log_dir:
+        # Writers log for longer than the clients run, since the server needs some
+        # time to start.
+        writers = [
+            multiprocessing.Process(
+                target=write_logs,
+                args=(log_dir, "writer-{}".format(i), rates, options.duration + 60),
+                daemon=True,
+            )
+            for i in range(num_writers)
+        ]
+        for writer in writers:
+            writer.start()
+        server = start_server(log_dir, options.port, options.workers)
+        try:
+            stats, usage, _ = asyncio.run(run_clients(server, num_clients, options))
+        finally:
+            for writer in writers:
+                writer.terminate()
+            if server.poll() is None:
+                server.terminate()
+                server.wait()
+    return stats, usage
+
+
+async def run_clients(
+    server: subprocess.Popen, num_clients: int, options: argparse.Namespace
+) -> Tuple[Stats, Usage, List]:
+    stats, usage, events = await simulate_clients(
+        options.port,
+        server.pid,
+        num_clients,
+        options.duration,
+        options.interval,
+        options.items,
+    )
+    # Stopping the server closes the event streams.
+    server.terminate()
+    await asyncio.gather(*events, return_exceptions=True)
+    return stats, usage, events
+
+
+def print_report(num_writers: int, num_clients: int, stats: Stats, usage: Usage):
+    print("{} writers, {} clients".format(num_writers, num_clients))
+    print(
+        "    {:<10} {:>8} {:>7} {:>9} {:>9} {:>12}".format(
+            "request", "count", "errors", "p50 [ms]", "p99 [ms]", "MiB sent"
+        )
+    )
+    for kind in ["/api/all", "items"]:
+        latencies = stats.latencies.get(kind, [])
+        print(
+            "    {:<10} {:>8} {:>7} {:>9.1f} {:>9.1f} {:>12.2f}".format(
+                kind,
+                len(latencies),
+                stats.errors.get(kind, 0),
+                percentile(latencies, 50) * 1000,
+                percentile(latencies, 99) * 1000,
+                stats.bytes.get(kind, 0) / 1024 / 1024,
+            )
+        )
+    print(
+        "    {:<10} {:>8} {:>7} {:>9} {:>9} {:>12.2f}".format(
+            "events",
+            stats.num_events,
+            "-",
+            "-",
+            "-",
+            stats.bytes.get("events", 0) / 1024 / 1024,
+        )
+    )
+    print(
+        "    server: {:.1f}% CPU (average), {:.1f} MiB RSS (max)".format(
+            usage.cpu_percent, usage.max_rss / 1024 / 1024
+        )
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-w",
+        "--writers",
+        dest="writers",
+        nargs="+",
+        type=int,
+        default=default_writers,
+        help="Numbers of writers, i.e. experiments being logged [Default: {}]".format(
+            " ".join(str(n) for n in default_writers)
+        ),
+    )
+    parser.add_argument(
+        "-c",
+        "--clients",
+        dest="clients",
+        nargs="+",
+        type=int,
+        default=default_clients,
+        help="Numbers of simulated clients [Default: {}]".format(
+            " ".join(str(n) for n in default_clients)
+        ),
+    )
+    parser.add_argument(
+        "-d",
+        "--duration",
+        dest="duration",
+        type=float,
+        default=default_duration,
+        help="Duration in seconds of each configuration [Default: {}]".format(
+            default_duration
+        ),
+    )
+    parser.add_argument(
+        "--scalars",
+        dest="scalar_rate",
+        type=float,
+        default=default_scalar_rate,
+        help="Scalars per second of each writer [Default: {}]".format(
+            default_scalar_rate
+        ),
+    )
+    parser.add_argument(
+        "--images",
+        dest="image_rate",
+        type=float,
+        default=default_image_rate,
+        help="Images per second of each writer, requires Pillow [Default: {}]".format(
+            default_image_rate
+        ),
+    )
+    parser.add_argument(
+        "--lines",
+        dest="line_rate",
+        type=float,
+        default=default_line_rate,
+        help="Log lines per second of each writer [Default: {}]".format(
+            default_line_rate
+        ),
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        dest="interval",
+        type=float,
+        default=default_interval,
+        help=(
+            "Average pause in seconds of each client between fetching the data "
+            "[Default: {}]"
+        ).format(default_interval),
+    )
+    parser.add_argument(
+        "--items",
+        dest="items",
+        type=int,
+        default=default_items,
+        help="Number of items each client fetches every time [Default: {}]".format(
+            default_items
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Number of worker processes of the server [Default: 1]",
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        dest="port",
+        type=int,
+        default=default_port,
+        help="Port of the server [Default: {}]".format(default_port),
+    )
+    return parser.parse_args()
+
+
+def main():
+    options = parse_args()
+    for num_writers in options.writers:
+        for num_clients in options.clients:
+            stats, usage = run_configuration(num_writers, num_clients, options)
+            print_report(num_writers, num_clients, stats, usage)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 import { navigate, useInterceptor, useRoutes } from "hookrouter";
-import React, { useEffect, useState } from "react";
-import { fetchData } from "./api";
+import React, { useEffect, useRef, useState } from "react";
+import {
+  fetchData,
+  isStatic,
+  selectionQuery,
+  Subscription,
+  subscribeEvents,
+} from "./api";
 import * as styles from "./App.styles";
+import { subscribe } from "./binary";
 import { Colour, ColourMap } from "./colour/definition";
 import { Commands } from "./Commands";
 import { DataMap, Optional } from "./data";
@@ -16,12 +23,17 @@ import { Names, Sidebar } from "./Sidebar";
 import { Loading } from "./Spinner";
 import {
   retrieveColours,
+  retrieveInactiveNames,
   retrieveNames,
   storeColours,
   storeNames,
 } from "./storage";
 import { Texts } from "./Texts";
 
+// How the data is received: over the WebSocket, with server-sent events as a
+// fallback, or from the files of the static build.
+type Transport = "socket" | "events" | "static";
+
 type RouteProps = {
   data: DataMap;
   colours: ColourMap;
@@ -144,31 +156,56 @@ export const App = () => {
       storeColours(colours);
     }
   }, [hasFetched, names, colours]);
+  // Only the data of the active experiments is fetched, the inactive ones are
+  // just listed by name. The query changes when experiments are (de)activated,
+  // which fetches the data again.
+  const query = selectionQuery({
+    exclude: hasFetched ? names.inactive : retrieveInactiveNames(),
+  });
+  // The data is received over the WebSocket, which only sends the changes
+  // after the initial data, unless it is not available, in which case it falls
+  // back to the server-sent events. Both keep the connection when the query
+  // changes and only update what is selected.
+  const [transport, setTransport] = useState<Transport>(
+    isStatic ? "static" : "socket"
+  );
+  const subscription = useRef<Subscription>();
+  // A new subscription, i.e. after falling back to the events, starts with the
+  // current query.
+  const latestQuery = useRef(query);
   useEffect(() => {
-    fetchData().then((d) => {
+    if (transport === "static") {
+      return;
+    }
+    const onData = (d: DataMap) => {
       setNewData(d);
       setHasFetched(true);
-    });
-  }, []);
+    };
+    const sub =
+      transport === "socket"
+        ? subscribe(latestQuery.current, {
+            onData,
+            onFail: () => setTransport("events"),
+          })
+        : subscribeEvents(latestQuery.current, onData);
+    subscription.current = sub;
+    return () => {
+      sub.close();
+      subscription.current = undefined;
+    };
+  }, [transport]);
   useEffect(() => {
-    if (hasFetched) {
-      const eventSource = new EventSource("/events");
-      let lastEvent = 0;
-      eventSource.addEventListener("data", (e) => {
-        const { data, lastEventId } = e as MessageEvent;
-        const eventId = Number.parseInt(lastEventId);
-        if (eventId > lastEvent) {
-          const d: DataMap = new Map(Object.entries(JSON.parse(data)));
-          setNewData(d);
-          lastEvent = eventId;
-        }
+    latestQuery.current = query;
+    if (subscription.current !== undefined) {
+      subscription.current.update(query);
+    } else if (transport === "static") {
+      // The static build has no server that could send any updates.
+      fetchData(query).then((d) => {
+        setNewData(d);
+        setHasFetched(true);
       });
-      // Close the connetion, when unmounted
-      return () => {
-        eventSource.close();
-      };
     }
-  }, [hasFetched]);
+  }, [query, transport]);
   // The interceptor gets called everytime the route changes. When it happens,
   // the overlay is automatically closed.
   useInterceptor((_, nextPath) => {
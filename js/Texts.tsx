@@ -5,6 +5,7 @@ import { ColourMap } from "./colour/definition";
 import {
   DataMap,
   getDataKind,
+  LazyData,
   sortedCategorySteps,
   sortedSteps,
   sortObject,
@@ -18,15 +19,67 @@ export type TextContent = {
   expected?: string;
 };
 
+// Diff computed by the server: equal (=), removed from the actual (-) or added
+// in the expected (+).
+export type DiffOp = ["=" | "-" | "+", string];
+
+export type TextDiff = {
+  level: "char" | "word" | "line";
+  diff: Array<DiffOp>;
+};
+
 type TextProps = {
-  actual: string;
+  actual?: string;
   expected?: string;
+  diff?: Array<DiffOp>;
   categoryFilter?: RegExp;
 };
 
-export const Text: React.FC<TextProps> = ({ actual, expected }) => {
+// Long texts are diffed by the server, instead of loading the full text and
+// diffing it in the browser.
+function toDiffData(
+  value: TextContent | LazyData
+): TextContent | TextDiff | LazyData {
+  if ("api" in value) {
+    return {
+      api: { url: value.api.url.replace(/^\/api\/texts\//, "/api/diff/") },
+    };
+  }
+  return value;
+}
+
+function diffToChanges(
+  diff: Array<DiffOp>
+): Array<{ value: string; added?: boolean; removed?: boolean }> {
+  return diff.map(([op, value]) => ({
+    value,
+    added: op === "+",
+    removed: op === "-",
+  }));
+}
+
+export const Text: React.FC<TextProps> = ({
+  actual: actualText,
+  expected: expectedText,
+  diff,
+}) => {
   const diffActual = [];
   const diffExpected = [];
+  // The actual and expected texts are part of the diff.
+  const actual =
+    diff === undefined
+      ? actualText || ""
+      : diff
+          .filter(([op]) => op !== "+")
+          .map(([, value]) => value)
+          .join("");
+  const expected =
+    diff === undefined
+      ? expectedText
+      : diff
+          .filter(([op]) => op !== "-")
+          .map(([, value]) => value)
+          .join("");
   if (expected === undefined) {
     return (
       <div className={styles.text}>
@@ -34,7 +87,8 @@ export const Text: React.FC<TextProps> = ({ actual, expected }) => {
       </div>
     );
   } else {
-    const changes = diffChars(actual, expected);
+    const changes =
+      diff === undefined ? diffChars(actual, expected) : diffToChanges(diff);
     const identical = actual === expected;
     if (!identical) {
       for (const change of changes) {
@@ -140,11 +194,14 @@ export const Texts: React.FC<Props> = ({
                         : value.global;
                     return (
                       selectedValue && (
-                        <DataLoader data={selectedValue}>
+                        <DataLoader<Partial<TextContent & TextDiff>>
+                          data={toDiffData(selectedValue)}
+                        >
                           {(loadedData) => (
                             <Text
                               actual={loadedData.actual}
                               expected={loadedData.expected}
+                              diff={loadedData.diff}
                             />
                           )}
                         </DataLoader>
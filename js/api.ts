@@ -1,8 +1,91 @@
-import { DataMap } from "./data";
+import { Data, DataMap } from "./data";
 
-export async function fetchData(): Promise<DataMap> {
+declare global {
+  interface Window {
+    // Set by lavd build-static, where the data is read from static files
+    // instead of the server.
+    lavdStatic?: boolean;
+  }
+}
+
+export const isStatic = window.lavdStatic === true;
+
+// Selects which part of the data is sent by the server, everything else is left
+// out, but the names of all experiments are always included.
+export type Selection = {
+  names?: Array<string>;
+  exclude?: Array<string>;
+  pattern?: string;
+  kinds?: Array<string>;
+  categories?: Array<string>;
+  start?: number;
+  end?: number;
+};
+
+export function selectionQuery(selection: Selection = {}): string {
+  const params = new URLSearchParams();
+  const lists: Array<[string, Array<string> | undefined]> = [
+    ["name", selection.names],
+    ["exclude", selection.exclude],
+    ["kind", selection.kinds],
+    ["category", selection.categories],
+  ];
+  for (const [key, values] of lists) {
+    for (const value of values || []) {
+      params.append(key, value);
+    }
+  }
+  if (selection.pattern !== undefined) {
+    params.set("pattern", selection.pattern);
+  }
+  if (selection.start !== undefined) {
+    params.set("start", selection.start.toString());
+  }
+  if (selection.end !== undefined) {
+    params.set("end", selection.end.toString());
+  }
+  const query = params.toString();
+  return query === "" ? "" : `?${query}`;
+}
+
+// The static build has an index of the experiments and their kinds, and each
+// kind of an experiment is in a separate file, so only the selected experiments
+// and kinds are fetched. The other parts of the selection are not supported.
+async function fetchStaticData(query: string): Promise<DataMap> {
+  const params = new URLSearchParams(query);
+  const names = params.getAll("name");
+  const exclude = params.getAll("exclude");
+  const kinds = params.getAll("kind");
+  const response = await fetch("/api/all/index.json");
+  const index: Record<string, Array<string>> = await response.json();
+  const entries = await Promise.all(
+    Object.entries(index).map(async ([name, shards]) => {
+      const data: Record<string, unknown> = {};
+      if (
+        (names.length === 0 || names.includes(name)) &&
+        !exclude.includes(name)
+      ) {
+        const selectedShards = shards.filter(
+          (kind) =>
+            kinds.length === 0 || kinds.includes(kind) || kind === "command"
+        );
+        for (const kind of selectedShards) {
+          const url = `/api/all/${encodeURIComponent(name)}/${kind}.json`;
+          data[kind] = await (await fetch(url)).json();
+        }
+      }
+      return [name, data as Data] as [string, Data];
+    })
+  );
+  return new Map(entries);
+}
+
+export async function fetchData(query: string = ""): Promise<DataMap> {
   try {
-    const response = await fetch("/api/all");
+    if (isStatic) {
+      return await fetchStaticData(query);
+    }
+    const response = await fetch(`/api/all${query}`);
     const data = await response.json();
     const dataMap: DataMap = new Map(Object.entries(data));
     return dataMap;
@@ -11,6 +94,83 @@ export async function fetchData(): Promise<DataMap> {
   }
 }
 
+// Subscription to the data, whose selection can be changed by giving the new
+// query arguments, without having to reconnect.
+export type Subscription = {
+  update: (query: string) => void;
+  close: () => void;
+};
+
+// Subscribes to the data with the server-sent events, which are only sent when
+// the selected data changed, hence it is fetched first.
+export function subscribeEvents(
+  query: string,
+  onData: (data: DataMap) => void
+): Subscription {
+  let currentQuery = query;
+  let eventSource: EventSource | undefined = undefined;
+  let subscriptionId: string | undefined = undefined;
+  let lastEvent = 0;
+  const connect = () => {
+    const source = new EventSource(`/events${currentQuery}`);
+    // Sent first on every (re)connection, which starts with new event ids.
+    source.addEventListener("subscription", (e) => {
+      subscriptionId = (e as MessageEvent).data;
+      lastEvent = 0;
+    });
+    source.addEventListener("data", (e) => {
+      const { data, lastEventId } = e as MessageEvent;
+      const eventId = Number.parseInt(lastEventId);
+      if (eventId > lastEvent) {
+        onData(new Map(Object.entries(JSON.parse(data))));
+        lastEvent = eventId;
+      }
+    });
+    eventSource = source;
+    fetchData(currentQuery).then((d) => {
+      // The events are newer than the fetched data.
+      if (source === eventSource && lastEvent === 0) {
+        onData(d);
+      }
+    });
+  };
+  const reconnect = () => {
+    if (eventSource !== undefined) {
+      eventSource.close();
+    }
+    subscriptionId = undefined;
+    lastEvent = 0;
+    connect();
+  };
+  connect();
+  return {
+    update: (newQuery: string) => {
+      if (newQuery === currentQuery) {
+        return;
+      }
+      currentQuery = newQuery;
+      if (subscriptionId === undefined) {
+        reconnect();
+        return;
+      }
+      // The server sends the newly selected data, unless the subscription is
+      // not found, e.g. when it was handled by another worker.
+      fetch(`/events/${subscriptionId}${newQuery}`, { method: "PUT" })
+        .then((response) => {
+          if (!response.ok) {
+            reconnect();
+          }
+        })
+        .catch(reconnect);
+    },
+    close: () => {
+      if (eventSource !== undefined) {
+        eventSource.close();
+      }
+    },
+  };
+}
+
 // The generic T is only here to distinguish what kind of data is requested.
 // It's always determined by the component that calls it, but all of them just
 // have a URL pointing to the end point.
@@ -23,7 +183,12 @@ export async function fetchUrl<T>(
     if (controller) {
       options.signal = controller.signal;
     }
-    const response = await fetch(url, options);
+    // The static build has a JSON file for each URL of the API, which cannot
+    // take any query arguments.
+    const response = await fetch(
+      isStatic ? `${url.split("?")[0]}.json` : url,
+      options
+    );
     return response.json();
   } catch (e) {
     return undefined;
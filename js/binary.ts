@@ -0,0 +1,366 @@
+import { Subscription } from "./api";
+import { Data, DataMap } from "./data";
+
+// Extension types of MessagePack for the typed arrays sent by the server.
+const EXT_FLOAT64_ARRAY = 1;
+const EXT_UINT32_ARRAY = 2;
+
+// Operations of the patches, see lavd/binary.py.
+const OP_SET = 0;
+const OP_DELETE = 1;
+const OP_SERIES = 2;
+
+type Path = Array<string | number>;
+type Series = [Uint32Array | Float64Array, Float64Array];
+type Op = [number, Path, unknown?];
+type Message =
+  | { type: "state"; id: number; data: Record<string, unknown> }
+  | { type: "patch"; id: number; ops: Array<Op> }
+  | { type: "error"; id: number; message: string };
+
+class Decoder {
+  private bytes: Uint8Array;
+  private view: DataView;
+  private offset = 0;
+  private textDecoder = new TextDecoder();
+
+  constructor(buffer: ArrayBuffer) {
+    this.bytes = new Uint8Array(buffer);
+    this.view = new DataView(buffer);
+  }
+
+  private advance(length: number): number {
+    const start = this.offset;
+    this.offset += length;
+    return start;
+  }
+
+  private u8(): number {
+    return this.view.getUint8(this.advance(1));
+  }
+
+  private u16(): number {
+    return this.view.getUint16(this.advance(2));
+  }
+
+  private u32(): number {
+    return this.view.getUint32(this.advance(4));
+  }
+
+  private str(length: number): string {
+    const start = this.advance(length);
+    return this.textDecoder.decode(this.bytes.subarray(start, this.offset));
+  }
+
+  private bin(length: number): Uint8Array {
+    const start = this.advance(length);
+    return this.bytes.slice(start, this.offset);
+  }
+
+  private array(length: number): Array<unknown> {
+    const arr = new Array(length);
+    for (let i = 0; i < length; i++) {
+      arr[i] = this.decode();
+    }
+    return arr;
+  }
+
+  private map(length: number): Record<string, unknown> {
+    const obj: Record<string, unknown> = {};
+    for (let i = 0; i < length; i++) {
+      const key = this.decode();
+      obj[String(key)] = this.decode();
+    }
+    return obj;
+  }
+
+  private ext(length: number): unknown {
+    const code = this.view.getInt8(this.advance(1));
+    // The bytes are copied, since typed arrays need to be aligned to the size
+    // of their elements. They are little-endian, just like the browsers.
+    const data = this.bin(length);
+    if (code === EXT_FLOAT64_ARRAY) {
+      return new Float64Array(data.buffer);
+    } else if (code === EXT_UINT32_ARRAY) {
+      return new Uint32Array(data.buffer);
+    }
+    return data;
+  }
+
+  decode(): unknown {
+    const byte = this.u8();
+    if (byte <= 0x7f) {
+      return byte;
+    } else if (byte <= 0x8f) {
+      return this.map(byte & 0x0f);
+    } else if (byte <= 0x9f) {
+      return this.array(byte & 0x0f);
+    } else if (byte <= 0xbf) {
+      return this.str(byte & 0x1f);
+    } else if (byte >= 0xe0) {
+      return byte - 0x100;
+    }
+    switch (byte) {
+      case 0xc0:
+        return null;
+      case 0xc2:
+        return false;
+      case 0xc3:
+        return true;
+      case 0xc4:
+        return this.bin(this.u8());
+      case 0xc5:
+        return this.bin(this.u16());
+      case 0xc6:
+        return this.bin(this.u32());
+      case 0xc7:
+        return this.ext(this.u8());
+      case 0xc8:
+        return this.ext(this.u16());
+      case 0xc9:
+        return this.ext(this.u32());
+      case 0xca:
+        return this.view.getFloat32(this.advance(4));
+      case 0xcb:
+        return this.view.getFloat64(this.advance(8));
+      case 0xcc:
+        return this.u8();
+      case 0xcd:
+        return this.u16();
+      case 0xce:
+        return this.u32();
+      case 0xcf:
+        return Number(this.view.getBigUint64(this.advance(8)));
+      case 0xd0:
+        return this.view.getInt8(this.advance(1));
+      case 0xd1:
+        return this.view.getInt16(this.advance(2));
+      case 0xd2:
+        return this.view.getInt32(this.advance(4));
+      case 0xd3:
+        return Number(this.view.getBigInt64(this.advance(8)));
+      case 0xd4:
+        return this.ext(1);
+      case 0xd5:
+        return this.ext(2);
+      case 0xd6:
+        return this.ext(4);
+      case 0xd7:
+        return this.ext(8);
+      case 0xd8:
+        return this.ext(16);
+      case 0xd9:
+        return this.str(this.u8());
+      case 0xda:
+        return this.str(this.u16());
+      case 0xdb:
+        return this.str(this.u32());
+      case 0xdc:
+        return this.array(this.u16());
+      case 0xdd:
+        return this.array(this.u32());
+      case 0xde:
+        return this.map(this.u16());
+      case 0xdf:
+        return this.map(this.u32());
+    }
+    throw new Error(`Invalid MessagePack type 0x${byte.toString(16)}`);
+  }
+}
+
+export function decode(buffer: ArrayBuffer): unknown {
+  return new Decoder(buffer).decode();
+}
+
+type Steps = Record<number, { value: number | null }>;
+
+function addSeries(steps: Steps, [stepArr, values]: Series): Steps {
+  for (let i = 0; i < stepArr.length; i++) {
+    // NaN (or a logged None) is null, the same as in the JSON data, whereas
+    // steps without a value are never part of a series.
+    const value = values[i];
+    steps[stepArr[i]] = { value: Number.isNaN(value) ? null : value };
+  }
+  return steps;
+}
+
+// The steps of the scalars are sent as a series of typed arrays, which is
+// turned back into the same structure as the JSON data.
+function expandScalars(scalars: unknown): unknown {
+  if (scalars === null || typeof scalars !== "object") {
+    return scalars;
+  }
+  const expanded: Record<string, unknown> = {};
+  for (const [category, categoryData] of Object.entries(scalars)) {
+    if (categoryData === null || typeof categoryData !== "object") {
+      expanded[category] = categoryData;
+      continue;
+    }
+    const { series, ...rest } = categoryData as { series?: Series };
+    expanded[category] =
+      series === undefined ? rest : { ...rest, steps: addSeries({}, series) };
+  }
+  return expanded;
+}
+
+function expandExperiment(data: unknown): Data {
+  const d = { ...(data as Record<string, unknown>) };
+  if (d.scalars !== undefined) {
+    d.scalars = expandScalars(d.scalars);
+  }
+  return d as Data;
+}
+
+// Expands the value set at the path, which is encoded in the same way as the
+// whole data.
+function expandAt(path: Path, value: unknown): unknown {
+  if (path.length === 1) {
+    return expandExperiment(value);
+  } else if (path.length === 2 && path[1] === "scalars") {
+    return expandScalars(value);
+  } else if (path.length === 3 && path[1] === "scalars") {
+    return (expandScalars({ category: value }) as { category: unknown })
+      .category;
+  }
+  return value;
+}
+
+function expandData(data: Record<string, unknown>): DataMap {
+  return new Map(
+    Object.entries(data).map(([name, d]) => [name, expandExperiment(d)])
+  );
+}
+
+type Tree = Record<string | number, unknown>;
+
+// Copies every object along the path, so that only the modified parts change
+// their reference, just like the data on the server.
+function copyPath(root: Tree, path: Path): Tree {
+  let node = root;
+  for (const key of path) {
+    const child = node[key];
+    const copy: Tree =
+      child !== null && typeof child === "object" ? { ...child } : {};
+    node[key] = copy;
+    node = copy;
+  }
+  return node;
+}
+
+function applyOp(data: DataMap, [op, path, value]: Op) {
+  const [name, ...rest] = path as [string, ...Path];
+  if (rest.length === 0) {
+    if (op === OP_DELETE) {
+      data.delete(name);
+    } else {
+      data.set(name, expandAt(path, value) as Data);
+    }
+    return;
+  }
+  const experiment: Tree = { ...(data.get(name) as Tree | undefined) };
+  data.set(name, experiment as Data);
+  const parent = copyPath(experiment, rest.slice(0, -1));
+  const key = rest[rest.length - 1];
+  if (op === OP_DELETE) {
+    delete parent[key];
+  } else if (op === OP_SET) {
+    parent[key] = expandAt(path, value);
+  } else if (op === OP_SERIES) {
+    const category = (parent[key] = { ...(parent[key] as Tree) });
+    category.steps = addSeries(
+      { ...(category.steps as Steps) },
+      value as Series
+    );
+  }
+}
+
+export function applyPatch(current: DataMap, ops: Array<Op>): DataMap {
+  const data = new Map(current);
+  for (const op of ops) {
+    applyOp(data, op);
+  }
+  return data;
+}
+
+type Handlers = {
+  onData: (data: DataMap) => void;
+  // Called when the connection fails before any data has been received, in
+  // which case it should fall back to the JSON API.
+  onFail: () => void;
+};
+
+// Same delay as the reconnection of the server-sent events.
+const RECONNECT_DELAY = 3000;
+
+// Subscribes to the data over the WebSocket, which sends the whole data once
+// and afterwards only the patches with the changes. It reconnects when the
+// connection is lost, receiving the whole data again.
+export function subscribe(query: string, handlers: Handlers): Subscription {
+  const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
+  const baseUrl = `${protocol}//${window.location.host}/ws`;
+  let currentQuery = query;
+  let socket: WebSocket | undefined = undefined;
+  let timeout: number | undefined = undefined;
+  let hasReceived = false;
+  let unsubscribed = false;
+  const connect = () => {
+    const connectedQuery = currentQuery;
+    const ws = new WebSocket(`${baseUrl}${connectedQuery}`);
+    ws.binaryType = "arraybuffer";
+    ws.addEventListener("open", () => {
+      // The query was changed while it was connecting.
+      if (currentQuery !== connectedQuery) {
+        ws.send(JSON.stringify({ type: "subscribe", query: currentQuery }));
+      }
+    });
+    let data: DataMap | undefined = undefined;
+    let lastId = 0;
+    ws.addEventListener("message", (e) => {
+      const message = decode((e as MessageEvent).data) as Message;
+      if (message.id <= lastId) {
+        return;
+      }
+      lastId = message.id;
+      if (message.type === "state") {
+        data = expandData(message.data);
+      } else if (message.type === "patch" && data !== undefined) {
+        data = applyPatch(data, message.ops);
+      } else {
+        return;
+      }
+      hasReceived = true;
+      handlers.onData(data);
+    });
+    ws.addEventListener("close", () => {
+      if (unsubscribed) {
+        return;
+      } else if (hasReceived) {
+        timeout = window.setTimeout(connect, RECONNECT_DELAY);
+      } else {
+        handlers.onFail();
+      }
+    });
+    socket = ws;
+  };
+  connect();
+  return {
+    update: (newQuery: string) => {
+      if (newQuery === currentQuery) {
+        return;
+      }
+      currentQuery = newQuery;
+      // The server sends the newly selected data as a new state. While it is
+      // not connected, the new query is sent once it is.
+      if (socket !== undefined && socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({ type: "subscribe", query: newQuery }));
+      }
+    },
+    close: () => {
+      unsubscribed = true;
+      window.clearTimeout(timeout);
+      if (socket !== undefined) {
+        socket.close();
+      }
+    },
+  };
+}
@@ -9,6 +9,16 @@ export function storeNames(names: Names) {
   localStorage.setItem("names", JSON.stringify(names));
 }
 
+// The inactive names are known before the data has been fetched, so that their
+// data doesn't need to be fetched at all.
+export function retrieveInactiveNames(): Array<string> {
+  const names: Names | null = JSON.parse(
+    // JSON.parse accepts null as input, but TypeScript doesn't.
+    localStorage.getItem("names") || "null"
+  );
+  return names ? names.inactive : [];
+}
+
 export function retrieveNames(nameList: Array<string>): Names {
   const names: Names | null = JSON.parse(
     // JSON.parse accepts null as input, but TypeScript doesn't.
@@ -0,0 +1,328 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import simplejson
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
+
+from .data import Selection, select_data
+
+# Separates the prefix of the upstream from the experiment name.
+PREFIX_SEPARATOR = ":"
+
+
+def prefix_name(prefix: str, name: str) -> str:
+    return "{}{}{}".format(prefix, PREFIX_SEPARATOR, name)
+
+
+def prefix_urls(value: Any, prefix: str) -> Any:
+    """
+    Prefixes the experiment names in the URLs of the API (/api/<kind>/<name>/...) and
+    the data (/data/<name>/...), which are part of the data sent by an upstream.
+    """
+    if isinstance(value, dict):
+        out = {}
+        for key, v in value.items():
+            if key == "url" and isinstance(v, str) and v.startswith("/api/"):
+                parts = v.split("/", 4)
+                if len(parts) == 5:
+                    parts[3] = prefix_name(prefix, parts[3])
+                    v = "/".join(parts)
+            elif key == "source" and isinstance(v, str) and v.startswith("/data/"):
+                parts = v.split("/", 3)
+                if len(parts) == 4:
+                    parts[2] = prefix_name(prefix, parts[2])
+                    v = "/".join(parts)
+            else:
+                v = prefix_urls(v, prefix)
+            out[key] = v
+        return out
+    elif isinstance(value, list):
+        return [prefix_urls(v, prefix) for v in value]
+    else:
+        return value
+
+
+def parse_steps(name_data: Dict) -> Dict:
+    """
+    Converts the steps of an experiment back to integers, since the keys are strings
+    in the JSON of the upstream, whereas the steps of the data are integers, e.g. they
+    are compared to the start and end of a selection.
+    """
+    out = {}
+    for kind, kind_data in name_data.items():
+        # The command has no categories.
+        if kind == "command" or not isinstance(kind_data, dict):
+            out[kind] = kind_data
+            continue
+        out[kind] = {
+            category: (
+                {
+                    **category_data,
+                    "steps": {
+                        int(step) if step.isdigit() else step: item
+                        for step, item in category_data["steps"].items()
+                    },
+                }
+                if isinstance(category_data, dict) and "steps" in category_data
+                else category_data
+            )
+            for category, category_data in kind_data.items()
+        }
+    return out
+
+
+def configure_http_client(max_clients: int = 32):
+    """
+    Configures the client for the requests to the upstreams. The curl client keeps the
+    connections alive and reuses them, whereas the simple client opens a new
+    connection for every request, hence curl is used if pycurl is installed, e.g. with
+    pip install lavd[aggregator]
+
+    Arguments:
+        max_clients (int):
+            Maximum number of concurrent requests.
+            [Default: 32]
+    """
+    try:
+        import pycurl  # noqa: F401 - unused import
+
+        AsyncHTTPClient.configure(
+            "tornado.curl_httpclient.CurlAsyncHTTPClient", max_clients=max_clients
+        )
+    except ImportError:
+        AsyncHTTPClient.configure(None, max_clients=max_clients)
+
+
+def parse_upstream(spec: str) -> Tuple[str, str]:
+    """
+    Parses the specification of an upstream, which is either just the URL or the
+    prefix and the URL separated by an equal sign, e.g. node1=http://node1:4343.
+    Without a prefix, the host (and port) is used as the prefix.
+
+    Returns:
+        prefix_and_url (Tuple[str, str]):
+            Prefix and URL of the upstream
+    """
+    prefix, sep, url = spec.partition("=")
+    if not sep:
+        url = spec
+        prefix = url.split("://", 1)[-1].split("/", 1)[0]
+    url = url.rstrip("/")
+    if "://" not in url:
+        url = "http://{}".format(url)
+    return prefix, url
+
+
+class ResponseCache:
+    """
+    LRU cache for the proxied responses, bounded by the total size of the bodies.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl: float = 60.0):
+        """
+        Arguments:
+            max_bytes (int):
+                Maximum number of bytes of all cached bodies combined.
+                [Default: 256 MiB]
+            ttl (float):
+                Number of seconds a response is valid.
+                [Default: 60.0]
+        """
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.entries: OrderedDict[str, Tuple[float, Dict[str, str], bytes]] = (
+            OrderedDict()
+        )
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, str], bytes]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        created, headers, body = entry
+        if time.monotonic() - created > self.ttl:
+            self.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return headers, body
+
+    def set(self, key: str, headers: Dict[str, str], body: bytes):
+        # Responses that would take up a large part of the cache are not worth it.
+        if len(body) > self.max_bytes // 8:
+            return
+        self.pop(key)
+        self.entries[key] = (time.monotonic(), headers, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, _, oldest_body) = self.entries.popitem(last=False)
+            self.size -= len(oldest_body)
+
+    def pop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[2])
+
+    def invalidate(self, prefixes: Iterable[str]):
+        prefixes = tuple(prefixes)
+        if len(prefixes) == 0:
+            return
+        for key in [k for k in self.entries if k.startswith(prefixes)]:
+            self.pop(key)
+
+
+class Upstream:
+    """
+    A lavd server whose data is aggregated. The data is kept up to date by listening
+    to its events.
+
+    Each event contains all the data, but only the experiments that changed are
+    prefixed again, the others are kept as they are. They therefore keep their
+    identity, just like in the copy-on-write data of a server, so that they are not
+    serialised again when they are sent to the clients.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        url: str,
+        on_change: Callable[["Upstream", Set[str]], None],
+        retry_interval: float = 5.0,
+    ):
+        """
+        Arguments:
+            prefix (str):
+                Prefix that is added to the experiment names of this upstream
+            url (str):
+                Base URL of the upstream lavd server
+            on_change (Callable[[Upstream, Set[str]], None]):
+                Called whenever the data of the upstream changed, with the names of
+                the experiments (without the prefix) that changed
+            retry_interval (float):
+                Number of seconds to wait before reconnecting after the connection to
+                the upstream was lost.
+                [Default: 5.0]
+        """
+        super().__init__()
+        self.prefix = prefix
+        self.url = url
+        self.on_change = on_change
+        self.retry_interval = retry_interval
+        self.truncated: Dict[str, Any] = {}
+        # Data as it was received, to find the experiments that changed.
+        self.received: Dict[str, Any] = {}
+        self.buffer = bytearray()
+        # Offset up to which the buffer has been searched for the end of an event,
+        # since each event contains all the data, which arrives in many chunks.
+        self.scanned = 0
+        # The event stream is kept open indefinitely, therefore it uses its own client
+        # to not occupy one of the pooled connections of the shared client.
+        self.events_client = AsyncHTTPClient(force_instance=True)
+
+    def get_url(self, path: str) -> str:
+        return "{}/{}".format(self.url, path.lstrip("/"))
+
+    def update(self, truncated: Dict[str, Any]):
+        changed = set(self.received.keys() - truncated.keys())
+        prefixed = {}
+        for name, value in truncated.items():
+            prefixed_name = prefix_name(self.prefix, name)
+            if name in self.received and self.received[name] == value:
+                prefixed[prefixed_name] = self.truncated[prefixed_name]
+            else:
+                prefixed[prefixed_name] = parse_steps(prefix_urls(value, self.prefix))
+                changed.add(name)
+        self.received = truncated
+        self.truncated = prefixed
+        if len(changed) > 0:
+            self.on_change(self, changed)
+
+    async def fetch_all(self):
+        response = await AsyncHTTPClient().fetch(self.get_url("/api/all"))
+        self.update(simplejson.loads(response.body))
+
+    def next_event(self) -> Optional[bytearray]:
+        # Events are separated by an empty line, anything after the last one is an
+        # incomplete event. The separator may be split across two chunks, hence the
+        # last byte is searched again.
+        end = self.buffer.find(b"\n\n", max(self.scanned - 1, 0))
+        if end < 0:
+            self.scanned = len(self.buffer)
+            return None
+        event = self.buffer[:end]
+        del self.buffer[: end + 2]
+        self.scanned = 0
+        return event
+
+    def on_events_chunk(self, chunk: bytes):
+        self.buffer += chunk
+        while True:
+            event = self.next_event()
+            if event is None:
+                break
+            lines = event.split(b"\n")
+            # Only the data is used, other events, such as the subscription, are
+            # ignored.
+            if any(
+                line.startswith(b"event:") and line[len(b"event:") :].strip() != b"data"
+                for line in lines
+            ):
+                continue
+            data_lines = [
+                line[len(b"data:") :].strip()
+                for line in lines
+                if line.startswith(b"data:")
+            ]
+            if len(data_lines) > 0:
+                self.update(simplejson.loads(b"\n".join(data_lines)))
+
+    async def listen(self):
+        while True:
+            try:
+                await self.fetch_all()
+                self.buffer = bytearray()
+                self.scanned = 0
+                # A request timeout of 0 disables the timeout, since the events are
+                # streamed as long as the connection is open.
+                await self.events_client.fetch(
+                    HTTPRequest(
+                        self.get_url("/events"),
+                        streaming_callback=self.on_events_chunk,
+                        request_timeout=0,
+                    )
+                )
+            except (HTTPClientError, OSError, ValueError) as e:
+                print(
+                    "⚠️ Lost connection to {} ({}): {}".format(self.prefix, self.url, e)
+                )
+            await asyncio.sleep(self.retry_interval)
+
+
+class AggregatedData:
+    """
+    Data of all upstreams combined, which can be used in place of Data for the
+    requests that only need the truncated data (/api/all and /events).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.truncated = {}
+        self.version = 0
+
+    # The items are never available here, they are requested from the upstreams.
+    def get(
+        self, kind: str, name: str, step: Union[str, int], category: str
+    ) -> Optional[Any]:
+        return None
+
+    def select(self, selection: Selection) -> Dict:
+        return select_data(self.truncated, selection)
+
+    def merge(self, upstreams: List[Upstream]):
+        truncated = {}
+        for upstream in upstreams:
+            truncated.update(upstream.truncated)
+        self.truncated = truncated
+        self.version += 1
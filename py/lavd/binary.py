@@ -0,0 +1,306 @@
+import struct
+from typing import Any, Dict, List, Optional
+
+try:
+    import msgpack
+
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+# Extension types of MessagePack for the typed arrays, which are little-endian.
+EXT_FLOAT64_ARRAY = 1
+EXT_UINT32_ARRAY = 2
+
+# Operations of the patches:
+#   [OP_SET, path, value]: Sets the value at the path
+#   [OP_DELETE, path]: Deletes the value at the path
+#   [OP_SERIES, path, series]: Sets the steps of the scalar series at the path (of the
+#       category), the other steps are kept.
+OP_SET = 0
+OP_DELETE = 1
+OP_SERIES = 2
+
+MAX_UINT32 = 2**32 - 1
+MISSING = object()
+
+
+class TypedArray:
+    """
+    Array of numbers, which is encoded as its raw bytes in a MessagePack extension,
+    so that the client can use it as a typed array (e.g. Float64Array) directly.
+    """
+
+    __slots__ = ["code", "data"]
+
+    def __init__(self, code: int, data: bytes):
+        self.code = code
+        self.data = data
+
+    @classmethod
+    def float64(cls, values: List[float]) -> "TypedArray":
+        return cls(EXT_FLOAT64_ARRAY, struct.pack("<{}d".format(len(values)), *values))
+
+    @classmethod
+    def steps(cls, steps: List[int]) -> "TypedArray":
+        if len(steps) == 0 or (steps[0] >= 0 and steps[-1] <= MAX_UINT32):
+            return cls(EXT_UINT32_ARRAY, struct.pack("<{}I".format(len(steps)), *steps))
+        # Steps beyond 32 bits are still exact as 64-bit floats (up to 2^53).
+        return cls.float64([float(step) for step in steps])
+
+
+def to_series(steps: Dict) -> Optional[List[TypedArray]]:
+    """
+    Converts the steps of a scalar into a series of two typed arrays, the steps and
+    their values, where values that are None or NaN are NaN, just like they are both
+    null in the JSON.
+
+    Returns:
+        series (List[TypedArray], optional):
+            Steps and values of the series, or None if it contains anything other than
+            a value, which is kept as it is. Steps without a value are also kept as
+            they are, since they would be indistinguishable from NaN otherwise.
+    """
+    sorted_steps = sorted(steps)
+    values = []
+    for step in sorted_steps:
+        item = steps[step]
+        if not isinstance(step, int) or not isinstance(item, dict):
+            return None
+        if len(item) != 1 or "value" not in item:
+            return None
+        value = item.get("value")
+        if value is None:
+            values.append(float("nan"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values.append(float(value))
+        else:
+            return None
+    return [TypedArray.steps(sorted_steps), TypedArray.float64(values)]
+
+
+def encode_category(category_data: Dict) -> Dict:
+    steps = category_data.get("steps")
+    if not steps:
+        return category_data
+    series = to_series(steps)
+    if series is None:
+        return category_data
+    encoded = {key: value for key, value in category_data.items() if key != "steps"}
+    encoded["series"] = series
+    return encoded
+
+
+def encode_kind(kind: str, kind_data: Any) -> Any:
+    # Only the steps of the scalars are encoded as series, everything else is sent as
+    # it is.
+    if kind != "scalars" or not isinstance(kind_data, dict):
+        return kind_data
+    return {
+        category: encode_category(category_data)
+        for category, category_data in kind_data.items()
+    }
+
+
+def encode_experiment(name_data: Dict) -> Dict:
+    return {kind: encode_kind(kind, kind_data) for kind, kind_data in name_data.items()}
+
+
+def encode_data(data: Dict) -> Dict:
+    """
+    Encodes the (truncated) data for the binary transport, where the steps of the
+    scalars are series of typed arrays instead of a dictionary per step.
+    """
+    return {name: encode_experiment(name_data) for name, name_data in data.items()}
+
+
+def encode_at(path: List, value: Any) -> Any:
+    if len(path) == 1:
+        return encode_experiment(value)
+    elif len(path) == 2:
+        return encode_kind(path[1], value)
+    elif len(path) == 3 and path[1] == "scalars":
+        return encode_category(value)
+    return value
+
+
+def can_descend(path: List) -> bool:
+    # Descends down to the steps, whose items are always replaced as a whole, except
+    # for the command, which is an item itself.
+    return len(path) <= 4 and not (len(path) >= 2 and path[1] == "command")
+
+
+def diff_steps(old_steps: Dict, steps: Dict, path: List, ops: List[List]):
+    for step in old_steps:
+        if step not in steps:
+            ops.append([OP_DELETE, [*path, step]])
+    changed = {
+        step: item for step, item in steps.items() if item is not old_steps.get(step)
+    }
+    if len(changed) == 0:
+        return
+    series = to_series(changed) if path[1] == "scalars" else None
+    if series is None:
+        for step, item in changed.items():
+            ops.append([OP_SET, [*path, step], item])
+    else:
+        # The path of the series is the category rather than its steps.
+        ops.append([OP_SERIES, path[:-1], series])
+
+
+def diff_dict(old: Dict, new: Dict, path: List, ops: List[List]):
+    for key in old:
+        if key not in new:
+            ops.append([OP_DELETE, [*path, key]])
+    for key, value in new.items():
+        old_value = old.get(key, MISSING)
+        if value is old_value:
+            continue
+        child_path = [*path, key]
+        if (
+            isinstance(value, dict)
+            and isinstance(old_value, dict)
+            and can_descend(child_path)
+        ):
+            if len(child_path) == 4 and key == "steps":
+                diff_steps(old_value, value, child_path, ops)
+            else:
+                diff_dict(old_value, value, child_path, ops)
+        else:
+            ops.append([OP_SET, child_path, encode_at(child_path, value)])
+
+
+def diff_data(old: Dict, new: Dict) -> List[List]:
+    """
+    Computes the operations that turn the old version of the (truncated) data into the
+    new one.
+
+    Since the data is copy-on-write, every dictionary that has not been modified is
+    still the same object, hence only the parts that actually changed need to be
+    compared, and only they are part of the patch, e.g. just the newly logged steps.
+
+    Arguments:
+        old (dict):
+            Data that the client has
+        new (dict):
+            Current data
+
+    Returns:
+        ops (List[list]):
+            Operations of the patch, see OP_SET, OP_DELETE and OP_SERIES.
+    """
+    ops: List[List] = []
+    if old is not new:
+        diff_dict(old, new, [], ops)
+    return ops
+
+
+class Packer:
+    """
+    MessagePack encoder, which is only used if the msgpack package is not installed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+
+    def pack_length(self, length: int, fix: int, fix_max: int, codes: List[int]):
+        if length <= fix_max:
+            self.chunks.append(struct.pack("B", fix | length))
+        elif length <= 0xFFFF:
+            self.chunks.append(struct.pack(">BH", codes[0], length))
+        else:
+            self.chunks.append(struct.pack(">BI", codes[1], length))
+
+    def pack_int(self, value: int):
+        if 0 <= value <= 0x7F:
+            self.chunks.append(struct.pack("B", value))
+        elif -32 <= value < 0:
+            self.chunks.append(struct.pack("b", value))
+        elif 0 <= value <= 0xFF:
+            self.chunks.append(struct.pack(">BB", 0xCC, value))
+        elif 0 <= value <= 0xFFFF:
+            self.chunks.append(struct.pack(">BH", 0xCD, value))
+        elif 0 <= value <= 0xFFFFFFFF:
+            self.chunks.append(struct.pack(">BI", 0xCE, value))
+        elif 0 <= value <= 0xFFFFFFFFFFFFFFFF:
+            self.chunks.append(struct.pack(">BQ", 0xCF, value))
+        elif -(2**7) <= value < 0:
+            self.chunks.append(struct.pack(">Bb", 0xD0, value))
+        elif -(2**15) <= value < 0:
+            self.chunks.append(struct.pack(">Bh", 0xD1, value))
+        elif -(2**31) <= value < 0:
+            self.chunks.append(struct.pack(">Bi", 0xD2, value))
+        elif -(2**63) <= value < 0:
+            self.chunks.append(struct.pack(">Bq", 0xD3, value))
+        else:
+            # Integers beyond 64 bits are not supported by MessagePack.
+            self.chunks.append(struct.pack(">Bd", 0xCB, float(value)))
+
+    def pack(self, obj: Any):
+        if obj is None:
+            self.chunks.append(b"\xc0")
+        elif obj is True:
+            self.chunks.append(b"\xc3")
+        elif obj is False:
+            self.chunks.append(b"\xc2")
+        elif isinstance(obj, int):
+            self.pack_int(obj)
+        elif isinstance(obj, float):
+            self.chunks.append(struct.pack(">Bd", 0xCB, obj))
+        elif isinstance(obj, str):
+            encoded = obj.encode("utf-8")
+            if len(encoded) <= 31:
+                self.chunks.append(struct.pack("B", 0xA0 | len(encoded)))
+            elif len(encoded) <= 0xFF:
+                self.chunks.append(struct.pack(">BB", 0xD9, len(encoded)))
+            else:
+                self.pack_length(len(encoded), 0, -1, [0xDA, 0xDB])
+            self.chunks.append(encoded)
+        elif isinstance(obj, (bytes, bytearray)):
+            if len(obj) <= 0xFF:
+                self.chunks.append(struct.pack(">BB", 0xC4, len(obj)))
+            else:
+                self.pack_length(len(obj), 0, -1, [0xC5, 0xC6])
+            self.chunks.append(bytes(obj))
+        elif isinstance(obj, TypedArray):
+            length = len(obj.data)
+            if length <= 0xFF:
+                self.chunks.append(struct.pack(">BBb", 0xC7, length, obj.code))
+            elif length <= 0xFFFF:
+                self.chunks.append(struct.pack(">BHb", 0xC8, length, obj.code))
+            else:
+                self.chunks.append(struct.pack(">BIb", 0xC9, length, obj.code))
+            self.chunks.append(obj.data)
+        elif isinstance(obj, (list, tuple)):
+            self.pack_length(len(obj), 0x90, 15, [0xDC, 0xDD])
+            for value in obj:
+                self.pack(value)
+        elif isinstance(obj, dict):
+            self.pack_length(len(obj), 0x80, 15, [0xDE, 0xDF])
+            for key, value in obj.items():
+                self.pack(key)
+                self.pack(value)
+        else:
+            raise TypeError("Cannot encode {} as MessagePack".format(type(obj)))
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+def to_ext(obj: Any) -> Any:
+    if isinstance(obj, TypedArray):
+        return msgpack.ExtType(obj.code, obj.data)
+    raise TypeError("Cannot encode {} as MessagePack".format(type(obj)))
+
+
+def pack(obj: Any) -> bytes:
+    """
+    Encodes the object as MessagePack, with the typed arrays as extensions.
+    Uses the msgpack package if it is installed, since it is considerably faster.
+    """
+    if HAS_MSGPACK:
+        return msgpack.packb(obj, default=to_ext, use_bin_type=True)
+    packer = Packer()
+    packer.pack(obj)
+    return packer.getvalue()
@@ -0,0 +1,223 @@
+import functools
+import secrets
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import simplejson
+import tornado.gen
+import tornado.ioloop
+from tornado import locks
+
+from .data import Selection, is_unchanged
+
+
+def selection_key(selection: Selection) -> Tuple:
+    # Subscribers with the same selection share their updates, but the lists and the
+    # pattern cannot be used as a key directly.
+    return tuple(
+        tuple(value) if isinstance(value, list) else getattr(value, "pattern", value)
+        for value in selection
+    )
+
+
+class Update:
+    """
+    Selected data of a change, which is shared by all subscribers with the same
+    selection, hence it is serialised only once, when the first of them needs it.
+    """
+
+    __slots__ = ["data", "serialiser", "_json"]
+
+    def __init__(self, data: Dict, serialiser: Callable[[Dict], bytes]):
+        self.data = data
+        self.serialiser = serialiser
+        self._json: Optional[bytes] = None
+
+    @property
+    def json(self) -> bytes:
+        if self._json is None:
+            self._json = self.serialiser(self.data)
+        return self._json
+
+
+class Subscriber:
+    """
+    Subscription of a connection to the changes of the data.
+
+    Its send queue holds at most one update, which is replaced by any newer one, since
+    each update contains the whole selected data. A client that cannot keep up
+    therefore only receives the latest state, instead of every intermediate one
+    piling up in its buffer.
+    """
+
+    def __init__(self, selection: Selection):
+        self.id = secrets.token_urlsafe(16)
+        self.selection = selection
+        self.pending: Optional[Update] = None
+        # Data of the most recent update (or what the client already has), to skip the
+        # changes that do not affect the selected data.
+        self.last: Optional[Dict] = None
+        self.available = locks.Event()
+        self.closed = False
+        # Number of updates that were replaced before they could be sent.
+        self.num_coalesced = 0
+
+    def put(self, update: Update):
+        if self.pending is not None:
+            self.num_coalesced += 1
+        self.pending = update
+        self.last = update.data
+        self.available.set()
+
+    async def get(self) -> Optional[Update]:
+        """
+        Waits for the next update.
+
+        Returns:
+            update (Update, optional):
+                The latest update, or None if the subscriber has been closed.
+        """
+        while self.pending is None and not self.closed:
+            self.available.clear()
+            await self.available.wait()
+        if self.closed:
+            return None
+        update = self.pending
+        self.pending = None
+        return update
+
+    def close(self):
+        self.closed = True
+        self.available.set()
+
+
+class BroadcastHub:
+    """
+    Publishes the changes of the data to all subscribers.
+
+    It is the only one waiting for the file watcher (or snapshots) to notify about
+    changes, then selects the data once per distinct selection and serialises it at
+    most once, which is shared by all subscribers with that selection. Additionally,
+    the JSON of an experiment is reused as long as its data does not change, so a
+    change only serialises the experiments that actually changed.
+    """
+
+    def __init__(self, get_data: Callable[[], Any], update_lock: locks.Condition):
+        """
+        Arguments:
+            get_data (Callable[[], Data]):
+                Function to get the current data, since it may be replaced, e.g. by
+                the snapshots.
+            update_lock (locks.Condition):
+                Condition that is notified when the data changed
+        """
+        super().__init__()
+        self.get_data = get_data
+        self.update_lock = update_lock
+        self.subscribers: Dict[str, Subscriber] = {}
+        # JSON of the experiments per selection, with the data it was created from.
+        # Each selection has its own entry, otherwise subscribers with different
+        # selections of the same experiment would keep replacing each other's.
+        self.experiment_cache: Dict[Tuple[str, Tuple], Tuple[Dict, bytes]] = {}
+        self.is_running = False
+
+    def subscribe(self, selection: Selection) -> Subscriber:
+        """
+        Adds a subscriber, which receives an update whenever the selected data changed,
+        starting from the current data.
+        """
+        if not self.is_running:
+            self.is_running = True
+            tornado.ioloop.IOLoop.current().spawn_callback(self.run)
+        subscriber = Subscriber(selection)
+        subscriber.last = self.get_data().select(selection)
+        self.subscribers[subscriber.id] = subscriber
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.close()
+        self.subscribers.pop(subscriber.id, None)
+
+    def resubscribe(self, subscriber: Subscriber, selection: Selection):
+        """
+        Changes the selection of the subscriber, which immediately receives the newly
+        selected data.
+        """
+        subscriber.selection = selection
+        subscriber.put(self.create_update(self.get_data(), selection))
+
+    def create_update(self, data: Any, selection: Selection) -> Update:
+        return Update(
+            data.select(selection),
+            functools.partial(self.serialise, selection_key(selection)),
+        )
+
+    def serialise_experiment(self, key: Tuple, name: str, name_data: Dict) -> bytes:
+        if len(name_data) == 0:
+            return b"{}"
+        cache_key = (name, key)
+        cached = self.experiment_cache.get(cache_key)
+        # Selecting part of an experiment creates new dictionaries every time, but
+        # whatever they contain is still shared with the data.
+        if cached is not None and is_unchanged(cached[0], name_data):
+            return cached[1]
+        # NaN and Infinity are not valid JSON, they are null just like in the API.
+        encoded = simplejson.dumps(name_data, ignore_nan=True).encode("utf-8")
+        self.experiment_cache[cache_key] = (name_data, encoded)
+        return encoded
+
+    def serialise(self, key: Tuple, data: Dict) -> bytes:
+        # Same as simplejson.dumps(data, ignore_nan=True), but assembled from the JSON
+        # of each experiment.
+        return b"".join(
+            [
+                b"{",
+                b", ".join(
+                    simplejson.dumps(name).encode("utf-8")
+                    + b": "
+                    + self.serialise_experiment(key, name, name_data)
+                    for name, name_data in data.items()
+                ),
+                b"}",
+            ]
+        )
+
+    def broadcast(self):
+        data = self.get_data()
+        updates: Dict[Tuple, Update] = {}
+        for subscriber in list(self.subscribers.values()):
+            key = selection_key(subscriber.selection)
+            update = updates.get(key)
+            if update is None:
+                update = self.create_update(data, subscriber.selection)
+                updates[key] = update
+            # Changes to experiments (or parts of them) that were not selected are
+            # not sent.
+            if subscriber.last is not None and is_unchanged(
+                subscriber.last, update.data
+            ):
+                subscriber.last = update.data
+                continue
+            subscriber.put(update)
+        # Experiments that no longer exist, and selections that no subscriber has
+        # anymore, do not need to be kept.
+        for name, key in list(self.experiment_cache.keys()):
+            if name not in data.truncated or key not in updates:
+                del self.experiment_cache[(name, key)]
+
+    async def run(self):
+        wait_future = self.update_lock.wait()
+        while True:
+            # This is extremely silly. What would be done is that the wait() future is
+            # awaited and when it's resolved, the updates are sent and the loop starts
+            # over (waits again). But for some unknown reason it just doesn't resolve
+            # at all, even though notify_all() is called and all waiters are
+            # "finished".
+            # To work around that silliness, the loop waits for 1 sec and checks if the
+            # future is resolved and if that's the case the updates are sent (since
+            # the file watcher has notified that a change happened) and it begins with
+            # a new future.
+            # NOTE: That problem did not occur with debug=True, but oh well.
+            await tornado.gen.sleep(1)
+            if wait_future.done():
+                wait_future = self.update_lock.wait()
+                self.broadcast()
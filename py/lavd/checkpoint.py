@@ -0,0 +1,545 @@
+import copy
+import hashlib
+import io
+import math
+import os
+import pickle
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Dict, List, Optional, Set, Tuple, Union
+
+from .file_types import BLOBS_DIR, MANIFEST_EXTENSION
+
+try:
+    import torch
+
+    HAS_TORCH = True
+except ImportError:
+    HAS_TORCH = False
+
+
+def save_atomic(obj: Any, path: Union[str, os.PathLike]):
+    """
+    Saves the object with `torch.save` to a temporary file, which is then renamed, so
+    that the checkpoint is either complete or does not exist at all, even if the
+    process is killed while it is being saved.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(".{}.tmp".format(path.name))
+    try:
+        torch.save(obj, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def copy_to_cpu(
+    obj: Any, buffers: Dict[str, "torch.Tensor"], events: Dict, key: str = ""
+) -> Any:
+    """
+    Copies all tensors within the object (nested dicts, lists and tuples) to CPU
+    buffers, which are reused when they have the same shape and type as before.
+
+    The buffers are in pinned memory for tensors on the GPU, which makes the copies
+    asynchronous, therefore an event is recorded for each device that was involved and
+    needs to be synchronised before the buffers can be used.
+    """
+    if isinstance(obj, torch.Tensor):
+        tensor = obj.detach()
+        # Sparse tensors etc. are just copied.
+        if tensor.layout != torch.strided:
+            return tensor.to("cpu", copy=True)
+        is_cuda = tensor.device.type == "cuda"
+        buffer = buffers.get(key)
+        if (
+            buffer is None
+            or buffer.shape != tensor.shape
+            or buffer.dtype != tensor.dtype
+            or buffer.is_pinned() != is_cuda
+        ):
+            buffer = torch.empty(
+                tensor.shape, dtype=tensor.dtype, device="cpu", pin_memory=is_cuda
+            )
+            buffers[key] = buffer
+        buffer.copy_(tensor, non_blocking=is_cuda)
+        if is_cuda and tensor.device not in events:
+            events[tensor.device] = None
+        return buffer
+    elif isinstance(obj, dict):
+        # A shallow copy keeps the type and attributes of the dict, such as the
+        # metadata of a state dict.
+        out = copy.copy(obj)
+        for k, v in obj.items():
+            out[k] = copy_to_cpu(v, buffers, events, key="{}.{}".format(key, k))
+        return out
+    elif isinstance(obj, (list, tuple)) and type(obj) in (list, tuple):
+        return type(obj)(
+            copy_to_cpu(v, buffers, events, key="{}.{}".format(key, i))
+            for i, v in enumerate(obj)
+        )
+    else:
+        return obj
+
+
+def snapshot_to_cpu(obj: Any, buffers: Dict[str, "torch.Tensor"]) -> Tuple[Any, List]:
+    """
+    Creates a snapshot of the object with all tensors copied to the CPU, without
+    waiting for the copies from the GPU to finish.
+
+    Returns:
+        snapshot_and_events (Tuple[Any, List[torch.cuda.Event]]):
+            The snapshot and the events that need to be synchronised before the
+            snapshot can be used.
+    """
+    devices: Dict = {}
+    snapshot = copy_to_cpu(obj, buffers, devices)
+    events = []
+    for device in devices:
+        event = torch.cuda.Event()
+        event.record(torch.cuda.current_stream(device))
+        events.append(event)
+    return snapshot, events
+
+
+class BlobPickler(pickle.Pickler):
+    """
+    Pickler that stores the tensors as blobs instead of including them in the pickle.
+    """
+
+    def __init__(self, file: IO[bytes], store: "BlobStore"):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.store = store
+        self.digests: List[str] = []
+
+    def persistent_id(self, obj: Any) -> Optional[Tuple]:
+        # Only regular dense tensors are stored as blobs, everything else is pickled
+        # as usual.
+        if (
+            not isinstance(obj, torch.Tensor)
+            or obj.layout != torch.strided
+            or obj.is_quantized
+        ):
+            return None
+        tensor = obj.detach().cpu().contiguous()
+        digest = self.store.put(tensor)
+        self.digests.append(digest)
+        return (
+            "blob",
+            digest,
+            str(tensor.dtype).replace("torch.", ""),
+            tuple(tensor.shape),
+            isinstance(obj, torch.nn.Parameter),
+        )
+
+
+class BlobUnpickler(pickle.Unpickler):
+    def __init__(self, file: IO[bytes], store: "BlobStore"):
+        super().__init__(file)
+        self.store = store
+
+    def persistent_load(self, pid: Tuple) -> Any:
+        kind, digest, dtype, shape, is_param = pid
+        if kind != "blob":
+            raise pickle.UnpicklingError("Unknown persistent id: {}".format(kind))
+        tensor = self.store.get(digest, getattr(torch, dtype), shape)
+        return torch.nn.Parameter(tensor) if is_param else tensor
+
+
+class BlobStore:
+    """
+    Content-addressed storage of tensors, where each tensor is stored as a blob named
+    after the hash of its content. Identical tensors, e.g. the frozen parameters of
+    a model, are therefore only stored once, no matter how many checkpoints contain
+    them.
+
+    A checkpoint is a manifest, which is the pickled object with the tensors replaced
+    by references to their blobs. The manifest starts with the list of the referenced
+    blobs, so that they can be determined without loading the whole object.
+    """
+
+    def __init__(self, root: Union[str, os.PathLike]):
+        """
+        Arguments:
+            root (str | os.PathLike):
+                Root directory of the manifests (e.g. the experiment), where the blobs
+                are stored in the .blobs directory.
+        """
+        super().__init__()
+        self.root = Path(root)
+        self.blob_dir = self.root / BLOBS_DIR
+
+    def get_blob_path(self, digest: str) -> Path:
+        # Nested by the first two characters, to avoid having too many files in one
+        # directory.
+        return self.blob_dir / digest[:2] / digest
+
+    def put(self, tensor: "torch.Tensor") -> str:
+        # The bytes of the tensor, without any copy, since it is contiguous.
+        data = tensor.reshape(-1).view(torch.uint8).numpy()
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.get_blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(".{}.tmp".format(path.name))
+            with open(tmp_path, "wb") as fd:
+                fd.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str, dtype: "torch.dtype", shape: Tuple[int, ...]):
+        numel = math.prod(shape)
+        if numel == 0:
+            return torch.empty(shape, dtype=dtype)
+        # The blob is memory-mapped privately, hence it is only read once it's
+        # accessed and modifying the tensor does not modify the blob.
+        tensor = torch.from_file(
+            os.fspath(self.get_blob_path(digest)),
+            shared=False,
+            size=numel,
+            dtype=dtype,
+        )
+        return tensor.view(shape)
+
+    def save(self, obj: Any, path: Union[str, os.PathLike]):
+        """
+        Saves the object as a manifest, with all its tensors stored as blobs.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(".{}.tmp".format(path.name))
+        try:
+            with open(tmp_path, "wb") as fd:
+                # The object is pickled into memory first, because the list of blobs
+                # is only known afterwards, but needs to be at the start.
+                with io.BytesIO() as buffer:
+                    pickler = BlobPickler(buffer, self)
+                    pickler.dump(obj)
+                    pickle.dump(pickler.digests, fd, protocol=pickle.HIGHEST_PROTOCOL)
+                    fd.write(buffer.getbuffer())
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def load(self, path: Union[str, os.PathLike]) -> Any:
+        with open(path, "rb") as fd:
+            # Skip the list of blobs
+            pickle.load(fd)
+            return BlobUnpickler(fd, self).load()
+
+    def list_manifests(self) -> List[Path]:
+        manifests = []
+        for dir, dir_names, file_names in os.walk(self.root):
+            if dir == os.fspath(self.root):
+                dir_names[:] = [d for d in dir_names if d != BLOBS_DIR]
+            for file_name in file_names:
+                if file_name.endswith(MANIFEST_EXTENSION):
+                    manifests.append(Path(dir, file_name))
+        return manifests
+
+    def collect_garbage(self) -> int:
+        """
+        Removes all blobs that are no longer referenced by any manifest.
+
+        Returns:
+            num_removed (int):
+                Number of blobs that have been removed.
+        """
+        referenced = set()
+        for manifest in self.list_manifests():
+            try:
+                with open(manifest, "rb") as fd:
+                    referenced.update(pickle.load(fd))
+            except (OSError, EOFError, pickle.UnpicklingError):
+                # A manifest that cannot be read might be in the middle of being
+                # written, so nothing is removed to be safe.
+                return 0
+        num_removed = 0
+        if not self.blob_dir.is_dir():
+            return num_removed
+        for dir, _, file_names in os.walk(self.blob_dir):
+            for file_name in file_names:
+                # Temporary files of blobs being written are not touched.
+                if file_name.startswith(".") or file_name in referenced:
+                    continue
+                Path(dir, file_name).unlink(missing_ok=True)
+                num_removed += 1
+        return num_removed
+
+
+def load_checkpoint(
+    path: Union[str, os.PathLike], blob_root: Optional[Union[str, os.PathLike]] = None
+) -> Any:
+    """
+    Loads a checkpoint that was saved with dedup=True, i.e. a manifest of the blob
+    store. The tensors are memory-mapped from their blobs, so they are only read once
+    they are accessed, e.g. when loading them into a model with `load_state_dict`.
+
+    Arguments:
+        path (str | os.PathLike):
+            Path to the manifest (ending in .manifest)
+        blob_root (str | os.PathLike):
+            Directory that contains the .blobs directory. If unspecified, it is
+            searched for in the parent directories of the manifest.
+            [Default: None]
+
+    Returns:
+        obj (Any):
+            The saved object, e.g. the state dict of a model.
+
+    Example:
+        >>> state_dict = load_checkpoint("log/experiment/0010/model.pt.manifest")
+        >>> model.load_state_dict(state_dict)
+    """
+    assert HAS_TORCH, "load_checkpoint requires torch (PyTorch) to be installed"
+    path = Path(path)
+    if blob_root is None:
+        for parent in path.absolute().parents:
+            if (parent / BLOBS_DIR).is_dir():
+                blob_root = parent
+                break
+        else:
+            raise FileNotFoundError(
+                "No {} directory found for the manifest {}".format(BLOBS_DIR, path)
+            )
+    return BlobStore(blob_root).load(path)
+
+
+class Retention:
+    """
+    Retention policy for the checkpoints of different steps, which determines which
+    ones are kept, the others are removed automatically.
+    """
+
+    def __init__(
+        self,
+        keep_last: Optional[int] = None,
+        keep_best: Optional[int] = None,
+        mode: str = "min",
+    ):
+        """
+        Arguments:
+            keep_last (int):
+                Number of most recent checkpoints to keep. If unspecified, they are
+                only kept if they are among the best.
+                [Default: None]
+            keep_best (int):
+                Number of checkpoints with the best metric to keep. If unspecified,
+                they are only kept if they are among the most recent.
+                [Default: None]
+            mode (str):
+                Whether the best metric is the lowest ("min") or the highest ("max").
+                [Default: "min"]
+        """
+        super().__init__()
+        assert mode in ["min", "max"], 'mode must be "min" or "max" - got {}'.format(
+            mode
+        )
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.mode = mode
+
+    def is_enabled(self) -> bool:
+        return self.keep_last is not None or self.keep_best is not None
+
+    def select_removed(self, checkpoints: List["Checkpoint"]) -> List["Checkpoint"]:
+        """
+        Selects the checkpoints that are neither among the most recent nor the best.
+        """
+        if not self.is_enabled():
+            return []
+        keep: Set[int] = set()
+        if self.keep_last is not None and self.keep_last > 0:
+            by_step = sorted(checkpoints, key=lambda c: c.step)
+            keep.update(id(c) for c in by_step[-self.keep_last :])
+        if self.keep_best is not None and self.keep_best > 0:
+            with_metric = [
+                (c.metric, i) for i, c in enumerate(checkpoints) if c.metric is not None
+            ]
+            with_metric.sort(reverse=self.mode == "max")
+            keep.update(id(checkpoints[i]) for _, i in with_metric[: self.keep_best])
+        return [c for c in checkpoints if id(c) not in keep]
+
+
+class Checkpoint:
+    def __init__(self, step: int, paths: List[Path], metric: Optional[float] = None):
+        super().__init__()
+        self.step = step
+        self.paths = paths
+        self.metric = metric
+
+    def remove(self):
+        for path in self.paths:
+            path.unlink(missing_ok=True)
+
+
+class Checkpointer:
+    """
+    Saves checkpoints in a background thread and removes old checkpoints according to
+    their retention policy.
+
+    Only one save of the same checkpoint can be in progress at any time, because its
+    CPU buffers are reused for the next one, which also limits the memory that is
+    needed for the snapshots.
+    """
+
+    def __init__(self, store: Optional[BlobStore] = None):
+        """
+        Arguments:
+            store (BlobStore):
+                Blob store for the checkpoints that are deduplicated.
+                [Default: None]
+        """
+        super().__init__()
+        self.store = store
+        # A single thread keeps the saves in order, which also avoids that multiple
+        # large checkpoints compete for the disk.
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="lavd-checkpoint"
+        )
+        self.buffers: Dict[str, Dict[str, "torch.Tensor"]] = {}
+        self.pending: Dict[str, Future] = {}
+        self.futures: List[Future] = []
+        self.checkpoints: Dict[str, List[Checkpoint]] = {}
+        self.lock = threading.Lock()
+
+    def save(
+        self,
+        name: str,
+        files: List[Tuple[str, Any, Path]],
+        step: Optional[int] = None,
+        blocking: bool = False,
+        retention: Optional[Retention] = None,
+        metric: Optional[float] = None,
+        dedup: bool = False,
+    ) -> Future:
+        """
+        Saves a checkpoint consisting of one or more files.
+
+        Arguments:
+            name (str):
+                Name of the checkpoint, which identifies the checkpoints of different
+                steps that belong together for the retention.
+            files (List[Tuple[str, Any, Path]]):
+                Files of the checkpoint given as (name, object, path), where the name
+                identifies the buffers that are reused for the snapshots.
+            step (int):
+                Step/epoch to which the checkpoint belongs. The retention only applies
+                to checkpoints with a step.
+                [Default: None]
+            blocking (bool):
+                Whether to wait until the checkpoint is saved, in which case no
+                snapshot is created.
+                [Default: False]
+            retention (Retention):
+                Retention policy to apply after the checkpoint has been saved.
+                [Default: None]
+            metric (float):
+                Metric of the checkpoint that is used to determine the best
+                checkpoints for the retention.
+                [Default: None]
+            dedup (bool):
+                Whether to save the files as manifests of the blob store, which
+                stores every distinct tensor only once.
+                [Default: False]
+
+        Returns:
+            future (Future):
+                Future that is resolved with the paths of the saved files.
+        """
+        assert not dedup or self.store is not None, "dedup requires a blob store"
+        if blocking:
+            future = self.executor.submit(
+                self.write,
+                name,
+                [(obj, path) for _, obj, path in files],
+                [],
+                step,
+                retention,
+                metric,
+                dedup,
+            )
+            future.result()
+            return future
+        snapshots = []
+        events = []
+        for file_name, obj, path in files:
+            previous = self.pending.get(file_name)
+            if previous is not None:
+                # Errors are raised when waiting for the future, not here.
+                previous.exception()
+            snapshot, file_events = snapshot_to_cpu(
+                obj, self.buffers.setdefault(file_name, {})
+            )
+            snapshots.append((snapshot, path))
+            events.extend(file_events)
+        future = self.executor.submit(
+            self.write, name, snapshots, events, step, retention, metric, dedup
+        )
+        for file_name, _, _ in files:
+            self.pending[file_name] = future
+        with self.lock:
+            # Only the futures that are still relevant for waiting are kept.
+            self.futures = [
+                f for f in self.futures if not f.done() or f.exception() is not None
+            ]
+            self.futures.append(future)
+        return future
+
+    def write(
+        self,
+        name: str,
+        files: List[Tuple[Any, Path]],
+        events: List,
+        step: Optional[int],
+        retention: Optional[Retention],
+        metric: Optional[float],
+        dedup: bool = False,
+    ) -> List[Path]:
+        for event in events:
+            event.synchronize()
+        paths = []
+        for obj, path in files:
+            if dedup:
+                assert self.store is not None
+                self.store.save(obj, path)
+            else:
+                save_atomic(obj, path)
+            paths.append(path)
+        if step is not None and retention is not None:
+            self.apply_retention(name, Checkpoint(step, paths, metric), retention)
+        return paths
+
+    def apply_retention(self, name: str, checkpoint: Checkpoint, retention: Retention):
+        with self.lock:
+            # Saving the same step again replaces the previous checkpoint.
+            checkpoints = [
+                c for c in self.checkpoints.get(name, []) if c.step != checkpoint.step
+            ]
+            checkpoints.append(checkpoint)
+            removed = retention.select_removed(checkpoints)
+            self.checkpoints[name] = [c for c in checkpoints if c not in removed]
+        for c in removed:
+            c.remove()
+        # The blobs of the removed manifests may not be needed anymore.
+        if self.store is not None and any(
+            path.name.endswith(MANIFEST_EXTENSION) for c in removed for path in c.paths
+        ):
+            self.store.collect_garbage()
+
+    def wait(self):
+        """
+        Waits until all checkpoints are saved.
+        Raises the first error that occurred while saving them.
+        """
+        with self.lock:
+            futures = self.futures
+            self.futures = []
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,471 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from PIL import Image
+
+from .file_types import (
+    BLOBS_DIR,
+    BUNDLE_EXTENSION,
+    COMPACT_DIR,
+    COMPACT_FILE,
+    categorise_file,
+)
+from .files import load_json
+from .items import FileRef
+
+COMPACT_VERSION = 1
+# Texts and markdown are packed into the bundle, the compact file only contains their
+# offset and length within it.
+BUNDLE_KINDS = ["texts", "markdown"]
+# Keys of the JSON files, which are consolidated. Files with any other keys are left.
+JSON_KINDS = ["scalars", "texts", "images"]
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", ".jpg"),
+    "png": ("PNG", ".png"),
+    "webp": ("WEBP", ".webp"),
+}
+
+default_max_text_size = 64 * 1024
+default_quality = 90
+
+# Kind -> category -> {"global": item, "steps": {step: item}}
+Entries = Dict[str, Dict[str, Dict]]
+
+
+def set_entry(
+    entries: Entries, kind: str, step: Union[str, int], category: str, item: Any
+):
+    category_data = entries.setdefault(kind, {}).setdefault(category, {})
+    if step == "global":
+        category_data["global"] = item
+    else:
+        category_data.setdefault("steps", {})[step] = item
+
+
+class CompactedExperiment:
+    """
+    Data of a compacted experiment, which is inserted into the data in place of the
+    files that have been consolidated.
+
+    Large texts and markdown may only be references to the bundle (FileRef).
+    """
+
+    def __init__(self, entries: Entries):
+        super().__init__()
+        self.entries = entries
+        # The file watcher looks up the items by step, e.g. when a step directory is
+        # removed, since their items need to be restored.
+        self.by_step: Dict[Union[str, int], List[Tuple[str, str, Any]]] = {}
+        for kind, step, category, item in self.items():
+            self.by_step.setdefault(step, []).append((kind, category, item))
+
+    def items(self) -> Iterator[Tuple[str, Union[str, int], str, Any]]:
+        for kind, kind_data in self.entries.items():
+            for category, category_data in kind_data.items():
+                global_item = category_data.get("global")
+                if global_item is not None:
+                    yield kind, "global", category, global_item
+                for step, item in category_data.get("steps", {}).items():
+                    yield kind, step, category, item
+
+    def items_of_step(self, step: Union[str, int]) -> List[Tuple[str, str, Any]]:
+        return self.by_step.get(step, [])
+
+
+def read_compacted(
+    path: Union[str, os.PathLike], max_inline_size: Optional[int] = None
+) -> Optional[CompactedExperiment]:
+    """
+    Reads the compacted data of an experiment.
+
+    Arguments:
+        path (str | os.PathLike):
+            Path to the experiment
+        max_inline_size (int, optional):
+            Maximum size in bytes of the texts and markdown in the bundle that are
+            loaded, larger ones are only referenced and loaded when requested.
+            If not specified, all of them are loaded.
+
+    Returns:
+        compacted (CompactedExperiment, optional):
+            Compacted data of the experiment or None if it has not been compacted.
+    """
+    compact_dir = Path(path, COMPACT_DIR)
+    try:
+        compact = load_json(compact_dir / COMPACT_FILE)
+    except FileNotFoundError:
+        return None
+    if compact.get("version") != COMPACT_VERSION:
+        return None
+    bundle_path = compact_dir / compact.get("bundle", "")
+    entries: Entries = {}
+    with ExitStack() as stack:
+        bundle_fd: Optional[BinaryIO] = None
+        for kind, kind_data in compact.get("entries", {}).items():
+            for category, category_data in kind_data.items():
+                # JSON only has string keys, hence the steps need to be converted back.
+                steps: List[Tuple[Union[str, int], Any]] = [
+                    (int(step), value)
+                    for step, value in category_data.get("steps", {}).items()
+                ]
+                if "global" in category_data:
+                    steps.append(("global", category_data["global"]))
+                for step, value in steps:
+                    if kind in BUNDLE_KINDS:
+                        if bundle_fd is None:
+                            bundle_fd = stack.enter_context(open(bundle_path, "rb"))
+                        offset, length = value
+                        if max_inline_size is not None and length > max_inline_size:
+                            value = FileRef.from_file(
+                                bundle_path, "json", offset=offset, length=length
+                            )
+                        else:
+                            bundle_fd.seek(offset)
+                            value = json.loads(bundle_fd.read(length))
+                    set_entry(entries, kind, step, category, value)
+    return CompactedExperiment(entries)
+
+
+def write_atomic(path: Path, content: bytes):
+    tmp_path = path.with_name("{}.tmp".format(path.name))
+    with open(tmp_path, "wb") as fd:
+        fd.write(content)
+    os.replace(tmp_path, path)
+
+
+def write_compacted(path: Union[str, os.PathLike], entries: Entries):
+    """
+    Writes the compacted data of an experiment.
+
+    The bundle is named after its content, so that the compact file, which is written
+    last, never refers to a bundle that is only partially written or that has already
+    been replaced.
+    """
+    compact_dir = Path(path, COMPACT_DIR)
+    compact_dir.mkdir(parents=True, exist_ok=True)
+    chunks: List[bytes] = []
+    offset = 0
+    compact_entries: Dict[str, Dict[str, Dict]] = {}
+    for kind, kind_data in entries.items():
+        compact_kind_data = compact_entries.setdefault(kind, {})
+        for category, category_data in kind_data.items():
+            compact_category_data: Dict = {}
+            steps = (
+                [("global", category_data["global"])]
+                if "global" in category_data
+                else []
+            )
+            steps.extend(category_data.get("steps", {}).items())
+            for step, item in steps:
+                value = item
+                if kind in BUNDLE_KINDS:
+                    chunk = json.dumps(item).encode("utf-8")
+                    chunks.append(chunk)
+                    value = [offset, len(chunk)]
+                    offset += len(chunk)
+                if step == "global":
+                    compact_category_data["global"] = value
+                else:
+                    compact_category_data.setdefault("steps", {})[str(step)] = value
+            compact_kind_data[category] = compact_category_data
+    bundle = b"".join(chunks)
+    bundle_name = "bundle-{}{}".format(
+        hashlib.sha256(bundle).hexdigest()[:16], BUNDLE_EXTENSION
+    )
+    write_atomic(compact_dir / bundle_name, bundle)
+    compact = {
+        "version": COMPACT_VERSION,
+        "bundle": bundle_name,
+        "entries": compact_entries,
+    }
+    write_atomic(compact_dir / COMPACT_FILE, json.dumps(compact).encode("utf-8"))
+    # Bundles of previous compactions are no longer referenced.
+    for old_bundle in compact_dir.glob("bundle-*{}".format(BUNDLE_EXTENSION)):
+        if old_bundle.name != bundle_name:
+            old_bundle.unlink()
+
+
+def iter_files(
+    path: Path,
+) -> Iterator[Tuple[Union[str, int], str, Optional[str], Path]]:
+    """
+    Iterates over the files of the experiment, the same way as they are gathered.
+
+    Returns:
+        files (Iterator[Tuple[str | int, str, str, Path]]):
+            Step, category, file category and path of each file
+    """
+    _, dir_names, _ = next(os.walk(path))
+    step_dirs = [d for d in dir_names if d.isdigit()]
+    roots: List[Tuple[Union[str, int], Path, List[str]]] = [
+        (int(d), path / d, []) for d in step_dirs
+    ]
+    roots.append(("global", path, step_dirs + [BLOBS_DIR, COMPACT_DIR]))
+    for step, root, ignore_dirs in roots:
+        for dir, dir_names, file_names in os.walk(root, topdown=True):
+            rel_path = os.path.relpath(dir, root)
+            if rel_path == ".":
+                rel_path = ""
+                dir_names[:] = [d for d in dir_names if d not in ignore_dirs]
+            for file_name in file_names:
+                # The command stays where it is.
+                if step == "global" and rel_path == "" and file_name == "command.json":
+                    continue
+                base_name, _ = os.path.splitext(file_name)
+                yield (
+                    step,
+                    Path(rel_path, base_name).as_posix(),
+                    categorise_file(file_name),
+                    Path(dir, file_name),
+                )
+
+
+def reencode_image(
+    path: Path, image_format: str, quality: int = default_quality
+) -> Optional[Path]:
+    """
+    Re-encodes the image in the given format.
+
+    The new image is written to a temporary file first, and only moved to its actual
+    path after the original has been removed, so that a running server never sees
+    both of them for the same category.
+
+    Returns:
+        new_path (Path, optional):
+            Path to the re-encoded image or None if it was not re-encoded, because it
+            is already in that format, it has multiple frames or there is already an
+            image with the new extension.
+    """
+    pil_format, extension = IMAGE_FORMATS[image_format]
+    new_path = path.with_suffix(extension)
+    # Another image with the same name would be overwritten.
+    if path.suffix.lower() == extension or new_path.exists():
+        return None
+    with Image.open(path) as image:
+        if getattr(image, "n_frames", 1) > 1:
+            return None
+        encoded: Image.Image = image
+        if pil_format == "JPEG" and image.mode not in ["RGB", "L"]:
+            encoded = image.convert("RGB")
+        tmp_path = path.with_name("{}.tmp".format(new_path.name))
+        encoded.save(tmp_path, format=pil_format, quality=quality)
+    path.unlink()
+    os.replace(tmp_path, new_path)
+    return new_path
+
+
+class CompactStats(NamedTuple):
+    files_removed: int = 0
+    dirs_removed: int = 0
+    images_reencoded: int = 0
+
+
+def remove_empty_dirs(path: Path) -> int:
+    num_removed = 0
+    for dir, dir_names, file_names in os.walk(path, topdown=False):
+        dir_path = Path(dir)
+        if dir_path == path or COMPACT_DIR in dir_path.relative_to(path).parts:
+            continue
+        if BLOBS_DIR in dir_path.relative_to(path).parts:
+            continue
+        try:
+            # Only succeeds if the directory is empty.
+            os.rmdir(dir_path)
+            num_removed += 1
+        except OSError:
+            continue
+    return num_removed
+
+
+def compact_experiment(
+    path: Union[str, os.PathLike],
+    max_text_size: int = default_max_text_size,
+    image_format: Optional[str] = None,
+    quality: int = default_quality,
+    dry_run: bool = False,
+) -> CompactStats:
+    """
+    Compacts an experiment by consolidating the scalars and images of the JSON files
+    into one file and packing the small texts and markdown into a bundle. The
+    consolidated files and the directories that end up empty are removed.
+
+    The experiment should be finished, anything that is logged while it is compacted
+    may be lost. Compacting it again merges the new files into the compacted data.
+
+    Arguments:
+        path (str | os.PathLike):
+            Path to the experiment
+        max_text_size (int):
+            Maximum size in bytes of the texts and markdown files that are packed,
+            larger ones are left as they are.
+            [Default: 64 KiB]
+        image_format (str, optional):
+            Re-encodes the images in this format, one of: "jpeg" | "png" | "webp"
+            If not specified, the images are left as they are.
+        quality (int):
+            Quality of the re-encoded images (only for JPEG and WebP)
+            [Default: 90]
+        dry_run (bool):
+            Only determine what would be compacted, without modifying anything.
+            [Default: False]
+
+    Returns:
+        stats (CompactStats):
+            Number of removed files and directories and re-encoded images.
+    """
+    path = Path(path).absolute()
+    existing = read_compacted(path)
+    entries: Entries = {} if existing is None else existing.entries
+    consumed: List[Path] = []
+    images: List[Path] = []
+    for step, category, file_category, file_path in iter_files(path):
+        if file_category == "json":
+            json_data = load_json(file_path)
+            if len(json_data) == 0 or any(
+                kind not in JSON_KINDS or not isinstance(item, dict)
+                for kind, item in json_data.items()
+            ):
+                continue
+            for kind, item in json_data.items():
+                if kind == "images" and item.get("source"):
+                    # The source is relative to the JSON file, but the compacted one
+                    # is in a different directory.
+                    item = dict(item)
+                    item["source"] = Path(
+                        os.path.relpath(file_path.parent / item["source"], path)
+                    ).as_posix()
+                set_entry(entries, kind, step, category, item)
+            consumed.append(file_path)
+        elif file_category in ["text", "markdown"]:
+            if file_path.stat().st_size > max_text_size:
+                continue
+            with open(file_path, "r", encoding="utf-8") as fd:
+                content = fd.read()
+            if file_category == "text":
+                set_entry(entries, "texts", step, category, {"actual": content})
+            else:
+                set_entry(entries, "markdown", step, category, {"raw": content})
+            consumed.append(file_path)
+        elif file_category == "image" and image_format is not None:
+            if file_path.suffix.lower() != IMAGE_FORMATS[image_format][1]:
+                images.append(file_path)
+    if dry_run:
+        return CompactStats(files_removed=len(consumed), images_reencoded=len(images))
+    num_reencoded = 0
+    renamed: Dict[str, str] = {}
+    for image_path in images:
+        assert image_format is not None
+        try:
+            new_path = reencode_image(image_path, image_format, quality=quality)
+        except OSError:
+            # Invalid images are left as they are.
+            continue
+        if new_path is not None:
+            renamed[Path(image_path.relative_to(path)).as_posix()] = Path(
+                new_path.relative_to(path)
+            ).as_posix()
+            num_reencoded += 1
+    for category_data in entries.get("images", {}).values():
+        for item in [
+            category_data.get("global"),
+            *category_data.get("steps", {}).values(),
+        ]:
+            if item is not None and item.get("source") in renamed:
+                item["source"] = renamed[item["source"]]
+    # The compacted data is written before the files are removed, so that the data
+    # is never missing.
+    write_compacted(path, entries)
+    for file_path in consumed:
+        file_path.unlink()
+    return CompactStats(
+        files_removed=len(consumed),
+        dirs_removed=remove_empty_dirs(path),
+        images_reencoded=num_reencoded,
+    )
+
+
+def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="lavd compact",
+        description=(
+            "Compacts finished experiments, by consolidating their scalars and images "
+            "into one file and packing the small texts and markdown into a bundle"
+        ),
+    )
+    parser.add_argument(
+        "experiments",
+        metavar="EXPERIMENT",
+        nargs="+",
+        help="Directories of the experiments to compact",
+    )
+    parser.add_argument(
+        "--max-text-size",
+        dest="max_text_size",
+        type=int,
+        default=default_max_text_size,
+        help=(
+            "Maximum size in bytes of the texts and markdown files that are packed "
+            "[Default: {}]".format(default_max_text_size)
+        ),
+    )
+    parser.add_argument(
+        "--image-format",
+        dest="image_format",
+        choices=list(IMAGE_FORMATS.keys()),
+        help="Re-encode the images in the given format [Default: keep them]",
+    )
+    parser.add_argument(
+        "--quality",
+        dest="quality",
+        type=int,
+        default=default_quality,
+        help="Quality of the re-encoded images [Default: {}]".format(default_quality),
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="Show what would be compacted without modifying anything",
+    )
+    return parser.parse_args(args)
+
+
+def main(args: Optional[List[str]] = None):
+    options = parse_args(args)
+    for experiment in options.experiments:
+        if not Path(experiment).is_dir():
+            sys.exit("{} is not a directory".format(experiment))
+        stats = compact_experiment(
+            experiment,
+            max_text_size=options.max_text_size,
+            image_format=options.image_format,
+            quality=options.quality,
+            dry_run=options.dry_run,
+        )
+        print(
+            "{} {}: {} files removed, {} directories removed, {} images "
+            "re-encoded".format(
+                "Would compact" if options.dry_run else "Compacted",
+                experiment,
+                stats.files_removed,
+                stats.dirs_removed,
+                stats.images_reencoded,
+            )
+        )
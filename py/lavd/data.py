@@ -1,12 +1,187 @@
 import os
-from typing import Any, Dict, Optional, Set, Union
+import re
+import threading
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
 
 
-def get_or_insert_dict(d: Dict, key: Any) -> Dict:
-    data = d.get(key)
-    if data is None:
-        d[key] = {}
-    return d[key]
+class Selection(NamedTuple):
+    """
+    Selects part of the data, where everything that is not specified is selected.
+
+    Arguments:
+        names (List[str], optional):
+            Names of the experiments to select
+        exclude (List[str], optional):
+            Names of the experiments to leave out
+        pattern (Pattern, optional):
+            Regular expression the names of the experiments must match
+        kinds (List[str], optional):
+            Kinds to select, e.g. ["scalars", "command"]
+        categories (List[str], optional):
+            Prefixes of the categories to select, e.g. ["train/", "validation/"]
+        start (int, optional):
+            First step to select, global items are always selected.
+        end (int, optional):
+            Last step to select (inclusive), global items are always selected.
+    """
+
+    names: Optional[List[str]] = None
+    exclude: Optional[List[str]] = None
+    pattern: Optional[Pattern] = None
+    kinds: Optional[List[str]] = None
+    categories: Optional[List[str]] = None
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+    def is_everything(self) -> bool:
+        return all(value is None for value in self)
+
+    def includes_name(self, name: str) -> bool:
+        if self.names is not None and name not in self.names:
+            return False
+        if self.exclude is not None and name in self.exclude:
+            return False
+        return self.pattern is None or self.pattern.search(name) is not None
+
+
+def parse_selection(
+    names: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    pattern: Optional[str] = None,
+    kinds: Optional[List[str]] = None,
+    categories: Optional[List[str]] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> Selection:
+    """
+    Creates the selection from its string representation, e.g. the query arguments.
+
+    Raises:
+        ValueError: If the pattern is not a valid regular expression or the steps are
+            not integers.
+    """
+    try:
+        compiled_pattern = None if pattern is None else re.compile(pattern)
+    except re.error as e:
+        raise ValueError("invalid pattern: {}".format(e))
+    return Selection(
+        names=names,
+        exclude=exclude,
+        pattern=compiled_pattern,
+        kinds=kinds,
+        categories=categories,
+        start=None if start is None else int(start),
+        end=None if end is None else int(end),
+    )
+
+
+def select_category(category_data: Dict, selection: Selection) -> Dict:
+    steps = category_data.get("steps")
+    if steps is None or (selection.start is None and selection.end is None):
+        return category_data
+    start = selection.start
+    end = selection.end
+    selected_steps = {
+        step: item
+        for step, item in steps.items()
+        if (start is None or step >= start) and (end is None or step <= end)
+    }
+    if len(selected_steps) == len(steps):
+        return category_data
+    selected = {key: value for key, value in category_data.items() if key != "steps"}
+    if len(selected_steps) > 0:
+        selected["steps"] = selected_steps
+    return selected
+
+
+def select_experiment(name_data: Dict, selection: Selection) -> Dict:
+    if (
+        selection.kinds is None
+        and selection.categories is None
+        and selection.start is None
+        and selection.end is None
+    ):
+        return name_data
+    kinds = name_data.keys() if selection.kinds is None else selection.kinds
+    selected = {}
+    for kind in kinds:
+        kind_data = name_data.get(kind)
+        if kind_data is None:
+            continue
+        # The command has no categories.
+        if kind == "command":
+            selected[kind] = kind_data
+            continue
+        selected_kind_data = {}
+        for category, category_data in kind_data.items():
+            if selection.categories is not None and not category.startswith(
+                tuple(selection.categories)
+            ):
+                continue
+            selected_category_data = select_category(category_data, selection)
+            if len(selected_category_data) > 0:
+                selected_kind_data[category] = selected_category_data
+        if len(selected_kind_data) > 0:
+            selected[kind] = selected_kind_data
+    return selected
+
+
+def select_data(data: Dict, selection: Selection) -> Dict:
+    """
+    Selects part of the data (full or truncated). Experiments that are not selected
+    are still included, but without any data, so that all names are known.
+    Everything that is selected as a whole is shared with the data rather than copied,
+    which is safe since the data is never modified.
+    """
+    if selection.is_everything():
+        return data
+    return {
+        name: (
+            select_experiment(name_data, selection)
+            if selection.includes_name(name)
+            else {}
+        )
+        for name, name_data in data.items()
+    }
+
+
+def is_unchanged(old: Any, new: Any) -> bool:
+    """
+    Checks whether the selected data is still the same as before.
+
+    Since the data is copy-on-write, anything that has been modified is a different
+    object, hence only the dictionaries that were created by the selection need to be
+    compared, everything else just by its identity.
+
+    Arguments:
+        old (Any):
+            Previously selected data
+        new (Any):
+            Currently selected data
+
+    Returns:
+        unchanged (bool):
+            Whether it is unchanged, which can be False for equal data, if it was
+            modified but ended up with the same content.
+    """
+    if old is new:
+        return True
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return False
+    if old.keys() != new.keys():
+        return False
+    return all(is_unchanged(value, new[key]) for key, value in old.items())
 
 
 class Data:
@@ -26,24 +201,153 @@ class Data:
         }
     }
     with Kind = "scalars" | "images" | "texts" | "logs" | "markdown" | "command"
+
+    The dictionaries are never modified once they are visible, instead a modification
+    copies the dictionaries along the path to the modified item and the new version
+    replaces the old one at once (copy-on-write). Readers therefore always see
+    a consistent version of the data, without any locking, e.g. while serialising it,
+    even though the file watcher is modifying it at the same time.
     """
 
-    def __init__(self):
+    def __init__(self, full: Optional[Dict] = None, truncated: Optional[Dict] = None):
         super().__init__()
-        self.full = {}
-        self.truncated = {}
+        # Full and truncated data are always replaced together, so that they are
+        # consistent with each other.
+        self.state: Tuple[Dict, Dict] = (
+            {} if full is None else full,
+            {} if truncated is None else truncated,
+        )
+        # Incremented for every modification, which allows to cheaply check whether the
+        # data has changed.
+        self.version = 0
+        # Only the writers need to be synchronised, readers just use the current state.
+        self.lock = threading.RLock()
+        # State that is being modified in the current transaction, which is not visible
+        # to the readers until the transaction is finished.
+        self.pending: Optional[Tuple[Dict, Dict]] = None
+        self.writer: Optional[int] = None
+        # Dictionaries that have been created in the current transaction and are
+        # therefore not visible to anyone else, hence can be modified in place.
+        # They are kept alive until the end of the transaction, otherwise the id of
+        # a discarded dictionary could be reused by one that is visible to others.
+        self.owned: Dict[int, Dict] = {}
+
+    @property
+    def full(self) -> Dict:
+        return self.state[0]
+
+    @property
+    def truncated(self) -> Dict:
+        return self.state[1]
+
+    def snapshot(self) -> "Data":
+        """
+        Creates a snapshot of the current data, which is never modified.
+        It shares all the dictionaries with the current data, hence it's cheap.
+        """
+        full, truncated = self.state
+        snapshot = Data(full, truncated)
+        snapshot.version = self.version
+        return snapshot
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Combines all modifications within the transaction into one new version, which
+        is only visible once the transaction is finished. Dictionaries that are created
+        within the transaction are modified in place, which makes modifying many items
+        at once (e.g. scanning the log directory) as fast as regular dictionaries.
+        """
+        with self.lock:
+            # Nested transactions are part of the outer one.
+            if self.pending is not None:
+                yield
+                return
+            self.pending = self.state
+            self.writer = threading.get_ident()
+            try:
+                yield
+            finally:
+                self.state = self.pending
+                self.version += 1
+                self.pending = None
+                self.writer = None
+                self.owned.clear()
+
+    def current_state(self) -> Tuple[Dict, Dict]:
+        # The writer sees its own modifications within the transaction.
+        if self.pending is not None and self.writer == threading.get_ident():
+            return self.pending
+        return self.state
+
+    def own(self, d: Dict) -> Dict:
+        # Copies the dictionary, unless it was already created in this transaction.
+        if self.owned.get(id(d)) is d:
+            return d
+        d = dict(d)
+        self.owned[id(d)] = d
+        return d
+
+    def assoc(self, d: Dict, key: Any, value: Any) -> Dict:
+        d = self.own(d)
+        d[key] = value
+        return d
+
+    def assoc_in(self, d: Dict, keys: List[Any], value: Any) -> Dict:
+        root = self.own(d)
+        current = root
+        # Every dictionary along the path is owned, hence they can be linked in place.
+        for key in keys[:-1]:
+            child = current.get(key)
+            if child is None:
+                child = {}
+                self.owned[id(child)] = child
+            else:
+                child = self.own(child)
+            current[key] = child
+            current = child
+        current[keys[-1]] = value
+        return root
+
+    def dissoc(self, d: Dict, key: Any) -> Dict:
+        if key not in d:
+            return d
+        d = self.own(d)
+        del d[key]
+        return d
+
+    def select(self, selection: Selection) -> Dict:
+        """
+        Selects part of the truncated data, only the selected experiments and kinds are
+        looked at.
+
+        Arguments:
+            selection (Selection):
+                Which part of the data to select
+
+        Returns:
+            selected (dict):
+                Truncated data of the selection
+        """
+        _, truncated = self.current_state()
+        return select_data(truncated, selection)
 
     def add_name(self, name: str):
-        if name not in self.full:
-            self.full[name] = {}
-        if name not in self.truncated:
-            self.truncated[name] = {}
+        with self.transaction():
+            assert self.pending is not None
+            full, truncated = self.pending
+            if name not in full:
+                full = self.assoc(full, name, {})
+            if name not in truncated:
+                truncated = self.assoc(truncated, name, {})
+            self.pending = (full, truncated)
 
     # Always returns the full data (not truncated)
     def get(
         self, kind: str, name: str, step: Union[str, int], category: str
     ) -> Optional[Any]:
-        name_data = self.full.get(name)
+        full, _ = self.current_state()
+        name_data = full.get(name)
         if name_data is None:
             return None
         kind_data = name_data.get(kind)
@@ -69,7 +373,7 @@ class Data:
         name: str,
         step: Union[str, int],
         category: str,
-        value: Dict,
+        value: Any,
         truncate: bool = False,
     ):
         # The truncated value is the URL for the Api, but if the value shouldn't be
@@ -80,36 +384,47 @@ class Data:
             if truncate
             else value
         )
-        name_data = get_or_insert_dict(self.full, name)
-        name_truncated = get_or_insert_dict(self.truncated, name)
-        kind_data = get_or_insert_dict(name_data, kind)
-        kind_truncated = get_or_insert_dict(name_truncated, kind)
-        category_data = get_or_insert_dict(kind_data, category)
-        category_truncated = get_or_insert_dict(kind_truncated, category)
         if isinstance(step, int):
-            step_data = get_or_insert_dict(category_data, "steps")
-            step_truncated = get_or_insert_dict(category_truncated, "steps")
-            step_data[step] = value
-            step_truncated[step] = truncated_value
+            path: List[Any] = [name, kind, category, "steps", step]
         elif step == "global":
-            category_data["global"] = value
-            category_truncated["global"] = truncated_value
+            path = [name, kind, category, "global"]
         else:
             raise RuntimeError('Step must be int or "global" - got {}'.format(step))
+        with self.transaction():
+            assert self.pending is not None
+            full, truncated = self.pending
+            self.pending = (
+                self.assoc_in(full, path, value),
+                self.assoc_in(truncated, path, truncated_value),
+            )
 
     def set_command(self, name: str, value: Dict):
-        name_data = get_or_insert_dict(self.full, name)
-        name_truncated = get_or_insert_dict(self.truncated, name)
         command = value.get("command")
-        if command is not None:
-            name_data["command"] = command
-            name_truncated["command"] = command
+        with self.transaction():
+            assert self.pending is not None
+            full, truncated = self.pending
+            if command is None:
+                # Still makes sure that the experiment exists.
+                self.pending = (
+                    full if name in full else self.assoc(full, name, {}),
+                    truncated if name in truncated else self.assoc(truncated, name, {}),
+                )
+            else:
+                self.pending = (
+                    self.assoc_in(full, [name, "command"], command),
+                    self.assoc_in(truncated, [name, "command"], command),
+                )
 
     def remove_command(self, name: str):
-        name_data = get_or_insert_dict(self.full, name)
-        name_truncated = get_or_insert_dict(self.truncated, name)
-        name_data.pop("command", None)
-        name_truncated.pop("command", None)
+        with self.transaction():
+            assert self.pending is not None
+            full, truncated = self.pending
+            self.pending = (
+                self.assoc(full, name, self.dissoc(full.get(name, {}), "command")),
+                self.assoc(
+                    truncated, name, self.dissoc(truncated.get(name, {}), "command")
+                ),
+            )
 
     # Removes the specified data
     # Only the cases that are reflected in the file structure are covered.
@@ -122,51 +437,90 @@ class Data:
         kind: Optional[str] = None,
         is_dir: bool = False,
     ):
-        if name is None:
-            self.full = {}
-            self.truncated = {}
-            return
-        if step is None:
-            self.full.pop(name, None)
-            self.truncated.pop(name, None)
-            return
-        name_full = self.full.get(name)
-        name_truncated = self.truncated.get(name)
-        if name_full is None:
-            return
-        for kind_key in name_full:
+        with self.transaction():
+            assert self.pending is not None
+            full, truncated = self.pending
+            if name is None:
+                self.pending = ({}, {})
+            elif step is None:
+                self.pending = (self.dissoc(full, name), self.dissoc(truncated, name))
+            elif name in full:
+                self.pending = (
+                    self.assoc(
+                        full,
+                        name,
+                        self.remove_from_experiment(
+                            full[name],
+                            step,
+                            category=category,
+                            kind=kind,
+                            is_dir=is_dir,
+                        ),
+                    ),
+                    self.assoc(
+                        truncated,
+                        name,
+                        self.remove_from_experiment(
+                            truncated.get(name, {}),
+                            step,
+                            category=category,
+                            kind=kind,
+                            is_dir=is_dir,
+                        ),
+                    ),
+                )
+
+    def remove_from_experiment(
+        self,
+        name_data: Dict,
+        step: Union[str, int],
+        category: Optional[str] = None,
+        kind: Optional[str] = None,
+        is_dir: bool = False,
+    ) -> Dict:
+        for kind_key, kind_data in list(name_data.items()):
+            # The command is not a kind with categories.
+            if kind_key == "command":
+                continue
             if kind is not None and kind != kind_key:
                 continue
-            kind_full = name_full.get(kind_key)
-            kind_truncated = name_truncated.get(kind_key)
-            empty_categories: Set[str] = set()
-            for category_key in kind_full:
+            new_kind_data = kind_data
+            # Dictionaries created within the transaction are modified in place.
+            for category_key, category_data in list(kind_data.items()):
                 if category is not None:
-                    if is_dir and category_key.startswith(category):
-                        continue
+                    # A directory removes all categories nested within it.
+                    if is_dir:
+                        if category_key != category and not category_key.startswith(
+                            "{}/".format(category)
+                        ):
+                            continue
                     elif category != category_key:
                         continue
-                category_full = kind_full.get(category_key)
-                category_truncated = kind_truncated.get(category_key)
+                new_category_data = category_data
                 if isinstance(step, int):
-                    step_full = category_full.get("steps")
-                    step_truncated = category_truncated.get("steps")
-                    if step_full is not None:
-                        step_full.pop(step, None)
-                        step_truncated.pop(step, None)
-                        if len(step_full) == 0:
-                            category_full.pop("steps", None)
-                            category_truncated.pop("steps", None)
+                    step_data = category_data.get("steps")
+                    if step_data is not None and step in step_data:
+                        step_data = self.dissoc(step_data, step)
+                        if len(step_data) == 0:
+                            new_category_data = self.dissoc(category_data, "steps")
+                        else:
+                            new_category_data = self.assoc(
+                                category_data, "steps", step_data
+                            )
                 elif step == "global":
-                    category_full.pop("global", None)
-                    category_truncated.pop("global", None)
+                    new_category_data = self.dissoc(category_data, "global")
+                if new_category_data is category_data:
+                    continue
                 # Clean up empty category
-                # Can't do that while looping over the keys
-                if len(category_full) == 0:
-                    empty_categories.add(category_key)
-            for category_key in empty_categories:
-                kind_full.pop(category_key, None)
-                kind_truncated.pop(category_key, None)
+                if len(new_category_data) == 0:
+                    new_kind_data = self.dissoc(new_kind_data, category_key)
+                else:
+                    new_kind_data = self.assoc(
+                        new_kind_data, category_key, new_category_data
+                    )
+            if new_kind_data is not kind_data:
+                name_data = self.assoc(name_data, kind_key, new_kind_data)
+        return name_data
 
     def __repr__(self):
         return repr(self.full)
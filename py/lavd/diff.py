@@ -0,0 +1,221 @@
+import difflib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .items import estimate_size
+
+DIFF_LEVELS = ["char", "word", "line"]
+
+# Operations of the diff: equal, removed from the actual, added in the expected.
+EQUAL = "="
+REMOVED = "-"
+ADDED = "+"
+
+default_diff_cache_size = 64 * 1024 * 1024
+
+# Texts whose numbers of tokens multiplied are below this limit are diffed directly,
+# longer ones are diffed with coarser tokens first, and only the parts that differ
+# are diffed with the actual tokens.
+DIRECT_DIFF_LIMIT = 250_000
+
+# Words, whitespace and punctuation are separate tokens, so that joining all tokens
+# gives back the original text.
+word_regex = re.compile(r"\w+|\s+|[^\w\s]")
+# Coarser tokens to diff long texts first, which include the following whitespace,
+# since tokens that occur very often, such as spaces, make the diff exceedingly slow.
+chunk_regex = re.compile(r"\S+\s*|\s+")
+
+
+def tokenise(text: str, level: str) -> List[str]:
+    if level == "char":
+        return list(text)
+    elif level == "word":
+        return word_regex.findall(text)
+    elif level == "line":
+        return text.splitlines(keepends=True)
+    else:
+        raise ValueError(
+            "level must be one of {} - got {}".format(" | ".join(DIFF_LEVELS), level)
+        )
+
+
+def append_op(ops: List[List[str]], op: str, value: str):
+    # Consecutive operations of the same kind are merged to keep the diff compact.
+    if len(value) == 0:
+        return
+    if len(ops) > 0 and ops[-1][0] == op:
+        ops[-1][1] += value
+    else:
+        ops.append([op, value])
+
+
+def diff_tokens(ops: List[List[str]], actual: List[str], expected: List[str]):
+    # The autojunk heuristic would treat frequent tokens, e.g. spaces, as junk, which
+    # makes the diff worse for long texts.
+    matcher = difflib.SequenceMatcher(None, actual, expected, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            append_op(ops, EQUAL, "".join(actual[i1:i2]))
+        else:
+            append_op(ops, REMOVED, "".join(actual[i1:i2]))
+            append_op(ops, ADDED, "".join(expected[j1:j2]))
+
+
+def diff_block(ops: List[List[str]], actual: str, expected: str, level: str):
+    actual_tokens = tokenise(actual, level)
+    expected_tokens = tokenise(expected, level)
+    if (
+        level == "line"
+        or len(actual_tokens) * len(expected_tokens) <= DIRECT_DIFF_LIMIT
+    ):
+        diff_tokens(ops, actual_tokens, expected_tokens)
+        return
+    actual_coarse = chunk_regex.findall(actual)
+    expected_coarse = chunk_regex.findall(expected)
+    matcher = difflib.SequenceMatcher(
+        None, actual_coarse, expected_coarse, autojunk=False
+    )
+    opcodes = matcher.get_opcodes()
+    if len(opcodes) == 1 and opcodes[0][0] != "equal":
+        # Nothing in common with the coarser tokens, hence there is nothing to refine.
+        append_op(ops, REMOVED, actual)
+        append_op(ops, ADDED, expected)
+        return
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            append_op(ops, EQUAL, "".join(actual_coarse[i1:i2]))
+        else:
+            diff_block(
+                ops,
+                "".join(actual_coarse[i1:i2]),
+                "".join(expected_coarse[j1:j2]),
+                level,
+            )
+
+
+def compute_diff(actual: str, expected: str, level: str = "char") -> List[List[str]]:
+    """
+    Computes the diff between the actual and the expected text.
+
+    The common prefix and suffix are excluded from the comparison. When the remaining
+    parts are long, they are compared with coarser tokens first (words including the
+    following whitespace), and only the parts that differ are compared at the
+    requested level. That avoids comparing every character with every other one,
+    which is prohibitively slow for long texts.
+
+    Arguments:
+        actual (str):
+            Actual text
+        expected (str):
+            Expected text
+        level (str):
+            Level of the diff, one of: "char" | "word" | "line"
+            [Default: "char"]
+
+    Returns:
+        ops (List[List[str]]):
+            Operations of the diff as [op, value], where op is "=" for an equal part,
+            "-" for a part that is only in the actual text and "+" for a part that is
+            only in the expected text.
+    """
+    actual_tokens = tokenise(actual, level)
+    expected_tokens = tokenise(expected, level)
+    max_common = min(len(actual_tokens), len(expected_tokens))
+    start = 0
+    while start < max_common and actual_tokens[start] == expected_tokens[start]:
+        start += 1
+    end = 0
+    while (
+        end < max_common - start
+        and actual_tokens[-end - 1] == expected_tokens[-end - 1]
+    ):
+        end += 1
+    ops: List[List[str]] = []
+    append_op(ops, EQUAL, "".join(actual_tokens[:start]))
+    diff_block(
+        ops,
+        "".join(actual_tokens[start : len(actual_tokens) - end]),
+        "".join(expected_tokens[start : len(expected_tokens) - end]),
+        level,
+    )
+    append_op(ops, EQUAL, "".join(actual_tokens[len(actual_tokens) - end :]))
+    return ops
+
+
+class DiffCache:
+    """
+    LRU cache of the diffs, where each entry is only valid for the version of the text
+    it was computed from, limited by the estimated memory of the diffs.
+
+    The items of the data are never modified but replaced when the file changes,
+    hence the item of the data identifies the version. For large texts that is just
+    the reference to the file (path, size and modification time), so the loaded text
+    is not kept alive by the cache. Items that are equal (e.g. after loading a new
+    snapshot of the data) are also the same version, which is still much cheaper to
+    check than computing the diff again.
+    """
+
+    def __init__(self, max_size: int = default_diff_cache_size):
+        """
+        Arguments:
+            max_size (int):
+                Maximum total size in bytes of the cached diffs, as estimated by
+                estimate_size. Larger diffs are computed every time.
+                [Default: 64 MiB]
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.size = 0
+        self.entries: OrderedDict[Tuple, Tuple[Any, List[List[str]], int]] = (
+            OrderedDict()
+        )
+        # Diffs are computed in a thread pool.
+        self.lock = threading.Lock()
+
+    def get(
+        self, key: Tuple, version: Any, item: Dict[str, Any], level: str = "char"
+    ) -> Optional[List[List[str]]]:
+        """
+        Gets the diff of the text item, which is computed if it is not cached.
+
+        Arguments:
+            key (Tuple):
+                Key identifying the text, e.g. (name, step, category)
+            version (Any):
+                Item of the data, which is a reference to the file for large texts,
+                to identify the version of the text.
+            item (dict):
+                Text item containing actual and expected
+            level (str):
+                Level of the diff, one of: "char" | "word" | "line"
+                [Default: "char"]
+
+        Returns:
+            ops (List[List[str]], optional):
+                Operations of the diff or None if the item has no expected text.
+        """
+        expected = item.get("expected")
+        if expected is None:
+            return None
+        cache_key = (*key, level)
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is not None and (entry[0] is version or entry[0] == version):
+                self.entries.move_to_end(cache_key)
+                return entry[1]
+        ops = compute_diff(item.get("actual", ""), expected, level=level)
+        size = estimate_size(ops)
+        if size > self.max_size:
+            return ops
+        with self.lock:
+            previous = self.entries.pop(cache_key, None)
+            if previous is not None:
+                self.size -= previous[2]
+            self.entries[cache_key] = (version, ops, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, _, removed_size) = self.entries.popitem(last=False)
+                self.size -= removed_size
+        return ops
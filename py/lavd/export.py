@@ -0,0 +1,402 @@
+import argparse
+import csv
+import io
+import os
+import sys
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from .compact import read_compacted
+from .data import Data, Selection, parse_selection
+from .file_types import BLOBS_DIR, COMPACT_DIR, categorise_file
+from .files import load_json
+from .fs import list_experiments
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+EXPORT_FORMATS = ["csv", "parquet", "arrow"]
+FORMAT_EXTENSIONS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+}
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=UTF-8",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+COLUMNS = ["name", "category", "step", "value"]
+
+default_batch_size = 10_000
+
+
+class ScalarRow(NamedTuple):
+    name: str
+    category: str
+    # None for global scalars
+    step: Optional[int]
+    value: Optional[float]
+
+
+def to_value(item: Dict) -> Optional[float]:
+    value = item.get("value")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+def iter_data_scalars(
+    data: Data, selection: Selection = Selection()
+) -> Iterator[ScalarRow]:
+    """
+    Iterates over the scalars of the data, which is already in memory, e.g. in the
+    server.
+    """
+    selected = data.select(selection._replace(kinds=["scalars"]))
+    for name, name_data in sorted(selected.items()):
+        for category, category_data in sorted(name_data.get("scalars", {}).items()):
+            global_item = category_data.get("global")
+            if global_item is not None:
+                yield ScalarRow(name, category, None, to_value(global_item))
+            for step, item in sorted(category_data.get("steps", {}).items()):
+                yield ScalarRow(name, category, step, to_value(item))
+
+
+def iter_json_files(
+    path: Path, ignore_dirs: List[str] = []
+) -> Iterator[Tuple[str, Path]]:
+    for dir, dir_names, file_names in os.walk(path, topdown=True):
+        if dir == os.fspath(path):
+            dir_names[:] = [d for d in dir_names if d not in ignore_dirs]
+        dir_names.sort()
+        rel_path = os.path.relpath(dir, path)
+        for file_name in sorted(file_names):
+            if categorise_file(file_name) != "json":
+                continue
+            base_name, _ = os.path.splitext(file_name)
+            yield Path(rel_path, base_name).as_posix(), Path(dir, file_name)
+
+
+def read_scalar(path: Path) -> Optional[Dict]:
+    try:
+        scalar = load_json(path).get("scalars")
+    except (OSError, ValueError):
+        # Files that are still being written or not valid JSON are skipped.
+        return None
+    return scalar if isinstance(scalar, dict) else None
+
+
+def iter_log_dir_scalars(
+    log_dir: Union[str, os.PathLike], selection: Selection = Selection()
+) -> Iterator[ScalarRow]:
+    """
+    Iterates over the scalars in the log directory by reading the files one by one,
+    without gathering all the data first.
+    """
+    log_dir = Path(log_dir).absolute()
+    categories = None if selection.categories is None else tuple(selection.categories)
+    for name in list_experiments(log_dir):
+        if not selection.includes_name(name):
+            continue
+        experiment_path = log_dir / name
+        _, dir_names, _ = next(os.walk(experiment_path))
+        # The directories may be zero padded, hence they are kept for each step.
+        step_dirs = {int(d): d for d in dir_names if d.isdigit()}
+        # Scalars of the compacted experiment, unless they have been logged again
+        # afterwards, in which case the files take precedence.
+        compacted_scalars: Dict[Optional[int], Dict[str, Dict]] = {}
+        compacted = (
+            read_compacted(experiment_path) if COMPACT_DIR in dir_names else None
+        )
+        if compacted is not None:
+            for kind, step_key, category, item in compacted.items():
+                if kind == "scalars":
+                    compacted_step = None if step_key == "global" else int(step_key)
+                    compacted_scalars.setdefault(compacted_step, {})[category] = item
+        compacted_steps = {step for step in compacted_scalars if step is not None}
+        steps: List[Optional[int]] = [None]
+        steps.extend(
+            step
+            for step in sorted(set(step_dirs) | compacted_steps)
+            if (selection.start is None or step >= selection.start)
+            and (selection.end is None or step <= selection.end)
+        )
+        for step in steps:
+            step_scalars = dict(compacted_scalars.get(step, {}))
+            if step is None:
+                files = iter_json_files(
+                    experiment_path,
+                    ignore_dirs=[*step_dirs.values(), BLOBS_DIR, COMPACT_DIR],
+                )
+            elif step in step_dirs:
+                files = iter_json_files(experiment_path / step_dirs[step])
+            else:
+                files = iter([])
+            for category, path in files:
+                if categories is not None and not category.startswith(categories):
+                    continue
+                scalar = read_scalar(path)
+                if scalar is not None:
+                    step_scalars.pop(category, None)
+                    yield ScalarRow(name, category, step, to_value(scalar))
+            for category, scalar in sorted(step_scalars.items()):
+                if categories is not None and not category.startswith(categories):
+                    continue
+                yield ScalarRow(name, category, step, to_value(scalar))
+
+
+def iter_batches(
+    rows: Iterator[ScalarRow], batch_size: int = default_batch_size
+) -> Iterator[List[ScalarRow]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+class CsvWriter:
+    def __init__(self, sink: IO[bytes]):
+        super().__init__()
+        self.stream = io.TextIOWrapper(
+            sink, encoding="utf-8", newline="", write_through=True
+        )
+        self.writer = csv.writer(self.stream)
+        self.writer.writerow(COLUMNS)
+
+    def write_batch(self, batch: List[ScalarRow]):
+        self.writer.writerows(batch)
+
+    def close(self):
+        self.stream.flush()
+        # The sink belongs to the caller, it must not be closed with the wrapper.
+        self.stream.detach()
+
+
+class ArrowWriter:
+    """
+    Writes the rows as Parquet or Arrow IPC file, one record batch (row group) per
+    batch of rows.
+
+    Requires pyarrow
+    """
+
+    def __init__(self, sink: IO[bytes], format: str = "parquet"):
+        super().__init__()
+        assert HAS_PYARROW, "Exporting to {} requires pyarrow to be installed".format(
+            format
+        )
+        self.schema = pa.schema(
+            [
+                ("name", pa.string()),
+                ("category", pa.string()),
+                ("step", pa.int64()),
+                ("value", pa.float64()),
+            ]
+        )
+        if format == "parquet":
+            self.writer = pq.ParquetWriter(sink, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(sink, self.schema)
+
+    def write_batch(self, batch: List[ScalarRow]):
+        columns = [
+            pa.array([row[i] for row in batch], type=field.type)
+            for i, field in enumerate(self.schema)
+        ]
+        self.writer.write_batch(pa.record_batch(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def create_writer(sink: IO[bytes], format: str) -> Union[CsvWriter, ArrowWriter]:
+    if format == "csv":
+        return CsvWriter(sink)
+    elif format in ["parquet", "arrow"]:
+        return ArrowWriter(sink, format=format)
+    else:
+        raise ValueError(
+            "format must be one of {} - got {}".format(
+                " | ".join(EXPORT_FORMATS), format
+            )
+        )
+
+
+class BufferSink(io.RawIOBase):
+    """
+    Sink that keeps what has been written until it is taken, which allows to send it
+    in chunks, e.g. as part of a response.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        chunk = bytes(b)
+        self.chunks.append(chunk)
+        self.position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_scalars(
+    rows: Iterator[ScalarRow],
+    sink: IO[bytes],
+    format: str = "csv",
+    batch_size: int = default_batch_size,
+) -> int:
+    """
+    Exports the scalars as a table with the columns: name, category, step and value.
+
+    The rows are written in batches, hence only one batch is in memory at a time.
+
+    Arguments:
+        rows (Iterator[ScalarRow]):
+            Rows of the scalars, e.g. from iter_log_dir_scalars()
+        sink (IO[bytes]):
+            Binary file-like object to write to
+        format (str):
+            Format of the table, one of: "csv" | "parquet" | "arrow"
+            Parquet and Arrow require pyarrow.
+            [Default: "csv"]
+        batch_size (int):
+            Number of rows written at once
+            [Default: 10000]
+
+    Returns:
+        num_rows (int):
+            Number of exported rows
+    """
+    writer = create_writer(sink, format)
+    num_rows = 0
+    try:
+        for batch in iter_batches(rows, batch_size=batch_size):
+            writer.write_batch(batch)
+            num_rows += len(batch)
+    finally:
+        writer.close()
+    return num_rows
+
+
+def infer_format(path: str) -> str:
+    _, ext = os.path.splitext(path)
+    format = FORMAT_EXTENSIONS.get(ext.lower())
+    if format is not None:
+        return format
+    # Without a known extension, it's the best format that is available.
+    return "parquet" if HAS_PYARROW else "csv"
+
+
+def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="lavd export",
+        description="Exports the scalars of the experiments as a table",
+    )
+    parser.add_argument(
+        "log_dir", metavar="LOG_DIR", help="Directory containing the logs"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        required=True,
+        help="Path of the output file or - for STDOUT",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="format",
+        choices=EXPORT_FORMATS,
+        help=(
+            "Format of the output, Parquet and Arrow require pyarrow "
+            "[Default: inferred from the extension of the output]"
+        ),
+    )
+    parser.add_argument(
+        "-n",
+        "--name",
+        dest="names",
+        nargs="+",
+        metavar="NAME",
+        help="Names of the experiments to export [Default: all]",
+    )
+    parser.add_argument(
+        "--pattern",
+        dest="pattern",
+        help="Only export experiments whose names match the regular expression",
+    )
+    parser.add_argument(
+        "-c",
+        "--category",
+        dest="categories",
+        nargs="+",
+        metavar="PREFIX",
+        help="Prefixes of the scalars to export [Default: all]",
+    )
+    parser.add_argument("--start", dest="start", help="First step to export")
+    parser.add_argument("--end", dest="end", help="Last step to export (inclusive)")
+    parser.add_argument(
+        "--batch-size",
+        dest="batch_size",
+        type=int,
+        default=default_batch_size,
+        help="Number of rows written at once [Default: {}]".format(default_batch_size),
+    )
+    return parser.parse_args(args)
+
+
+def main(args: Optional[List[str]] = None):
+    options = parse_args(args)
+    format = options.format
+    if format is None:
+        format = "csv" if options.output == "-" else infer_format(options.output)
+    if format != "csv" and not HAS_PYARROW:
+        sys.exit(
+            "Exporting to {} requires pyarrow, install it or use --format csv".format(
+                format
+            )
+        )
+    try:
+        selection = parse_selection(
+            names=options.names,
+            pattern=options.pattern,
+            categories=options.categories,
+            start=options.start,
+            end=options.end,
+        )
+    except ValueError as e:
+        sys.exit(str(e))
+    rows = iter_log_dir_scalars(options.log_dir, selection)
+    if options.output == "-":
+        export_scalars(
+            rows, sys.stdout.buffer, format=format, batch_size=options.batch_size
+        )
+    else:
+        with open(options.output, "wb") as fd:
+            num_rows = export_scalars(
+                rows, fd, format=format, batch_size=options.batch_size
+            )
+        print("Exported {} scalars to {}".format(num_rows, options.output))
@@ -27,11 +27,23 @@ EXTENSIONS = dict(
         ".jpx",
         ".jpm",
         ".mj2",
+        ".webp",
     ],
 )
 
 SAVE_ALL_EXTENSIONS = [".gif", ".tiff", ".tif"]
 
+# Directory of an experiment, where the blobs of deduplicated checkpoints are stored,
+# which are referenced by the manifests.
+BLOBS_DIR = ".blobs"
+MANIFEST_EXTENSION = ".manifest"
+
+# Directory of a compacted experiment, containing the consolidated scalars and images,
+# as well as the bundle, where the texts and markdown are packed.
+COMPACT_DIR = ".lavd"
+COMPACT_FILE = "compact.json"
+BUNDLE_EXTENSION = ".dat"
+
 
 def categorise_file(path: Union[str, os.PathLike]) -> Optional[str]:
     lower_case = os.fspath(path).lower()
@@ -0,0 +1,43 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Union
+
+
+def load_json(path: Union[str, os.PathLike]) -> Dict:
+    try:
+        with open(path, "r", encoding="utf-8") as fd:
+            json_data = json.load(fd)
+            if isinstance(json_data, dict):
+                return json_data
+            else:
+                return {}
+    except json.JSONDecodeError:
+        return {}
+
+
+def write_json(data: Dict, path: Union[str, os.PathLike], merge: bool = True):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.is_file():
+        out = load_json(path)
+        out.update(data)
+    else:
+        out = data
+    with open(path, "w", encoding="utf-8") as fd:
+        json.dump(out, fd)
+
+
+def write_text_file(
+    content: str,
+    path: Union[str, os.PathLike],
+    append: bool = False,
+    ensure_newline: bool = True,
+):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    mode = "a" if append else "w"
+    with open(path, mode, encoding="utf-8") as fd:
+        fd.write(content)
+        if not content.endswith("\n"):
+            fd.write("\n")
@@ -1,55 +1,48 @@
 import base64
-import csv
 import errno
 import io
-import json
 import os
+import queue
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Callable, Dict, List, Optional, Set, Union
 
 from PIL import Image
 from tornado import locks
 from watchdog import events
 from watchdog.observers import Observer
+from watchdog.observers.api import ObservedWatch
 
+from .compact import CompactedExperiment, read_compacted
 from .data import Data
-from .file_types import categorise_file
+from .file_types import BLOBS_DIR, COMPACT_DIR, COMPACT_FILE, categorise_file
+
+# Re-exported from here, since they used to be defined in this module.
+from .files import load_json, write_json, write_text_file  # noqa: F401
+from .items import FileRef, read_log_file
+from .search import SearchIndex
 
 MAX_TEXT_LEN = 1024
 MAX_LINES = 100
+MAX_LOG_SIZE = 64 * 1024
 
 
-def load_json(path: Union[str, os.PathLike]) -> Dict:
-    try:
-        with open(path, "r", encoding="utf-8") as fd:
-            json_data = json.load(fd)
-            if isinstance(json_data, dict):
-                return json_data
-            else:
-                return {}
-    except json.JSONDecodeError:
-        return {}
-
-
-def read_text_file(path: Union[str, os.PathLike]) -> str:
+def read_text_unless_large(path: Union[str, os.PathLike]) -> Optional[str]:
+    # Only reads one character more than the maximum length, which is enough to know
+    # that it is too long, regardless of the size of the file.
     with open(path, "r", encoding="utf-8") as fd:
-        return fd.read()
+        text = fd.read(MAX_TEXT_LEN + 1)
+    return None if len(text) > MAX_TEXT_LEN else text
 
 
-def read_log_file(path: Union[str, os.PathLike]) -> Dict[str, List[Dict]]:
-    lines = []
-    with open(path, "r", encoding="utf-8") as fd:
-        reader = csv.reader(fd, delimiter="\t", quoting=csv.QUOTE_NONE, quotechar=None)
-        for line in reader:
-            if len(line) == 0:
-                lines.append({"message": ""})
-            elif len(line) == 1:
-                lines.append({"message": line[0]})
-            elif len(line) == 2:
-                lines.append({"message": line[1], "timestamp": line[0]})
-            else:
-                lines.append({"message": line[2], "timestamp": line[0], "tag": line[1]})
-    return {"lines": lines}
+def read_log_unless_large(path: Union[str, os.PathLike]) -> Optional[Dict]:
+    # Larger files are not parsed, even if they had few lines, they would be too large
+    # to be sent with the rest of the data.
+    if os.path.getsize(path) > MAX_LOG_SIZE:
+        return None
+    logs = read_log_file(path)
+    return None if len(logs["lines"]) > MAX_LINES else logs
 
 
 def prepare_image(
@@ -89,6 +82,25 @@ def list_experiments(path: Union[str, os.PathLike]) -> List[str]:
     return dir_names
 
 
+def get_last_modified(path: Union[str, os.PathLike]) -> float:
+    """
+    Approximates when an experiment was last modified, by looking at the directory
+    itself and its direct children (e.g. the step directories and global files).
+
+    This avoids walking the whole tree, but still catches the usual activity, since
+    new steps create new directories and the global log files are appended to.
+    """
+    latest = os.stat(path).st_mtime
+    with os.scandir(os.fspath(path)) as entries:
+        for entry in entries:
+            try:
+                latest = max(latest, entry.stat(follow_symlinks=False).st_mtime)
+            except OSError:
+                # The entry might have been removed in the meantime.
+                continue
+    return latest
+
+
 def insert_file(
     data: Data,
     abs_path: Union[str, os.PathLike],
@@ -109,14 +121,18 @@ def insert_file(
             text_len = len(text_dict.get("actual", "")) + len(
                 text_dict.get("expeted", "")
             )
-            data.set(
-                "texts",
-                name,
-                step,
-                category,
-                text_dict,
-                truncate=text_len > MAX_TEXT_LEN,
-            )
+            if text_len > MAX_TEXT_LEN:
+                # Large items are only kept as a reference and loaded when requested.
+                data.set(
+                    "texts",
+                    name,
+                    step,
+                    category,
+                    FileRef.from_file(abs_path, "json", key="texts"),
+                    truncate=True,
+                )
+            else:
+                data.set("texts", name, step, category, text_dict)
         image_dict = json_data.get("images")
         if isinstance(image_dict, dict):
             image_source = image_dict.get("source")
@@ -136,35 +152,94 @@ def insert_file(
             if old_image is None or old_image.get("source") != image.get("source"):
                 data.set("images", name, step, category, image)
     elif file_category == "text":
-        text = read_text_file(abs_path)
-        data.set(
-            "texts",
-            name,
-            step,
-            category,
-            {"actual": text},
-            truncate=len(text) > MAX_TEXT_LEN,
-        )
+        text = read_text_unless_large(abs_path)
+        if text is None:
+            data.set(
+                "texts",
+                name,
+                step,
+                category,
+                FileRef.from_file(abs_path, "text"),
+                truncate=True,
+            )
+        else:
+            data.set("texts", name, step, category, {"actual": text})
     elif file_category == "log":
-        logs = read_log_file(abs_path)
-        data.set(
-            "logs",
-            name,
-            step,
-            category,
-            logs,
-            truncate=len(logs["lines"]) > MAX_LINES,
-        )
+        logs = read_log_unless_large(abs_path)
+        if logs is None:
+            data.set(
+                "logs",
+                name,
+                step,
+                category,
+                FileRef.from_file(abs_path, "log"),
+                truncate=True,
+            )
+        else:
+            data.set("logs", name, step, category, logs)
     elif file_category == "markdown":
-        markdown = read_text_file(abs_path)
-        data.set(
-            "markdown",
-            name,
-            step,
-            category,
-            {"raw": markdown},
-            truncate=len(markdown) > MAX_TEXT_LEN,
+        markdown = read_text_unless_large(abs_path)
+        if markdown is None:
+            data.set(
+                "markdown",
+                name,
+                step,
+                category,
+                FileRef.from_file(abs_path, "markdown"),
+                truncate=True,
+            )
+        else:
+            data.set("markdown", name, step, category, {"raw": markdown})
+
+
+def insert_compacted(
+    data: Data,
+    compacted: CompactedExperiment,
+    abs_path: Union[str, os.PathLike],
+    name: str,
+    root: Union[str, os.PathLike] = "",
+    step: Optional[Union[str, int]] = None,
+    category: Optional[str] = None,
+    is_dir: bool = False,
+):
+    """
+    Inserts the compacted data of an experiment, optionally only of one step and one
+    category, or all categories within it, if it is a directory.
+    """
+    abs_path = Path(abs_path)
+    items = (
+        compacted.items()
+        if step is None
+        else (
+            (kind, step, item_category, item)
+            for kind, item_category, item in compacted.items_of_step(step)
         )
+    )
+    for kind, item_step, item_category, item in items:
+        if category is not None and item_category != category:
+            if not (is_dir and item_category.startswith(category + "/")):
+                continue
+        if kind == "images":
+            image_source = item.get("source")
+            if not image_source:
+                continue
+            # The sources of the compacted images are relative to the experiment.
+            image = prepare_image(abs_path / image_source, root=root)
+            if image is None:
+                continue
+            item = dict(item, **image)
+        truncate = False
+        if isinstance(item, FileRef):
+            # Large items are only referenced in the bundle.
+            truncate = True
+        elif kind == "texts":
+            truncate = (
+                len(item.get("actual", "")) + len(item.get("expected", ""))
+                > MAX_TEXT_LEN
+            )
+        elif kind == "markdown":
+            truncate = len(item.get("raw", "")) > MAX_TEXT_LEN
+        data.set(kind, name, item_step, item_category, item, truncate=truncate)
 
 
 def gather_files(
@@ -213,6 +288,15 @@ def gather_experiment(
     _, dir_names, file_names = next(os.walk(abs_path))
     if "command.json" in file_names:
         data.set_command(name, load_json(abs_path / "command.json"))
+    # The files that have not been compacted are gathered afterwards, they take
+    # precedence, as they have been logged after the experiment was compacted.
+    compacted = (
+        read_compacted(abs_path, max_inline_size=MAX_TEXT_LEN)
+        if COMPACT_DIR in dir_names
+        else None
+    )
+    if compacted is not None:
+        insert_compacted(data, compacted, abs_path, name=name, root=root)
     # isdigit is only true for non-negative integers, so exactly what the steps can be.
     step_dirs = [d for d in dir_names if d.isdigit()]
     for step_dir in step_dirs:
@@ -224,7 +308,14 @@ def gather_experiment(
             root=root,
         )
     gather_files(
-        data, abs_path, step="global", root=root, name=name, ignore_dirs=step_dirs
+        data,
+        abs_path,
+        step="global",
+        root=root,
+        name=name,
+        # The blobs of the checkpoints are not part of the data and the compacted data
+        # has already been inserted.
+        ignore_dirs=step_dirs + [BLOBS_DIR, COMPACT_DIR],
     )
 
 
@@ -232,24 +323,178 @@ def gather_data(path: Union[str, os.PathLike]) -> Data:
     data = Data()
     abs_path = Path(path).absolute()
     experiment_names = list_experiments(abs_path)
-    for experiment_name in experiment_names:
-        # The experiment name is always added, to also include empty experiments.
-        data.add_name(experiment_name)
-        experiment_path = abs_path / experiment_name
-        gather_experiment(data, experiment_path, name=experiment_name, root=abs_path)
+    with data.transaction():
+        for experiment_name in experiment_names:
+            # The experiment name is always added, to also include empty experiments.
+            data.add_name(experiment_name)
+            experiment_path = abs_path / experiment_name
+            gather_experiment(
+                data, experiment_path, name=experiment_name, root=abs_path
+            )
     return data
 
 
 class FileWatcherHandler(events.FileSystemEventHandler):
-    """Handler for file events"""
+    """
+    Handler for file events
+
+    The events are not handled by the observer itself, but collected and applied in
+    batches by a separate thread, each batch as one transaction. Every write outside
+    of a transaction copies the dictionaries along its path, including all steps of
+    the category, hence applying the events one by one would make logging a step
+    proportional to the number of steps that have already been logged.
+    """
 
     def __init__(
-        self, log_dir: Union[str, os.PathLike], data: Data, update_lock: locks.Condition
+        self,
+        log_dir: Union[str, os.PathLike],
+        data: Data,
+        update_lock: locks.Condition,
+        on_new_experiment: Optional[Callable[[str], None]] = None,
+        search_index: Optional[SearchIndex] = None,
+        batch_interval: float = 0.1,
     ):
+        """
+        Arguments:
+            log_dir (str | os.PathLike):
+                Directory containing the logs
+            data (Data):
+                Data that is kept up to date with the changes
+            update_lock (locks.Condition):
+                Condition that is notified whenever the data changed
+            on_new_experiment (Callable[[str], None], optional):
+                Function that is called with the name of every new experiment
+            search_index (SearchIndex, optional):
+                Search index that is updated after every batch of changes.
+            batch_interval (float):
+                Number of seconds to wait for more events after the first one, which
+                are all applied at once.
+                [Default: 0.1]
+        """
         super().__init__()
         self.data = data
         self.log_dir = Path(log_dir).absolute()
         self.update_lock = update_lock
+        self.on_new_experiment = on_new_experiment
+        self.search_index = search_index
+        self.batch_interval = batch_interval
+        # Compacted data of the experiments, which is needed to restore the data when
+        # files are removed, since they are removed once they have been compacted.
+        self.compacted: Dict[str, Optional[CompactedExperiment]] = {}
+        # None marks the end, after which no more events are handled.
+        self.event_queue: queue.Queue = queue.Queue()
+        # Thread that is currently applying a batch, whose notifications are deferred
+        # until the whole batch is visible.
+        self.batch_thread: Optional[int] = None
+        self.has_changes = False
+        self.batch_worker = threading.Thread(target=self.process_events, daemon=True)
+        self.batch_worker.start()
+
+    def dispatch(self, event: events.FileSystemEvent):
+        self.event_queue.put(event)
+
+    def next_batch(self) -> Optional[List[events.FileSystemEvent]]:
+        event = self.event_queue.get()
+        if event is None:
+            return None
+        batch = [event]
+        deadline = time.monotonic() + self.batch_interval
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                event = self.event_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if event is None:
+                # The events that have already been received are still handled.
+                self.event_queue.put(None)
+                break
+            batch.append(event)
+        return batch
+
+    def process_events(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+            self.batch_thread = threading.get_ident()
+            try:
+                with self.data.transaction():
+                    for event in batch:
+                        try:
+                            super().dispatch(event)
+                        except (OSError, ValueError) as e:
+                            # The files may be removed or incomplete while handling
+                            # them, which must not prevent the other events of the
+                            # batch from being applied.
+                            print(
+                                "⚠️ Failed to update {}: {}".format(event.src_path, e)
+                            )
+            finally:
+                self.batch_thread = None
+            if self.has_changes:
+                self.has_changes = False
+                self.notify_change()
+                # The index is updated after notifying, so that it does not delay the
+                # updates. If it is busy, e.g. while it is being built, the changes
+                # are indexed by the next update instead.
+                if self.search_index is not None:
+                    self.search_index.sync(self.data, blocking=False)
+
+    def stop(self):
+        self.event_queue.put(None)
+
+    def get_compacted(self, name: str) -> Optional[CompactedExperiment]:
+        if name not in self.compacted:
+            self.compacted[name] = read_compacted(
+                self.log_dir / name, max_inline_size=MAX_TEXT_LEN
+            )
+        return self.compacted[name]
+
+    def update_compacted(self, name: str):
+        old_compacted = self.compacted.pop(name, None)
+        compacted = self.get_compacted(name)
+        with self.data.transaction():
+            if old_compacted is not None:
+                for kind, step, category, _ in old_compacted.items():
+                    self.data.remove(name, step=step, category=category, kind=kind)
+            if compacted is not None:
+                insert_compacted(
+                    self.data,
+                    compacted,
+                    self.log_dir / name,
+                    name=name,
+                    root=self.log_dir,
+                )
+        self.notify_change()
+
+    def restore_compacted(
+        self,
+        name: str,
+        step: Union[str, int],
+        category: Optional[str] = None,
+        is_dir: bool = False,
+    ):
+        compacted = self.get_compacted(name)
+        if compacted is not None:
+            insert_compacted(
+                self.data,
+                compacted,
+                self.log_dir / name,
+                name=name,
+                root=self.log_dir,
+                step=step,
+                category=category,
+                is_dir=is_dir,
+            )
+
+    def notify_change(self):
+        if self.batch_thread == threading.get_ident():
+            self.has_changes = True
+            return
+        self.update_lock.notify_all()
 
     def update_file(self, abs_path: Union[str, os.PathLike]):
         abs_path = Path(abs_path)
@@ -257,9 +502,18 @@ class FileWatcherHandler(events.FileSystemEventHandler):
         parts = rel_path.parts
         # Files depending on their paths
         # filename (ignored)
+        # name, .blobs, */file (ignored)
+        # name, .lavd, compact.json (compacted data of name)
         # name, file (global of name)
         # name, i, */file (step i of name)
         # name, dir, */file (global but nested of name)
+        if len(parts) >= 3 and parts[1] == BLOBS_DIR:
+            return
+        if len(parts) >= 3 and parts[1] == COMPACT_DIR:
+            # The bundle is always written before the compact file, which refers to it.
+            if len(parts) == 3 and parts[2] == COMPACT_FILE:
+                self.update_compacted(parts[0])
+            return
         if len(parts) == 2:
             name, file_name = parts
             if file_name == "command.json":
@@ -276,7 +530,7 @@ class FileWatcherHandler(events.FileSystemEventHandler):
                     file_category,
                     root=self.log_dir,
                 )
-            self.update_lock.notify_all()
+            self.notify_change()
         elif len(parts) >= 3:
             name, first_dir, *rest = parts
             if first_dir.isdigit():
@@ -298,7 +552,7 @@ class FileWatcherHandler(events.FileSystemEventHandler):
                 file_category,
                 root=self.log_dir,
             )
-            self.update_lock.notify_all()
+            self.notify_change()
 
     def remove_file(self, abs_path: Union[str, os.PathLike], is_dir: bool = False):
         abs_path = Path(abs_path)
@@ -307,7 +561,7 @@ class FileWatcherHandler(events.FileSystemEventHandler):
             if str(rel_path) == ".":
                 # Resetting the data, since the whole directory is removed.
                 self.data.remove()
-                self.update_lock.notify_all()
+                self.notify_change()
                 return
             parts = rel_path.parts
             # Directories depending on their paths
@@ -318,14 +572,24 @@ class FileWatcherHandler(events.FileSystemEventHandler):
             # name, dir, category (global but nested of name)
             if len(parts) == 1:
                 self.data.remove(parts[0])
+                self.compacted.pop(parts[0], None)
+            elif len(parts) >= 2 and parts[1] == COMPACT_DIR:
+                if len(parts) == 2:
+                    self.update_compacted(parts[0])
+                return
             elif len(parts) == 2:
                 name, first_dir = parts
-                if first_dir.isdigit():
-                    self.data.remove(name, step=int(first_dir), is_dir=True)
-                else:
-                    self.data.remove(
-                        name, step="global", category=first_dir, is_dir=True
-                    )
+                with self.data.transaction():
+                    if first_dir.isdigit():
+                        self.data.remove(name, step=int(first_dir), is_dir=True)
+                        self.restore_compacted(name, step=int(first_dir))
+                    else:
+                        self.data.remove(
+                            name, step="global", category=first_dir, is_dir=True
+                        )
+                        self.restore_compacted(
+                            name, step="global", category=first_dir, is_dir=True
+                        )
             elif len(parts) >= 3:
                 name, first_dir, *rest = parts
                 if first_dir.isdigit():
@@ -334,10 +598,18 @@ class FileWatcherHandler(events.FileSystemEventHandler):
                 else:
                     step = "global"
                     category = Path(first_dir, *rest).as_posix()
-                self.data.remove(name, step=step, category=category, is_dir=True)
-            self.update_lock.notify_all()
+                with self.data.transaction():
+                    self.data.remove(name, step=step, category=category, is_dir=True)
+                    self.restore_compacted(
+                        name, step=step, category=category, is_dir=True
+                    )
+            self.notify_change()
 
         else:
+            if len(rel_path.parts) >= 2 and rel_path.parts[1] == COMPACT_DIR:
+                if rel_path.parts[2:] == (COMPACT_FILE,):
+                    self.update_compacted(rel_path.parts[0])
+                return
             file_category = categorise_file(rel_path)
             # The extension needs to be removed, since the categories do not include the
             # extension
@@ -362,8 +634,14 @@ class FileWatcherHandler(events.FileSystemEventHandler):
                 if file_name == "command":
                     self.data.remove_command(name)
                 else:
-                    self.data.remove(name, step="global", category=file_name, kind=kind)
-                self.update_lock.notify_all()
+                    # Files that have been compacted are removed, but their data
+                    # must remain.
+                    with self.data.transaction():
+                        self.data.remove(
+                            name, step="global", category=file_name, kind=kind
+                        )
+                        self.restore_compacted(name, step="global", category=file_name)
+                self.notify_change()
             elif len(parts) >= 3:
                 name, first_dir, *rest = parts
                 if first_dir.isdigit():
@@ -372,8 +650,10 @@ class FileWatcherHandler(events.FileSystemEventHandler):
                 else:
                     step = "global"
                     category = Path(first_dir, *rest).as_posix()
-                self.data.remove(name, step=step, category=category, kind=kind)
-                self.update_lock.notify_all()
+                with self.data.transaction():
+                    self.data.remove(name, step=step, category=category, kind=kind)
+                    self.restore_compacted(name, step=step, category=category)
+                self.notify_change()
 
     def on_created(self, event: Union[events.DirCreatedEvent, events.FileCreatedEvent]):
         full_path = Path(event.src_path)
@@ -382,7 +662,9 @@ class FileWatcherHandler(events.FileSystemEventHandler):
             # Creating directory only adds the experiment if it didn't exist, but once
             # it exists there are no further changes
             self.data.add_name(rel_path.parts[0])
-            self.update_lock.notify_all()
+            self.notify_change()
+            if len(rel_path.parts) == 1 and self.on_new_experiment is not None:
+                self.on_new_experiment(rel_path.parts[0])
         elif isinstance(event, events.FileCreatedEvent):
             self.update_file(full_path)
 
@@ -415,7 +697,9 @@ class FileWatcherHandler(events.FileSystemEventHandler):
             new_parts = new_rel_path.parts
             if len(new_parts) == 1:
                 self.data.add_name(new_parts[0])
-                self.update_lock.notify_all()
+                self.notify_change()
+                if self.on_new_experiment is not None:
+                    self.on_new_experiment(new_parts[0])
         elif isinstance(event, events.FileMovedEvent):
             # Files are always updated
             self.remove_file(old_path)
@@ -423,22 +707,75 @@ class FileWatcherHandler(events.FileSystemEventHandler):
 
 
 class FileWatcher:
-    """FileWatcher that watches the file system for changes in the logged data"""
+    """
+    FileWatcher that watches the file system for changes in the logged data
+
+    By default the whole log directory is watched recursively. When an active window
+    is given, only the log directory itself is watched non-recursively, and just the
+    experiments that have been modified within that window are watched recursively.
+    Experiments that become stale are demoted (their watch is removed) and the ones
+    that become active again are promoted and rescanned, since any changes while they
+    were not watched would have been missed otherwise.
+    """
 
     def __init__(
-        self, log_dir: Union[str, os.PathLike], data: Data, update_lock: locks.Condition
+        self,
+        log_dir: Union[str, os.PathLike],
+        data: Data,
+        update_lock: locks.Condition,
+        active_window: Optional[float] = None,
+        check_interval: float = 60.0,
+        search_index: Optional[SearchIndex] = None,
     ):
+        """
+        Arguments:
+            log_dir (str | os.PathLike):
+                Directory containing the logs
+            data (Data):
+                Data that is kept up to date with the changes
+            update_lock (locks.Condition):
+                Condition that is notified whenever the data changed
+            active_window (float):
+                Number of seconds since the last modification for which an experiment
+                is considered active and therefore watched recursively. If not
+                specified, everything is watched recursively.
+                [Default: None]
+            check_interval (float):
+                Number of seconds between checking which experiments are active. Only
+                used when active_window is given.
+                [Default: 60.0]
+            search_index (SearchIndex, optional):
+                Search index that is kept up to date with the changes.
+        """
         super().__init__()
         self.data = data
         self.log_dir = Path(log_dir).absolute()
         self.update_lock = update_lock
+        self.active_window = active_window
+        self.check_interval = check_interval
+        self.active_watches: Dict[str, ObservedWatch] = {}
+        self.pending_watches: Set[str] = set()
+        self.watches_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.activity_thread: Optional[threading.Thread] = None
         self.observer = Observer()
-        self.observer.schedule(
-            FileWatcherHandler(self.log_dir, self.data, self.update_lock),
+        self.handler = FileWatcherHandler(
             self.log_dir,
-            recursive=True,
+            self.data,
+            self.update_lock,
+            on_new_experiment=None if active_window is None else self.promote,
+            search_index=search_index,
         )
         try:
+            if self.active_window is None:
+                self.observer.schedule(
+                    self.handler, os.fspath(self.log_dir), recursive=True
+                )
+            else:
+                self.observer.schedule(
+                    self.handler, os.fspath(self.log_dir), recursive=False
+                )
+                self.update_active_experiments(rescan=False)
             self.observer.start()
         except OSError as err:
             if err.errno == errno.ENOSPC:
@@ -449,42 +786,111 @@ class FileWatcher:
                     "\n"
                     "  sudo sysctl fs.inotify.max_user_watches=524288\n"
                     "\n"
+                    "Or only watch the active experiments with: --active-window\n"
+                    "\n"
                     "See also: "
                     "https://github.com/jungomi/lavd#inotify-watch-limit-reached"
                 ).format(err.strerror)
                 raise OSError(err.errno, msg)
             else:
                 raise err
+        if self.active_window is not None:
+            self.activity_thread = threading.Thread(
+                target=self.check_activity, daemon=True
+            )
+            self.activity_thread.start()
+
+    def is_active(self, name: str) -> bool:
+        assert self.active_window is not None
+        try:
+            last_modified = get_last_modified(self.log_dir / name)
+        except OSError:
+            return False
+        return time.time() - last_modified <= self.active_window
+
+    def promote(self, name: str, rescan: bool = True):
+        """
+        Starts watching the experiment recursively.
+
+        Arguments:
+            name (str):
+                Name of the experiment
+            rescan (bool):
+                Whether to scan the files of the experiment again, which is necessary
+                if it was not watched before, as changes might have been missed.
+                [Default: True]
+        """
+        experiment_path = self.log_dir / name
+        # The lock is not held while scheduling the watch, because the observer holds
+        # its own lock while dispatching the events, which may promote an experiment.
+        with self.watches_lock:
+            if name in self.active_watches or name in self.pending_watches:
+                return
+            if not experiment_path.is_dir():
+                return
+            self.pending_watches.add(name)
+        try:
+            watch = self.observer.schedule(
+                self.handler, os.fspath(experiment_path), recursive=True
+            )
+        finally:
+            with self.watches_lock:
+                self.pending_watches.discard(name)
+        with self.watches_lock:
+            self.active_watches[name] = watch
+        if rescan:
+            # Replaces the experiment at once, rather than being visible as empty while
+            # it is being scanned.
+            with self.data.transaction():
+                self.data.remove(name)
+                self.data.add_name(name)
+                gather_experiment(
+                    self.data, experiment_path, name=name, root=self.log_dir
+                )
+            self.handler.notify_change()
+
+    def demote(self, name: str):
+        """
+        Stops watching the experiment recursively.
+
+        Arguments:
+            name (str):
+                Name of the experiment
+        """
+        with self.watches_lock:
+            watch = self.active_watches.pop(name, None)
+        if watch is None:
+            return
+        try:
+            self.observer.unschedule(watch)
+        except KeyError:
+            # The watch is already gone, e.g. when the directory was removed.
+            pass
+
+    def update_active_experiments(self, rescan: bool = True):
+        names = list_experiments(self.log_dir)
+        for name in names:
+            if self.is_active(name):
+                self.promote(name, rescan=rescan)
+            else:
+                self.demote(name)
+        # Experiments that no longer exist are no longer watched.
+        for name in set(self.active_watches) - set(names):
+            self.demote(name)
+
+    def check_activity(self):
+        while not self.stop_event.wait(self.check_interval):
+            try:
+                self.update_active_experiments()
+            except OSError:
+                # The log directory might temporarily be unavailable, which is just
+                # tried again on the next check.
+                continue
 
     def stop(self):
+        self.stop_event.set()
         self.observer.stop()
+        self.handler.stop()
 
     def __del__(self):
         self.stop()
-
-
-def write_json(data: Dict, path: Union[str, os.PathLike], merge: bool = True):
-    path = Path(path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    if path.is_file():
-        out = load_json(path)
-        out.update(data)
-    else:
-        out = data
-    with open(path, "w", encoding="utf-8") as fd:
-        json.dump(out, fd)
-
-
-def write_text_file(
-    content: str,
-    path: Union[str, os.PathLike],
-    append: bool = False,
-    ensure_newline: bool = True,
-):
-    path = Path(path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    mode = "a" if append else "w"
-    with open(path, mode, encoding="utf-8") as fd:
-        fd.write(content)
-        if not content.endswith("\n"):
-            fd.write("\n")
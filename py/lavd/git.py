@@ -0,0 +1,194 @@
+import functools
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+# Full commit hash, SHA-1 (40) or SHA-256 (64) for repositories using the newer format.
+hash_regex = re.compile(r"[0-9a-f]{40}([0-9a-f]{24})?")
+
+
+class GitInfo(NamedTuple):
+    repo_path: Optional[Path] = None
+    hash: Optional[str] = None
+    branch: Optional[str] = None
+
+
+def find_git_dir(path: Path) -> Optional[Tuple[Path, Path]]:
+    """
+    Finds the repository that contains the path, by looking for the .git directory in
+    the path or any of its parents.
+
+    Returns:
+        repo_path_and_git_dir (Tuple[Path, Path], optional):
+            The root of the repository and its git directory, or None if there is no
+            repository.
+    """
+    for dir in [path, *path.parents]:
+        dot_git = dir / ".git"
+        if dot_git.is_dir():
+            return dir, dot_git
+        elif dot_git.is_file():
+            # Worktrees and submodules have a .git file pointing to the git directory.
+            with open(dot_git, "r", encoding="utf-8") as fd:
+                content = fd.read().strip()
+            if not content.startswith("gitdir:"):
+                return None
+            git_dir = Path(content[len("gitdir:") :].strip())
+            return dir, git_dir if git_dir.is_absolute() else dir / git_dir
+    return None
+
+
+def read_ref(git_dir: Path, ref: str) -> Optional[str]:
+    # Worktrees share the refs of the main repository, which is given by commondir.
+    common_dir = git_dir
+    common_dir_file = git_dir / "commondir"
+    if common_dir_file.is_file():
+        with open(common_dir_file, "r", encoding="utf-8") as fd:
+            common_dir = git_dir / fd.read().strip()
+    for dir in [git_dir, common_dir]:
+        ref_file = dir / ref
+        if ref_file.is_file():
+            with open(ref_file, "r", encoding="utf-8") as fd:
+                return fd.read().strip()
+    packed_refs = common_dir / "packed-refs"
+    if packed_refs.is_file():
+        with open(packed_refs, "r", encoding="utf-8") as fd:
+            for line in fd:
+                if line.startswith(("#", "^")):
+                    continue
+                hash, _, name = line.strip().partition(" ")
+                if name == ref:
+                    return hash
+    return None
+
+
+def read_git_info(path: Path) -> Optional[GitInfo]:
+    """
+    Reads the current commit and branch directly from the git directory, which avoids
+    spawning any git processes.
+
+    Returns:
+        info (GitInfo, optional):
+            Information about the repository or None if it could not be determined
+            by reading the files, e.g. symbolic refs that point to other symbolic refs.
+    """
+    found = find_git_dir(path)
+    if found is None:
+        return GitInfo()
+    repo_path, git_dir = found
+    with open(git_dir / "HEAD", "r", encoding="utf-8") as fd:
+        head = fd.read().strip()
+    if head.startswith("ref:"):
+        ref = head[len("ref:") :].strip()
+        hash = read_ref(git_dir, ref)
+        branch = ref[len("refs/heads/") :] if ref.startswith("refs/heads/") else ref
+    else:
+        # Detached HEAD, which is also what `git rev-parse --abbrev-ref HEAD` reports.
+        hash = head
+        branch = "HEAD"
+    # Anything else, such as a corrupt ref, is left to git to figure out.
+    if hash is None or hash_regex.fullmatch(hash) is None:
+        return None
+    return GitInfo(repo_path=repo_path, hash=hash, branch=branch)
+
+
+def run_git(*args: str, cwd: Optional[Union[str, os.PathLike]] = None) -> str:
+    return (
+        subprocess.check_output(["git", *args], cwd=cwd, stderr=subprocess.DEVNULL)
+        .strip()
+        .decode("utf-8")
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_git_info(path: Union[str, os.PathLike]) -> GitInfo:
+    """
+    Gets the repository, current commit and branch for the given path.
+
+    The information is cached for the whole process, since it is not expected to
+    change while it is running, e.g. many experiments in a hyperparameter sweep. The
+    files of the git directory are read directly when possible, otherwise git is used.
+
+    Arguments:
+        path (str | os.PathLike):
+            Path within the repository, usually the current working directory.
+
+    Returns:
+        info (GitInfo):
+            Information about the repository, where everything is None if the path
+            is not in a repository.
+    """
+    path = Path(path).absolute()
+    # An explicitly specified git directory is only respected by git itself.
+    if "GIT_DIR" not in os.environ:
+        try:
+            info = read_git_info(path)
+            if info is not None:
+                return info
+        except OSError:
+            pass
+    try:
+        repo_path = Path(run_git("rev-parse", "--show-toplevel", cwd=path))
+        return GitInfo(
+            repo_path=repo_path,
+            hash=run_git("rev-parse", "HEAD", cwd=repo_path),
+            branch=run_git("rev-parse", "--abbrev-ref", "HEAD", cwd=repo_path),
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return GitInfo()
+
+
+def compute_git_diff(repo_path: Optional[Path]) -> str:
+    if repo_path is None:
+        return ""
+    try:
+        # The diff contains the changes of files in any encoding, not just UTF-8.
+        return subprocess.check_output(
+            ["git", "diff", "HEAD"], cwd=repo_path, stderr=subprocess.DEVNULL
+        ).decode("utf-8", errors="replace")
+    except (subprocess.CalledProcessError, OSError):
+        return ""
+
+
+diff_futures: Dict[Optional[Path], Future] = {}
+diff_lock = threading.Lock()
+
+
+def prefetch_git_diff(repo_path: Optional[Path]) -> Future:
+    """
+    Starts computing the diff of the working tree in the background, unless it has
+    already been started for that repository.
+
+    The diff is cached for the whole process, hence it reflects the working tree at
+    the time it was first requested, which is closest to the code that is actually
+    running.
+
+    Returns:
+        future (Future[str]):
+            Future that is resolved with the diff
+    """
+    with diff_lock:
+        future = diff_futures.get(repo_path)
+        if future is not None:
+            return future
+        future = Future()
+        diff_futures[repo_path] = future
+
+    def compute():
+        # Any error must be set on the future, otherwise it would never be resolved
+        # and everyone waiting for the diff would be blocked forever.
+        try:
+            future.set_result(compute_git_diff(repo_path))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=compute, name="lavd-git-diff", daemon=True).start()
+    return future
+
+
+def get_git_diff(repo_path: Optional[Path]) -> str:
+    return prefetch_git_diff(repo_path).result()
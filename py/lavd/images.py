@@ -0,0 +1,164 @@
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, List, Union, cast
+
+from PIL import Image
+
+from .file_types import SAVE_ALL_EXTENSIONS
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+if TYPE_CHECKING:
+    import torch
+
+
+def is_tensor(value: Any) -> bool:
+    # If torch has not been imported, the value cannot be a tensor, which avoids
+    # importing torch just to check it.
+    torch_module = sys.modules.get("torch")
+    return torch_module is not None and isinstance(value, torch_module.Tensor)
+
+
+def save_image(image: Image.Image, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # The save_all is for animated images with multiple frames to save them as an
+    # animated image, otherwise only the first frame is saved.
+    image.save(path, save_all=path.suffix in SAVE_ALL_EXTENSIONS)
+
+
+def to_uint8_array(
+    image: Union["torch.Tensor", "np.ndarray"], copy: bool = False
+) -> "np.ndarray":
+    """
+    Converts a torch.Tensor or a np.array to a np.array with uint8 values, where the
+    channels are last, i.e. H x W x C (or N x H x W x C for batches).
+
+    Floating point values are expected to be in the range [0, 1], booleans are black
+    and white, and other integers are clipped to the range [0, 255].
+
+    Tensors are converted on their device and only the uint8 values are transferred to
+    the CPU. Nothing is copied if the array already has the correct type and layout,
+    unless copy=True, in which case the result never shares its memory with the
+    given image.
+    """
+    if is_tensor(image):
+        import torch
+
+        tensor = cast("torch.Tensor", image).detach()
+        converted = False
+        if tensor.dim() >= 3:
+            # Channels first to channels last
+            tensor = tensor.movedim(-3, -1)
+        if tensor.is_floating_point():
+            tensor = tensor.mul(255).clamp_(0, 255)
+            converted = True
+        elif tensor.dtype == torch.bool:
+            tensor = tensor.to(torch.uint8).mul_(255)
+            converted = True
+        elif tensor.dtype != torch.uint8:
+            tensor = tensor.clamp(0, 255)
+            converted = True
+        if tensor.dtype != torch.uint8:
+            tensor = tensor.to(torch.uint8)
+            converted = True
+        tensor = tensor.contiguous().cpu()
+        if copy and not converted:
+            tensor = tensor.clone()
+        return tensor.numpy()
+    assert HAS_NUMPY, "Images as NumPy array require numpy to be installed"
+    array = np.asarray(image)
+    if np.issubdtype(array.dtype, np.floating):
+        array = (np.clip(array, 0, 1) * 255).astype(np.uint8)
+    elif array.dtype == bool:
+        array = array.astype(np.uint8) * 255
+    elif array.dtype != np.uint8:
+        # Other integers, e.g. label maps, the same as the tensors.
+        array = np.clip(array, 0, 255).astype(np.uint8)
+    elif copy:
+        array = array.copy()
+    return array
+
+
+def array_to_pil(array: "np.ndarray") -> Image.Image:
+    # A single channel is a greyscale image, which PIL expects without the channel.
+    if array.ndim == 3 and array.shape[-1] == 1:
+        array = array[..., 0]
+    return Image.fromarray(array)
+
+
+def to_pil_image(
+    image: Union["torch.Tensor", "np.ndarray"], copy: bool = False
+) -> Image.Image:
+    """
+    Converts a torch.Tensor (C x H x W) or a np.array (H x W x C) to a PIL Image.
+    Floating point values are expected to be in the range [0, 1].
+    """
+    return array_to_pil(to_uint8_array(image, copy=copy))
+
+
+def to_pil_images(
+    images: Union[List[Image.Image], "torch.Tensor", "np.ndarray"],
+    copy: bool = False,
+) -> List[Image.Image]:
+    """
+    Converts a list of images or a batch of images to PIL Images.
+
+    Arguments:
+        images (List[PIL.Image] | torch.Tensor | np.array):
+            Images to convert, see Logger.log_images
+        copy (bool):
+            Whether to copy the images, so that they do not share their memory with
+            the given images, which may be modified by the caller afterwards, e.g.
+            when they are saved in the background.
+            [Default: False]
+
+    Returns:
+        pil_images (List[PIL.Image]):
+            The converted images
+    """
+    if isinstance(images, list):
+        return [
+            (
+                (image.copy() if copy else image)
+                if isinstance(image, Image.Image)
+                else to_pil_image(image, copy=copy)
+            )
+            for image in images
+        ]
+    # The whole batch is converted at once, and each image is just a view into it.
+    batch = to_uint8_array(images, copy=copy)
+    return [array_to_pil(array) for array in batch]
+
+
+def tile_images(
+    images: List[Image.Image], nrow: int = 8, padding: int = 2
+) -> Image.Image:
+    """
+    Tiles the images into a single image, with nrow images per row. All cells of the
+    grid have the size of the largest image.
+    """
+    assert len(images) > 0, "A grid requires at least one image"
+    width = max(image.width for image in images)
+    height = max(image.height for image in images)
+    num_cols = min(nrow, len(images))
+    num_rows = (len(images) + nrow - 1) // nrow
+    mode = "RGBA" if any(image.mode in ("RGBA", "LA") for image in images) else "RGB"
+    grid = Image.new(
+        mode,
+        (
+            num_cols * width + (num_cols + 1) * padding,
+            num_rows * height + (num_rows + 1) * padding,
+        ),
+    )
+    for i, image in enumerate(images):
+        row, col = divmod(i, nrow)
+        grid.paste(
+            image.convert(mode),
+            (padding + col * (width + padding), padding + row * (height + padding)),
+        )
+    return grid
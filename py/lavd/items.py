@@ -0,0 +1,206 @@
+import csv
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .files import load_json
+
+# Formats of the files that items can be loaded from.
+ITEM_FORMATS = ["text", "markdown", "log", "json"]
+
+default_cache_size = 256 * 1024 * 1024
+
+
+class FileRef(NamedTuple):
+    """
+    Reference to an item on disk, which is stored in the full data in place of items
+    that are too large to be kept in memory. They are only loaded when requested.
+
+    The size and modification time are part of the reference, so that it is no longer
+    equal to the previous one when the file changes.
+    """
+
+    path: str
+    format: str
+    # Key of the item in the JSON file, otherwise the whole file (or part of it) is the
+    # item.
+    key: Optional[str] = None
+    # Part of the file containing the item, e.g. in a bundle of compacted items.
+    # A length of -1 means until the end of the file.
+    offset: int = 0
+    length: int = -1
+    size: int = 0
+    mtime_ns: int = 0
+
+    @classmethod
+    def from_file(
+        cls,
+        path: Union[str, os.PathLike],
+        format: str,
+        key: Optional[str] = None,
+        offset: int = 0,
+        length: int = -1,
+    ) -> "FileRef":
+        stat = os.stat(path)
+        return cls(
+            path=os.fspath(path),
+            format=format,
+            key=key,
+            offset=offset,
+            length=length,
+            size=stat.st_size if length < 0 else length,
+            mtime_ns=stat.st_mtime_ns,
+        )
+
+
+def read_text_file(path: Union[str, os.PathLike]) -> str:
+    with open(path, "r", encoding="utf-8") as fd:
+        return fd.read()
+
+
+def parse_log_lines(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    reader = csv.reader(lines, delimiter="\t", quoting=csv.QUOTE_NONE, quotechar=None)
+    for line in reader:
+        if len(line) == 0:
+            yield {"message": ""}
+        elif len(line) == 1:
+            yield {"message": line[0]}
+        elif len(line) == 2:
+            yield {"message": line[1], "timestamp": line[0]}
+        else:
+            yield {"message": line[2], "timestamp": line[0], "tag": line[1]}
+
+
+def iter_log_lines(path: Union[str, os.PathLike]) -> Iterator[Dict[str, str]]:
+    with open(path, "r", encoding="utf-8") as fd:
+        yield from parse_log_lines(fd)
+
+
+def read_log_file(path: Union[str, os.PathLike]) -> Dict[str, List[Dict]]:
+    return {"lines": list(iter_log_lines(path))}
+
+
+def load_item(item: Any) -> Any:
+    """
+    Loads the item from disk if it is a reference, otherwise the item is returned as
+    it is.
+
+    Arguments:
+        item (Any):
+            Item of the data, which may be a reference to a file.
+
+    Returns:
+        item (Any):
+            The loaded item
+    """
+    if not isinstance(item, FileRef):
+        return item
+    if item.format == "text":
+        return {"actual": read_text_file(item.path)}
+    elif item.format == "markdown":
+        return {"raw": read_text_file(item.path)}
+    elif item.format == "log":
+        return read_log_file(item.path)
+    elif item.format == "json":
+        if item.key is not None:
+            return load_json(item.path).get(item.key)
+        with open(item.path, "rb") as fd:
+            fd.seek(item.offset)
+            return json.loads(fd.read(item.length))
+    else:
+        raise ValueError(
+            "format must be one of {} - got {}".format(
+                " | ".join(ITEM_FORMATS), item.format
+            )
+        )
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Estimates the memory in bytes that a loaded item takes up, including the lists,
+    dictionaries and strings it contains, which is several times the size of the file
+    for a parsed log, since every line is a dictionary of strings.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(
+            estimate_size(key) + estimate_size(child) for key, child in value.items()
+        )
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(child) for child in value)
+    return size
+
+
+class ItemCache:
+    """
+    LRU cache of the items that are loaded from disk, limited by the estimated memory
+    of the loaded items.
+
+    The items are never modified, hence the same reference always loads the same item,
+    whereas changing the file results in a different reference.
+    """
+
+    def __init__(self, max_size: int = default_cache_size):
+        """
+        Arguments:
+            max_size (int):
+                Maximum total size in bytes of the cached items, as estimated by
+                estimate_size. Larger items are loaded every time.
+                [Default: 256 MiB]
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.size = 0
+        self.entries: OrderedDict[FileRef, Tuple[Any, int]] = OrderedDict()
+        # Items are loaded in a thread pool.
+        self.lock = threading.Lock()
+
+    def resolve(self, item: Any) -> Any:
+        """
+        Gets the item, which is loaded from disk if it is a reference that is not
+        cached.
+
+        Arguments:
+            item (Any):
+                Item of the data, which may be a reference to a file.
+
+        Returns:
+            item (Any):
+                The loaded item
+        """
+        if not isinstance(item, FileRef):
+            return item
+        with self.lock:
+            entry = self.entries.get(item)
+            if entry is not None:
+                self.entries.move_to_end(item)
+                return entry[0]
+        loaded = load_item(item)
+        # Loaded items take up more memory than their files, hence the ones of larger
+        # files are not even estimated.
+        if item.size > self.max_size:
+            return loaded
+        size = estimate_size(loaded)
+        if size > self.max_size:
+            return loaded
+        with self.lock:
+            if item not in self.entries:
+                self.entries[item] = (loaded, size)
+                self.size += size
+            while self.size > self.max_size:
+                _, (_, size) = self.entries.popitem(last=False)
+                self.size -= size
+        return loaded
@@ -1,46 +1,39 @@
 import argparse
 import os
 import re
-import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, TextIO, Tuple, Union
 
-from halo import Halo
-from PIL import Image
-from tqdm import tqdm
+from .file_types import MANIFEST_EXTENSION
+from .files import write_json, write_text_file
+from .git import get_git_diff, get_git_info, prefetch_git_diff
+from .noop import maybe_disable, no_op
 
-from .file_types import SAVE_ALL_EXTENSIONS
-from .fs import write_json, write_text_file
-from .noop import maybe_disable
-
-try:
+# The heavy dependencies (torch, PIL, tqdm, halo) are only imported once the features
+# that need them are used, which keeps `import lavd` fast.
+if TYPE_CHECKING:
+    import numpy as np
     import torch
     import torch.nn as nn
+    from PIL import Image
 
-    HAS_TORCH = True
-except ImportError:
-    HAS_TORCH = False
-
-try:
-    from torchvision.transforms import ToPILImage
-except ImportError:
-    ToPILImage = None
-
-try:
-    # Only for type annotations
-    import numpy as np  # noqa: F401 - unused import
-except ImportError:
-    pass
+    from .checkpoint import Checkpointer
+    from .progress import ProgressBar, Spinner
 
 
 table_separator_regex = re.compile("[^|]")
 
+REDUCE_OPS = ["mean", "sum", "max", "min"]
+
 
 class Logger:
     disabled: bool
+    rank: int
     name: str
     delimiter: str
     num_digits: int
@@ -48,14 +41,13 @@ class Logger:
     created_timestamp: datetime
     base_dir: Path
     log_dir: Path
-    repo_path: Optional[Path]
-    git_hash: Optional[str]
-    git_branch: Optional[str]
+    cwd: Path
     events_file: Optional[TextIO]
     stdout_file: Optional[TextIO]
     stderr_file: Optional[TextIO]
     events_time: Dict[str, float]
-    to_pil: Optional[Callable[[Union["torch.Tensor", "np.ndarray"]], Image.Image]]
+    image_executor: Optional[ThreadPoolExecutor]
+    checkpointer: Optional["Checkpointer"]
 
     def __init__(
         self,
@@ -65,6 +57,8 @@ class Logger:
         indent_size: int = 4,
         delimiter: str = "\t",
         disabled: bool = False,
+        rank: Optional[int] = None,
+        prefetch_git: bool = False,
     ):
         """
         Arguments:
@@ -94,48 +88,47 @@ class Logger:
                 Particularly useful when the same script is launched in multiple
                 processing, but only the main process should create the logs.
                 [Default: False]
+            rank (int):
+                Rank of the process in distributed training. The logger is disabled
+                for all ranks except rank 0, so that only one process creates the logs.
+                If not specified, it is determined from torch.distributed, if it has
+                been initialised, or from the RANK environment variable, which is set
+                by the launchers such as torchrun.
+                [Default: None]
+            prefetch_git (bool):
+                Whether to start gathering the git information and the diff of the
+                working tree in the background right away. Otherwise it is gathered
+                once it's first needed (e.g. `log_summary`). Either way, it is only
+                gathered once per process.
+                [Default: False]
         """
         self.base_dir = Path(log_dir)
         super().__init__()
         self.delimiter = delimiter
-        self.disabled = disabled
+        self.rank = get_rank() if rank is None else rank
+        self.disabled = disabled or self.rank != 0
         self.num_digits = num_digits
         self.indent_size = indent_size
         self.created_timestamp = datetime.now()
         self.name = self.get_start_time() if name is None else name
         self.log_dir = Path(log_dir, self.name)
-        try:
-            self.repo_path = Path(
-                subprocess.check_output(["git", "rev-parse", "--show-toplevel"])
-                .strip()
-                .decode("utf-8")
-            )
-            self.git_hash = (
-                subprocess.check_output(
-                    ["git", "rev-parse", "HEAD"],
-                    cwd=self.repo_path,
-                )
-                .strip()
-                .decode("utf-8")
-            )
-            self.git_branch = (
-                subprocess.check_output(
-                    ["git", "rev-parse", "--abbrev-ref", "HEAD"],
-                    cwd=self.repo_path,
-                )
-                .strip()
-                .decode("utf-8")
-            )
-        except subprocess.CalledProcessError:
-            self.repo_path = None
-            self.git_hash = None
-            self.git_branch = None
+        # The git information is relative to the working directory at the time the
+        # logger was created, but it's only gathered when it's needed.
+        self.cwd = Path.cwd()
+        if prefetch_git:
+            threading.Thread(
+                target=lambda: prefetch_git_diff(self.repo_path),
+                name="lavd-git",
+                daemon=True,
+            ).start()
         self.events_file = None
         self.stdout_file = None
         self.stderr_file = None
         self.prefix = ""
         self.events_time = {}
-        self.to_pil = None if ToPILImage is None else ToPILImage()
+        # Created once they're needed
+        self.image_executor = None
+        self.checkpointer = None
         if not self.disabled:
             self.log_dir.mkdir(parents=True, exist_ok=True)
 
@@ -146,6 +139,22 @@ class Logger:
             self.stdout_file.close()
         if self.stderr_file is not None:
             self.stderr_file.close()
+        if self.image_executor is not None:
+            self.image_executor.shutdown(wait=True)
+        if self.checkpointer is not None:
+            self.checkpointer.shutdown()
+
+    @property
+    def repo_path(self) -> Optional[Path]:
+        return get_git_info(self.cwd).repo_path
+
+    @property
+    def git_hash(self) -> Optional[str]:
+        return get_git_info(self.cwd).hash
+
+    @property
+    def git_branch(self) -> Optional[str]:
+        return get_git_info(self.cwd).branch
 
     def enable(self):
         """
@@ -300,6 +309,8 @@ class Logger:
         kwargs["desc"] = (
             "{} {}".format(self.prefix, description) if prefix else description
         )
+        from .progress import ProgressBar
+
         return ProgressBar(self, name, prefix, *args, **kwargs)
 
     @maybe_disable
@@ -326,6 +337,8 @@ class Logger:
         # name is used as the text.
         text = kwargs.get("text") or name
         kwargs["text"] = "{} {}".format(self.prefix, text) if prefix else text
+        from .progress import Spinner
+
         return Spinner(self, name, prefix, *args, **kwargs)
 
     @maybe_disable
@@ -504,13 +517,7 @@ class Logger:
             >>> }
             >>> logger.log_summary(infos, sections)
         """
-        try:
-            diff = subprocess.check_output(
-                ["git", "diff", "HEAD"],
-                cwd=self.repo_path,
-            ).decode("utf-8")
-        except subprocess.CalledProcessError:
-            diff = ""
+        diff = get_git_diff(self.repo_path)
         diff_file = self.log_dir / "changes.patch"
         if len(diff) > 0:
             with open(diff_file, "w", encoding="utf-8") as fd:
@@ -610,6 +617,45 @@ class Logger:
         scalar_dict = {"scalars": {"value": scalar}}
         write_json(scalar_dict, path, merge=True)
 
+    # Not disabled, because all ranks need to take part in the reduction.
+    def log_scalars(
+        self,
+        scalars: Dict[str, Union[int, float, "torch.Tensor"]],
+        step: int,
+        reduce: Optional[str] = None,
+    ):
+        """
+        Logs multiple scalars at once, optionally reduced across all processes in
+        distributed training.
+
+        Arguments:
+            scalars (Dict[str, int | float | torch.Tensor]):
+                Scalars to be logged, where the keys are their names.
+            step (int):
+                Step/epoch to which the scalars belong.
+            reduce (str):
+                How to reduce the scalars across all processes in distributed training,
+                one of: "mean" | "sum" | "max" | "min". All scalars are reduced in
+                a single collective operation, hence it needs to be called by all
+                processes with the same names. If not specified, or if
+                torch.distributed has not been initialised, the scalars are logged
+                as they are.
+                [Default: None]
+
+        Example:
+            >>> # Average of the loss and accuracy of all processes
+            >>> scalars = {"loss": loss, "accuracy": accuracy}
+            >>> logger.log_scalars(scalars, step=1, reduce="mean")
+        """
+        if reduce is None:
+            values = {name: to_number(scalar) for name, scalar in scalars.items()}
+        else:
+            values = reduce_scalars(scalars, reduce)
+        if self.disabled:
+            return no_op
+        for name, value in values.items():
+            self.log_scalar(value, name, step)
+
     @maybe_disable
     def log_text(
         self,
@@ -674,7 +720,7 @@ class Logger:
     @maybe_disable
     def log_image(
         self,
-        image: Union[Image.Image, "torch.Tensor", "np.ndarray"],
+        image: Union["Image.Image", "torch.Tensor", "np.ndarray"],
         name: str,
         step: Optional[int] = None,
         boxes: Optional[List[Dict]] = None,
@@ -687,8 +733,10 @@ class Logger:
 
         Arguments:
             image (PIL.Image | torch.Tensor | np.array):
-                Image to be logged. torch.Tensor and np.array are converted to a PIL
-                Image, this requires torchvision to be installed.
+                Image to be logged. torch.Tensor (C x H x W) and np.array (H x W x C)
+                are converted to a PIL Image, where floating point values are expected
+                to be in the range [0, 1] and other integers than uint8 are clipped
+                to [0, 255].
             name (str):
                 Name of the image to log
             step (int):
@@ -748,16 +796,14 @@ class Logger:
             >>>     threshold=threshold,
             >>> )
         """
+        from PIL import Image
+
+        from .images import save_image, to_pil_image
+
         if not isinstance(image, Image.Image):
-            assert (
-                self.to_pil
-            ), "Images as NumPy array or torch.Tensor requires torchvision"
-            image = self.to_pil(image)
+            image = to_pil_image(image)
         img_path = self.get_file_path(name, step, extension=extension)
-        img_path.parent.mkdir(parents=True, exist_ok=True)
-        # The save_all is for animated images with multiple frames to save them as an
-        # animated image, otherwise only the first frame is saved.
-        image.save(img_path, save_all=extension in SAVE_ALL_EXTENSIONS)
+        save_image(image, img_path)
         if boxes is not None:
             json_path = self.get_file_path(name, step, extension=".json")
             image_dict: Dict[str, Dict] = {
@@ -769,6 +815,105 @@ class Logger:
                 image_dict["images"]["minProbability"] = threshold
             write_json(image_dict, json_path, merge=True)
 
+    def log_images(
+        self,
+        images: Union[List["Image.Image"], "torch.Tensor", "np.ndarray"],
+        names: Union[str, List[str]],
+        step: Optional[int] = None,
+        grid: bool = False,
+        nrow: int = 8,
+        padding: int = 2,
+        extension: str = ".png",
+        num_workers: Optional[int] = None,
+        blocking: bool = True,
+    ) -> List[Future]:
+        """
+        Logs a batch of images, which are converted and saved in parallel.
+
+        Arguments:
+            images (List[PIL.Image] | torch.Tensor | np.array):
+                Images to be logged, either as a list of PIL Images or as a batch of
+                images. A torch.Tensor is given as N x C x H x W and a np.array as
+                N x H x W x C, where floating point values are expected to be in the
+                range [0, 1] and other integers than uint8 are clipped to [0, 255].
+                Tensors are converted on their device, which avoids transferring the
+                floating point values to the CPU.
+            names (str | List[str]):
+                Names of the images to log, one per image. When a single name is
+                given, it is used as a directory with the index of the image as name,
+                e.g. "validation" saves the images as "validation/0", "validation/1"
+                etc., unless it's a grid, in which case it is the name of the grid.
+            step (int):
+                Step/epoch to which the images belong, If unspecified, they are
+                saved at the top level instead. [Default: None]
+            grid (bool):
+                Whether to tile the images into a single image (grid).
+                [Default: False]
+            nrow (int):
+                Number of images per row of the grid. Only used if grid=True.
+                [Default: 8]
+            padding (int):
+                Padding between the images of the grid. Only used if grid=True.
+                [Default: 2]
+            extension (str):
+                File extension for the image files.
+                [Default: ".png"]
+            num_workers (int):
+                Number of threads that save the images. Only used the first time, the
+                same threads are reused afterwards.
+                [Default: Number of CPUs]
+            blocking (bool):
+                Whether to wait until all images are saved. If False, the images are
+                saved in the background and the returned futures can be used to wait
+                for them. The images are copied beforehand, hence they can be modified
+                right away.
+                [Default: True]
+
+        Returns:
+            futures (List[Future]):
+                Futures of the saved images, which is empty if the logger is disabled.
+
+        Example:
+            >>> # Saves images to: log/some-experiment-name/0001/validation/{0,1}.png
+            >>> logger.log_images(batch, "validation", step=1)
+            >>> # Saves one image with all images tiled: .../0001/samples.png
+            >>> logger.log_images(batch, "samples", step=1, grid=True)
+        """
+        from .images import save_image, tile_images, to_pil_images
+
+        # Not disabled with maybe_disable, which would return a NoOp instead of a list.
+        if self.disabled:
+            return []
+        # The grid is a new image, which is never modified by the caller.
+        pil_images = to_pil_images(images, copy=not blocking and not grid)
+        if grid:
+            assert isinstance(names, str), "A grid requires a single name"
+            pil_images = [tile_images(pil_images, nrow=nrow, padding=padding)]
+            names = [names]
+        elif isinstance(names, str):
+            names = ["{}/{}".format(names, i) for i in range(len(pil_images))]
+        assert len(names) == len(
+            pil_images
+        ), "Number of names ({}) does not match the number of images ({})".format(
+            len(names), len(pil_images)
+        )
+        if self.image_executor is None:
+            self.image_executor = ThreadPoolExecutor(
+                max_workers=num_workers, thread_name_prefix="lavd-images"
+            )
+        futures = [
+            self.image_executor.submit(
+                save_image, image, self.get_file_path(name, step, extension=extension)
+            )
+            for image, name in zip(pil_images, names)
+        ]
+        if blocking:
+            wait(futures)
+            # Raises the exception of any image that could not be saved.
+            for future in futures:
+                future.result()
+        return futures
+
     @maybe_disable
     def log_command(
         self,
@@ -832,7 +977,13 @@ class Logger:
         name: str = "model",
         extension: str = ".pt",
         grads: bool = False,
-    ):
+        blocking: bool = True,
+        keep_last: Optional[int] = None,
+        keep_best: Optional[int] = None,
+        metric: Optional[float] = None,
+        mode: str = "min",
+        dedup: bool = False,
+    ) -> Future:
         """
         Saves the state/checkpoint of the model, to be compatible with the actual model,
         multi GPU/Node models (nn.DataParallel and nn.parallel.DistributedDataParallel)
@@ -840,6 +991,9 @@ class Logger:
 
         Optionally, it also saves the current gradients.
 
+        The checkpoint is written to a temporary file first, which is then renamed, so
+        that an interrupted save never leaves a corrupted checkpoint behind.
+
         Requires torch
 
         Arguments:
@@ -864,8 +1018,59 @@ class Logger:
                 Save gradients of the model next to the checkpoint with .grad added to
                 the name.
                 [Default: False]
+            blocking (bool):
+                Whether to wait until the checkpoint is saved. If False, the state is
+                copied to (pinned) CPU memory and saved in the background, so that the
+                training can continue right away. The CPU memory is reused for the
+                next checkpoint with the same name, which waits for the previous one to
+                be saved.
+                [Default: True]
+            keep_last (int):
+                Number of most recent checkpoints (with a step) to keep, older ones are
+                removed automatically. If neither keep_last nor keep_best are given,
+                all checkpoints are kept.
+                [Default: None]
+            keep_best (int):
+                Number of checkpoints (with a step) with the best metric to keep.
+                [Default: None]
+            metric (float):
+                Metric of the checkpoint (e.g. validation loss), which determines the
+                best checkpoints for keep_best.
+                [Default: None]
+            mode (str):
+                Whether the best metric is the lowest ("min") or the highest ("max").
+                [Default: "min"]
+            dedup (bool):
+                Whether to deduplicate the tensors across checkpoints. Every distinct
+                tensor is stored once as a blob (in the .blobs directory of the
+                experiment) and the checkpoint is just a manifest referencing them,
+                which is saved with .manifest added to the extension. Unchanged
+                tensors, e.g. of a frozen backbone, therefore take no additional
+                space. Use `lavd.checkpoint.load_checkpoint` to load it.
+                [Default: False]
+
+        Returns:
+            future (Future):
+                Future that is resolved once the checkpoint has been saved.
+
+        Example:
+            >>> # Keeps the 3 most recent and the 2 best checkpoints
+            >>> logger.save_model(
+            ...     model,
+            ...     step=epoch,
+            ...     blocking=False,
+            ...     keep_last=3,
+            ...     keep_best=2,
+            ...     metric=validation_loss,
+            ... )
+            >>> # Waits until all checkpoints are saved, e.g. at the end of training
+            >>> logger.wait_checkpoints()
         """
+        from .checkpoint import HAS_TORCH, Retention
+
         assert HAS_TORCH, "save_model requires torch (PyTorch) to be installed"
+        import torch.nn as nn
+
         # Multi GPU/Node models wrap the original model. To make the checkpoint
         # compatible with the original model, it is unwrapped.
         unwrapped_model = (
@@ -873,18 +1078,38 @@ class Logger:
             if isinstance(model, (nn.DataParallel, nn.parallel.DistributedDataParallel))
             else model
         )
-        state_dict = unwrapped_model.state_dict()
-        path = self.get_file_path(name, step, extension=extension)
-        path.parent.mkdir(parents=True, exist_ok=True)
-        torch.save(state_dict, path)
+        if dedup:
+            extension += MANIFEST_EXTENSION
+        files = [
+            (
+                name,
+                unwrapped_model.state_dict(),
+                self.get_file_path(name, step, extension=extension),
+            )
+        ]
         if grads:
+            grad_name = "{}.grad".format(name)
             grad_dict = {
                 name: param.grad
                 for name, param in unwrapped_model.named_parameters()
                 if param.grad is not None
             }
-            path = self.get_file_path("{}.grad".format(name), step, extension=extension)
-            torch.save(grad_dict, path)
+            files.append(
+                (
+                    grad_name,
+                    grad_dict,
+                    self.get_file_path(grad_name, step, extension=extension),
+                )
+            )
+        return self.get_checkpointer().save(
+            name,
+            files,
+            step=step,
+            blocking=blocking,
+            retention=Retention(keep_last=keep_last, keep_best=keep_best, mode=mode),
+            metric=metric,
+            dedup=dedup,
+        )
 
     @maybe_disable
     def save_obj(
@@ -893,7 +1118,9 @@ class Logger:
         name: str,
         step: Optional[int] = None,
         extension: str = ".pt",
-    ):
+        blocking: bool = True,
+        dedup: bool = False,
+    ) -> Future:
         """
         Saves any object by serialising it with `torch.save`.
 
@@ -916,74 +1143,124 @@ class Logger:
                 To further avoid ambiguities, ".pt" is used for serialised data and
                 ".ptc" is used for JIT exported modules (c = compiled).
                 [Default: ".pt"]
+            blocking (bool):
+                Whether to wait until the object is saved. If False, the tensors
+                within the object (nested in dicts, lists and tuples) are copied to CPU
+                memory and saved in the background, any other values are not copied
+                and must therefore not be modified afterwards.
+                [Default: True]
+            dedup (bool):
+                Whether to deduplicate the tensors within the object, see `save_model`.
+                [Default: False]
+
+        Returns:
+            future (Future):
+                Future that is resolved once the object has been saved.
         """
+        from .checkpoint import HAS_TORCH
+
         assert HAS_TORCH, "save_model requires torch (PyTorch) to be installed"
+        if dedup:
+            extension += MANIFEST_EXTENSION
         path = self.get_file_path(name, step, extension=extension)
-        path.parent.mkdir(parents=True, exist_ok=True)
-        torch.save(obj, path)
+        return self.get_checkpointer().save(
+            name, [(name, obj, path)], step=step, blocking=blocking, dedup=dedup
+        )
 
+    def get_checkpointer(self) -> "Checkpointer":
+        from .checkpoint import BlobStore, Checkpointer
 
-class ProgressBar(tqdm):
-    """
-    A progress bar that logs the start and end of the progress
-    """
+        if self.checkpointer is None:
+            self.checkpointer = Checkpointer(store=BlobStore(self.log_dir))
+        return self.checkpointer
 
-    def __init__(self, logger: Logger, name: str, prefix: bool, *args, **kwargs):
+    def wait_checkpoints(self):
         """
-        Args:
-            logger (Logger):
-                The logger to log the start and end of the progress
-            name (str):
-                Name of the event to log
-            prefix (bool):
-                Whether to include the prefix in the log message
-            *args, **kwargs:
-                Arguments forwarded to tqdm
+        Waits until all checkpoints and objects, which are saved in the background,
+        have been saved. Raises the first error that occurred while saving them.
         """
-        self.logger = logger
-        self.name = name
-        self.prefix = prefix
-        self.logger.start(self.name, prefix=self.prefix, tag="PROGRESS_START")
-        super().__init__(*args, **kwargs)
+        if self.checkpointer is not None:
+            self.checkpointer.wait()
 
-    def close(self):
-        if self.disable:
-            return
-        super().close()
-        self.logger.end(self.name, prefix=self.prefix, tag="PROGRESS_END")
 
+def get_rank() -> int:
+    """
+    Determines the rank of the process in distributed training, either from
+    torch.distributed, if it has been initialised, or otherwise from the RANK
+    environment variable, which is set by the launchers (e.g. torchrun) and allows to
+    create the logger before the process group is initialised.
+    """
+    dist = get_distributed()
+    if dist is not None:
+        return dist.get_rank()
+    rank = os.environ.get("RANK")
+    if rank is not None and rank.isdigit():
+        return int(rank)
+    return 0
 
-class Spinner(Halo):
-    """A spinner that logs the start and end of the duration"""
 
-    def __init__(self, logger: Logger, name: str, prefix: bool, *args, **kwargs):
-        """
-        Args:
-            logger (Logger):
-                The logger to log the start and end of the duration
-            name (str):
-                Name of the event to log
-            prefix (bool):
-                Whether to include the prefix in the log message
-            *args, **kwargs:
-                Arguments forwarded to Halo
-        """
-        self.logger = logger
-        self.name = name
-        self.prefix = prefix
-        super().__init__(*args, **kwargs)
+def get_distributed() -> Optional[Any]:
+    """
+    Gets torch.distributed if it has been initialised. When it has not been imported
+    yet, it cannot have been initialised either, therefore it is not imported here.
+    """
+    dist = sys.modules.get("torch.distributed")
+    if dist is None or not dist.is_available() or not dist.is_initialized():
+        return None
+    return dist
 
-    def start(self, text: Optional[str] = None) -> "Spinner":
-        if self._spinner_id is None and self.enabled and self._check_stream():
-            self.logger.start(self.name, prefix=self.prefix, tag="SPINNER_START")
-            super().start(text)
-        return self
 
-    def stop(self) -> "Spinner":
-        if self._spinner_id is not None:
-            super().stop()
-            self.logger.end(self.name, prefix=self.prefix, tag="SPINNER_END")
-        return self
+def to_number(value: Union[int, float, "torch.Tensor"]) -> Union[int, float]:
+    torch_module = sys.modules.get("torch")
+    if torch_module is not None and isinstance(value, torch_module.Tensor):
+        return value.item()
+    return value
+
+
+def reduce_scalars(
+    scalars: Dict[str, Union[int, float, "torch.Tensor"]], reduce: str
+) -> Dict[str, Union[int, float]]:
+    """
+    Reduces the scalars across all processes with a single all-reduce.
+    """
+    assert reduce in REDUCE_OPS, "reduce must be one of {} - got {}".format(
+        " | ".join(REDUCE_OPS), reduce
+    )
+    dist = get_distributed()
+    if dist is None:
+        return {name: to_number(scalar) for name, scalar in scalars.items()}
+    if len(scalars) == 0:
+        return {}
+    import torch
+
+    world_size = dist.get_world_size()
+    # The names are sorted, so that every process has the same order, regardless of
+    # the order in which they were inserted.
+    names = sorted(scalars.keys())
+    # NCCL only supports CUDA tensors, whereas Gloo works with both.
+    device = (
+        torch.device("cuda", torch.cuda.current_device())
+        if dist.get_backend() == "nccl"
+        else torch.device("cpu")
+    )
+    # Tensors that are already on the device are not synchronised before the
+    # reduction.
+    values = torch.stack(
+        [
+            torch.as_tensor(scalars[name], dtype=torch.float64, device=device)
+            for name in names
+        ]
+    ).reshape(len(names))
+    op = {
+        "mean": dist.ReduceOp.SUM,
+        "sum": dist.ReduceOp.SUM,
+        "max": dist.ReduceOp.MAX,
+        "min": dist.ReduceOp.MIN,
+    }[reduce]
+    dist.all_reduce(values, op=op)
+    if reduce == "mean":
+        values /= world_size
+    return dict(zip(names, values.tolist()))
 
 
 def write_list(fd: TextIO, data: Dict[str, Any], level: int = 0, indent_size: int = 4):
@@ -1169,3 +1446,13 @@ def create_markdown_table(
         line = "| {fields} |".format(fields=" | ".join(r))
         lines.append("{indent}{line}".format(indent=indent, line=line))
     return lines
+
+
+def __getattr__(name: str) -> Any:
+    # The progress bar and spinner are only imported when they are accessed, since
+    # they require tqdm and halo.
+    if name in ["ProgressBar", "Spinner"]:
+        from . import progress
+
+        return getattr(progress, name)
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
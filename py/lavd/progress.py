@@ -0,0 +1,70 @@
+from typing import TYPE_CHECKING, Optional
+
+from halo import Halo
+from tqdm import tqdm
+
+if TYPE_CHECKING:
+    from .log import Logger
+
+
+class ProgressBar(tqdm):
+    """
+    A progress bar that logs the start and end of the progress
+    """
+
+    def __init__(self, logger: "Logger", name: str, prefix: bool, *args, **kwargs):
+        """
+        Args:
+            logger (Logger):
+                The logger to log the start and end of the progress
+            name (str):
+                Name of the event to log
+            prefix (bool):
+                Whether to include the prefix in the log message
+            *args, **kwargs:
+                Arguments forwarded to tqdm
+        """
+        self.logger = logger
+        self.name = name
+        self.prefix = prefix
+        self.logger.start(self.name, prefix=self.prefix, tag="PROGRESS_START")
+        super().__init__(*args, **kwargs)
+
+    def close(self):
+        if self.disable:
+            return
+        super().close()
+        self.logger.end(self.name, prefix=self.prefix, tag="PROGRESS_END")
+
+
+class Spinner(Halo):
+    """A spinner that logs the start and end of the duration"""
+
+    def __init__(self, logger: "Logger", name: str, prefix: bool, *args, **kwargs):
+        """
+        Args:
+            logger (Logger):
+                The logger to log the start and end of the duration
+            name (str):
+                Name of the event to log
+            prefix (bool):
+                Whether to include the prefix in the log message
+            *args, **kwargs:
+                Arguments forwarded to Halo
+        """
+        self.logger = logger
+        self.name = name
+        self.prefix = prefix
+        super().__init__(*args, **kwargs)
+
+    def start(self, text: Optional[str] = None) -> "Spinner":
+        if self._spinner_id is None and self.enabled and self._check_stream():
+            self.logger.start(self.name, prefix=self.prefix, tag="SPINNER_START")
+            super().start(text)
+        return self
+
+    def stop(self) -> "Spinner":
+        if self._spinner_id is not None:
+            super().stop()
+            self.logger.end(self.name, prefix=self.prefix, tag="SPINNER_END")
+        return self
@@ -0,0 +1,428 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+
+from .data import Data
+from .items import FileRef, load_item, parse_log_lines
+
+# Kinds of the data that contain text worth searching.
+SEARCH_KINDS = ["texts", "logs", "markdown"]
+
+# Parameters of the BM25 ranking
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+token_regex = re.compile(r"\w+")
+
+DocKey = Tuple[str, str, Union[str, int], str]
+
+
+class SearchHit(NamedTuple):
+    kind: str
+    name: str
+    step: Union[str, int]
+    category: str
+    score: float
+
+
+def tokenise(text: str) -> List[str]:
+    return token_regex.findall(text.lower())
+
+
+def extract_text(kind: str, item: Dict) -> str:
+    if kind == "texts":
+        return "\n".join([item.get("actual") or "", item.get("expected") or ""]).strip()
+    elif kind == "logs":
+        return "\n".join(
+            " ".join([line.get("tag") or "", line.get("message") or ""])
+            for line in item.get("lines", [])
+        )
+    elif kind == "markdown":
+        return item.get("raw") or ""
+    else:
+        return ""
+
+
+def log_line_tokens(line: Dict[str, str]) -> List[str]:
+    return tokenise(" ".join([line.get("tag", ""), line["message"]]))
+
+
+def count_log_tokens(
+    path: Union[str, os.PathLike], offset: int = 0, chunk_size: int = 1024 * 1024
+) -> Tuple[Counter, int]:
+    """
+    Counts the tokens of the lines of a log file, starting at the given offset.
+
+    Only complete lines (ending with a newline) are counted, since the last line may
+    still be written, therefore the lines that are appended to the file can be counted
+    from the returned offset onwards.
+
+    Returns:
+        counts_and_end (Tuple[Counter, int]):
+            Number of occurrences of each token and the offset after the last complete
+            line.
+    """
+    counts: Counter = Counter()
+    end = offset
+    with open(path, "rb") as fd:
+        fd.seek(offset)
+        remainder = b""
+        while True:
+            chunk = fd.read(chunk_size)
+            if len(chunk) == 0:
+                break
+            content = remainder + chunk
+            line_end = content.rfind(b"\n") + 1
+            remainder = content[line_end:]
+            if line_end == 0:
+                continue
+            text = content[:line_end].decode("utf-8")
+            for line in parse_log_lines(text.splitlines()):
+                counts.update(log_line_tokens(line))
+            end += line_end
+    return counts, end
+
+
+def count_tokens(kind: str, item: Any) -> Tuple[Counter, int]:
+    """
+    Counts the tokens of an item, large files are read line by line, instead of being
+    loaded all at once.
+
+    Returns:
+        counts_and_end (Tuple[Counter, int]):
+            Number of occurrences of each token, and for log files the offset up to
+            which they have been counted, otherwise 0.
+    """
+    if not isinstance(item, FileRef) or item.format == "json":
+        return Counter(tokenise(extract_text(kind, load_item(item) or {}))), 0
+    if item.format == "log":
+        return count_log_tokens(item.path)
+    counts: Counter = Counter()
+    with open(item.path, "r", encoding="utf-8") as fd:
+        for text_line in fd:
+            counts.update(tokenise(text_line))
+    return counts, 0
+
+
+def is_appended(old_item: Any, item: Any) -> bool:
+    # Log files are only ever appended to, hence a larger file only contains new lines.
+    return (
+        isinstance(old_item, FileRef)
+        and isinstance(item, FileRef)
+        and old_item.format == "log"
+        and item.format == "log"
+        and old_item.path == item.path
+        and item.size >= old_item.size
+    )
+
+
+class IndexedDoc(NamedTuple):
+    # The item is shared with the data, so it does not take up any additional memory.
+    item: Any
+    # Number of tokens
+    length: int
+    # Offset up to which a log file has been indexed.
+    end: int = 0
+
+
+def iter_items(kind_data: Dict) -> Iterator[Tuple[Union[str, int], str, Dict]]:
+    for category, category_data in kind_data.items():
+        global_item = category_data.get("global")
+        if global_item is not None:
+            yield "global", category, global_item
+        for step, item in category_data.get("steps", {}).items():
+            yield step, category, item
+
+
+class SearchIndex:
+    """
+    Inverted index over the texts, logs and markdown of the data.
+
+    The index is kept in sync with the data by comparing it to the version that was
+    last indexed. Since the data is copy-on-write, every dictionary that has not been
+    modified is still the same object, hence only the experiments, kinds and
+    categories that actually changed need to be looked at, which makes it cheap to
+    update.
+
+    The index is built in the background once the data has been loaded, and
+    afterwards kept up to date by the file watcher (or after every snapshot), as well
+    as before searching, in case it is not up to date yet. Log files are indexed
+    incrementally, only the lines that were appended since they were last indexed are
+    read.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Token -> document -> number of occurrences
+        self.postings: Dict[str, Dict[DocKey, int]] = {}
+        # The tokens of the documents are only stored in the postings, rather than
+        # keeping them for each document as well.
+        self.docs: Dict[DocKey, IndexedDoc] = {}
+        self.total_length = 0
+        # Documents that have been removed, but are still part of the postings, since
+        # their tokens are unknown, e.g. the file has changed. They are removed from
+        # the postings at once, which requires going through all of them.
+        self.stale: Set[DocKey] = set()
+        # The full data that has been indexed, to find what changed since.
+        self.synced: Dict = {}
+        # Searched by multiple threads of the server concurrently.
+        self.lock = threading.RLock()
+
+    def add_counts(self, key: DocKey, counts: Counter):
+        for token, count in counts.items():
+            postings = self.postings.setdefault(token, {})
+            postings[key] = postings.get(key, 0) + count
+
+    def update_doc(self, key: DocKey, item: Any) -> bool:
+        """
+        Updates an indexed document in place, which is only possible if the item did
+        not change or only lines were appended to the log file.
+
+        Returns:
+            updated (bool):
+                Whether the document has been updated, otherwise it needs to be
+                removed and added again.
+        """
+        existing = self.docs.get(key)
+        if existing is None:
+            return False
+        # After loading a new snapshot of the data, all items are new objects, but
+        # most of them are equal, which is much cheaper than tokenising again.
+        # References to files are only equal if the files have not changed.
+        if existing.item is item or existing.item == item:
+            self.docs[key] = existing._replace(item=item)
+            return True
+        if is_appended(existing.item, item):
+            # Only the lines that have been appended are indexed, instead of the whole
+            # file again.
+            try:
+                counts, end = count_log_tokens(item.path, existing.end)
+            except (OSError, ValueError):
+                counts, end = Counter(), existing.end
+            self.add_counts(key, counts)
+            length = sum(counts.values())
+            self.docs[key] = IndexedDoc(item, existing.length + length, end)
+            self.total_length += length
+            return True
+        return False
+
+    def add_doc(self, key: DocKey, item: Any):
+        try:
+            # Large items are only references to files, which are read just for the
+            # indexing, rather than being cached.
+            counts, end = count_tokens(key[0], item)
+        except (OSError, ValueError):
+            # The file may have been removed in the meantime.
+            counts, end = Counter(), 0
+        self.add_counts(key, counts)
+        length = sum(counts.values())
+        self.docs[key] = IndexedDoc(item, length, end)
+        self.total_length += length
+
+    def remove_doc(self, key: DocKey):
+        existing = self.docs.pop(key, None)
+        if existing is None:
+            return
+        self.total_length -= existing.length
+        if isinstance(existing.item, FileRef):
+            # The file has changed or has been removed, hence its tokens can no longer
+            # be determined.
+            self.stale.add(key)
+            return
+        # The items in memory never change, so they result in the same tokens again.
+        counts, _ = count_tokens(key[0], existing.item)
+        for token in counts:
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if len(postings) == 0:
+                del self.postings[token]
+
+    def remove_stale(self):
+        for token in list(self.postings.keys()):
+            postings = self.postings[token]
+            if len(self.stale) < len(postings):
+                for key in self.stale:
+                    postings.pop(key, None)
+            else:
+                for key in [key for key in postings if key in self.stale]:
+                    del postings[key]
+            if len(postings) == 0:
+                del self.postings[token]
+        self.stale.clear()
+
+    def sync_kind(
+        self,
+        kind: str,
+        name: str,
+        kind_data: Dict,
+        old_kind_data: Dict,
+        added: List[Tuple[DocKey, Any]],
+    ):
+        for category, old_category_data in old_kind_data.items():
+            if category not in kind_data:
+                for step, _, _ in iter_items({category: old_category_data}):
+                    self.remove_doc((kind, name, step, category))
+        for category, category_data in kind_data.items():
+            old_category_data = old_kind_data.get(category, {})
+            if category_data is old_category_data:
+                continue
+            global_item = category_data.get("global")
+            if global_item is None:
+                self.remove_doc((kind, name, "global", category))
+            elif global_item is not old_category_data.get("global"):
+                self.change_doc((kind, name, "global", category), global_item, added)
+            steps = category_data.get("steps", {})
+            old_steps = old_category_data.get("steps", {})
+            if steps is old_steps:
+                continue
+            for step in old_steps:
+                if step not in steps:
+                    self.remove_doc((kind, name, step, category))
+            for step, item in steps.items():
+                if item is not old_steps.get(step):
+                    self.change_doc((kind, name, step, category), item, added)
+
+    def change_doc(self, key: DocKey, item: Any, added: List[Tuple[DocKey, Any]]):
+        if not self.update_doc(key, item):
+            self.remove_doc(key)
+            added.append((key, item))
+
+    def sync(self, data: Data, blocking: bool = True) -> bool:
+        """
+        Updates the index to the current version of the data.
+
+        All documents that changed are removed first, so that the postings of the
+        removed files are cleaned up in a single pass, before the new documents are
+        added.
+
+        Arguments:
+            data (Data):
+                Data to index
+            blocking (bool):
+                Whether to wait until the index is no longer being updated by someone
+                else, otherwise nothing is done in that case.
+                [Default: True]
+
+        Returns:
+            synced (bool):
+                Whether the index has been updated, which is only False if it was not
+                blocking.
+        """
+        if not self.lock.acquire(blocking=blocking):
+            return False
+        try:
+            full = data.full
+            old_full = self.synced
+            if full is old_full:
+                return True
+            added: List[Tuple[DocKey, Any]] = []
+            for name, old_name_data in old_full.items():
+                if name not in full:
+                    for kind in SEARCH_KINDS:
+                        self.sync_kind(
+                            kind, name, {}, old_name_data.get(kind, {}), added
+                        )
+            for name, name_data in full.items():
+                old_name_data = old_full.get(name, {})
+                if name_data is old_name_data:
+                    continue
+                for kind in SEARCH_KINDS:
+                    kind_data = name_data.get(kind, {})
+                    old_kind_data = old_name_data.get(kind, {})
+                    if kind_data is not old_kind_data:
+                        self.sync_kind(kind, name, kind_data, old_kind_data, added)
+            if len(self.stale) > 0:
+                self.remove_stale()
+            for key, item in added:
+                self.add_doc(key, item)
+            self.synced = full
+            return True
+        finally:
+            self.lock.release()
+
+    def search(
+        self,
+        query: str,
+        kinds: Optional[List[str]] = None,
+        names: Optional[List[str]] = None,
+        offset: int = 0,
+        limit: int = 50,
+    ) -> Tuple[int, List[SearchHit]]:
+        """
+        Searches for the entries that contain all words of the query, ranked by BM25.
+
+        Arguments:
+            query (str):
+                Words to search for, which are case-insensitive.
+            kinds (List[str], optional):
+                Only search the given kinds, e.g. ["texts", "logs"]. If not specified,
+                all kinds are searched.
+            names (List[str], optional):
+                Only search the given experiments. If not specified, all experiments
+                are searched.
+            offset (int):
+                Number of hits to skip.
+                [Default: 0]
+            limit (int):
+                Maximum number of hits to return.
+                [Default: 50]
+
+        Returns:
+            total_and_hits (Tuple[int, List[SearchHit]]):
+                Total number of hits and the requested page of the hits.
+        """
+        tokens = list(dict.fromkeys(tokenise(query)))
+        if len(tokens) == 0:
+            return 0, []
+        with self.lock:
+            postings: List[Dict[DocKey, int]] = []
+            for token in tokens:
+                token_postings = self.postings.get(token)
+                # Every word must be present, hence there is nothing to find.
+                if token_postings is None:
+                    return 0, []
+                postings.append(token_postings)
+            # Starting with the rarest token keeps the intersection small.
+            postings.sort(key=len)
+            num_docs = len(self.docs)
+            avg_length = max(self.total_length / max(num_docs, 1), 1)
+            idfs = [
+                math.log(1 + (num_docs - len(p) + 0.5) / (len(p) + 0.5))
+                for p in postings
+            ]
+            scores: Dict[DocKey, float] = {}
+            for key in postings[0]:
+                if kinds is not None and key[0] not in kinds:
+                    continue
+                if names is not None and key[1] not in names:
+                    continue
+                if not all(key in p for p in postings[1:]):
+                    continue
+                # Occurrences in long documents count less than in short ones.
+                length_norm = BM25_K1 * (
+                    1 - BM25_B + BM25_B * self.docs[key].length / avg_length
+                )
+                scores[key] = sum(
+                    idf * p[key] * (BM25_K1 + 1) / (p[key] + length_norm)
+                    for idf, p in zip(idfs, postings)
+                )
+        ranked = sorted(
+            scores.items(),
+            key=lambda entry: (
+                -entry[1],
+                entry[0][1],
+                entry[0][0],
+                entry[0][3],
+                str(entry[0][2]),
+            ),
+        )
+        hits = [
+            SearchHit(kind=kind, name=name, step=step, category=category, score=score)
+            for (kind, name, step, category), score in ranked[offset : offset + limit]
+        ]
+        return len(ranked), hits
@@ -12,21 +12,60 @@ if sys.platform == "win32":
 
 import argparse
 import asyncio
+import functools
+import mimetypes
 import os
+import re
+import shutil
+import socket
 import sys
+import tempfile
+import threading
+import urllib.parse
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import simplejson
 import tornado.httpserver
 import tornado.ioloop
 import tornado.netutil
+import tornado.process
 import tornado.web
-from halo import Halo
+import tornado.websocket
 from tornado import locks
+from tornado.httpclient import AsyncHTTPClient
 from tornado.iostream import StreamClosedError
 
-from .data import Data
+from .aggregator import (
+    AggregatedData,
+    ResponseCache,
+    Upstream,
+    configure_http_client,
+    parse_upstream,
+    prefix_name,
+    prefix_urls,
+)
+from .binary import diff_data, encode_data, pack
+from .broadcast import BroadcastHub, Subscriber
+from .data import Data, Selection, parse_selection
+from .diff import DIFF_LEVELS, DiffCache
 from .fs import FileWatcher, gather_data
+from .items import FileRef, ItemCache, default_cache_size
+from .search import SEARCH_KINDS, SearchIndex
+from .snapshot import (
+    SNAPSHOT_FILE,
+    SnapshotPublisher,
+    SnapshotSubscriber,
+    wait_for_snapshot,
+)
+from .stats import (
+    DEFAULT_QUANTILES,
+    GROUP_BY,
+    HAS_NUMPY,
+    ScalarAggregator,
+    group_by_command,
+    group_by_name,
+)
 from .version import __version__
 
 default_port = 4343
@@ -38,16 +77,65 @@ class Application(tornado.web.Application):
     Main tornado application
     """
 
-    def __init__(self, log_dir: str, debug: bool = False):
+    def __init__(
+        self,
+        log_dir: str,
+        debug: bool = False,
+        active_window: Optional[float] = None,
+        snapshot_path: Optional[Union[str, os.PathLike]] = None,
+        cache_size: int = default_cache_size,
+    ):
         self.log_dir = log_dir
         self.debug = debug
-        self.data = self.load_data()
         self.update_lock = locks.Condition()
+        self.file_watcher: Optional[FileWatcher] = None
+        self.snapshot: Optional[SnapshotSubscriber] = None
+        self.diff_cache = DiffCache()
+        # Large items are only kept as references to their files, the ones that are
+        # requested are cached in memory up to the given size.
+        self.item_cache = ItemCache(max_size=cache_size)
+        self.search_index = SearchIndex()
+        self.scalar_aggregator = ScalarAggregator()
+        if snapshot_path is None:
+            self.data = self.load_data()
+            self.file_watcher = FileWatcher(
+                self.log_dir,
+                self.data,
+                self.update_lock,
+                active_window=active_window,
+                search_index=self.search_index,
+            )
+        else:
+            # The data is maintained by a separate scanner process, which publishes it
+            # as snapshots.
+            self.snapshot = SnapshotSubscriber(snapshot_path)
+            self.data = self.snapshot.data
+            self.snapshot_callback = tornado.ioloop.PeriodicCallback(
+                self.reload_snapshot, 500
+            )
+            self.snapshot_callback.start()
+        # Indexing reads all texts, logs and markdown, including the large files, which
+        # is done in the background, so that the server can start right away.
+        threading.Thread(
+            target=self.search_index.sync,
+            args=(self.data,),
+            name="lavd-search-index",
+            daemon=True,
+        ).start()
+        # The data may be replaced by the snapshots, hence it is always the current one.
+        self.hub = BroadcastHub(lambda: self.data, self.update_lock)
         handlers: tornado.routing._RuleList = [
+            (r"/api/diff/([^/]+)/([^/]+)/(.+)", DiffHandler, {"app": self}),
+            (r"/api/search", SearchHandler, {"app": self}),
+            (r"/api/aggregate", AggregateHandler, {"app": self}),
+            (r"/api/export", ExportHandler, {"app": self}),
             (r"/api/(.*)", ApiHandler, {"app": self}),
             (r"/data/(.*)", tornado.web.StaticFileHandler, {"path": log_dir}),
             # Server Sent Events (SSE) to push new data to the client
             (r"/events", EventHandler, {"app": self}),
+            (r"/events/([^/]+)", SubscriptionHandler, {"app": self}),
+            # The same as the events, but in a binary encoding over a WebSocket
+            (r"/ws", WebSocketHandler, {"app": self}),
             # Those are the static files shipped with the package, i.e. the frontend
             (
                 r"/(.*)",
@@ -58,12 +146,196 @@ class Application(tornado.web.Application):
                 },
             ),
         ]
-        self.file_watcher = FileWatcher(self.log_dir, self.data, self.update_lock)
         super().__init__(handlers, debug=debug, compress_response=True)
 
     def load_data(self) -> Data:
+        # Only imported when scanning, which the aggregator never does.
+        from halo import Halo
+
         with Halo("Scanning files"):
-            return gather_data(self.log_dir)
+            data = gather_data(self.log_dir)
+        return data
+
+    def reload_snapshot(self):
+        if self.snapshot is not None and self.snapshot.reload():
+            self.data = self.snapshot.data
+            self.update_lock.notify_all()
+            # Only the experiments that changed need to be indexed, but they may
+            # include large files, so it must not block the server.
+            tornado.ioloop.IOLoop.current().run_in_executor(
+                None,
+                functools.partial(self.search_index.sync, blocking=False),
+                self.data,
+            )
+
+
+class AggregatorApplication(tornado.web.Application):
+    """
+    Tornado application that aggregates the data of multiple lavd servers (upstreams)
+    """
+
+    def __init__(self, upstreams: List[Tuple[str, str]], debug: bool = False):
+        self.debug = debug
+        configure_http_client()
+        self.data = AggregatedData()
+        self.update_lock = locks.Condition()
+        self.cache = ResponseCache()
+        self.hub = BroadcastHub(lambda: self.data, self.update_lock)
+        self.upstreams = [
+            Upstream(prefix, url, on_change=self.on_upstream_change)
+            for prefix, url in upstreams
+        ]
+        handlers: tornado.routing._RuleList = [
+            (r"/api/(all)", ApiHandler, {"app": self}),
+            (r"/api/search", AggregatedSearchHandler, {"app": self}),
+            # They need all the data at once, which is only available on the upstreams.
+            (r"/api/(aggregate|export)", NotAggregatedHandler),
+            (r"/api/(.*)", ProxyHandler, {"app": self, "base": "api"}),
+            (r"/data/(.*)", ProxyHandler, {"app": self, "base": "data"}),
+            (r"/events", EventHandler, {"app": self}),
+            (r"/events/([^/]+)", SubscriptionHandler, {"app": self}),
+            # The same as the events, but in a binary encoding over a WebSocket
+            (r"/ws", WebSocketHandler, {"app": self}),
+            (
+                r"/(.*)",
+                FrontendFileHandler,
+                {
+                    "path": package_dir / "static",
+                    "default_filename": "index.html",
+                },
+            ),
+        ]
+        super().__init__(handlers, debug=debug, compress_response=True)
+
+    def start(self):
+        for upstream in self.upstreams:
+            tornado.ioloop.IOLoop.current().spawn_callback(upstream.listen)
+
+    def on_upstream_change(self, upstream: Upstream, names: Set[str]):
+        # Only the cached responses of the experiments that changed are outdated.
+        prefixes = []
+        for name in names:
+            prefixed_name = prefix_name(upstream.prefix, name)
+            kinds = {
+                "diff",
+                *self.data.truncated.get(prefixed_name, {}),
+                *upstream.truncated.get(prefixed_name, {}),
+            }
+            prefixes.append(upstream.get_url("/data/{}/".format(name)))
+            prefixes.extend(
+                upstream.get_url("/api/{}/{}/".format(kind, name)) for kind in kinds
+            )
+        self.cache.invalidate(prefixes)
+        self.data.merge(self.upstreams)
+        self.update_lock.notify_all()
+
+    def resolve(self, name: str) -> Optional[Tuple[Upstream, str]]:
+        """
+        Finds the upstream of an experiment by its prefix.
+
+        Returns:
+            upstream_and_name (Tuple[Upstream, str], optional):
+                Upstream and the name of the experiment without the prefix.
+        """
+        for upstream in self.upstreams:
+            prefix = prefix_name(upstream.prefix, "")
+            if name.startswith(prefix):
+                return upstream, name[len(prefix) :]
+        return None
+
+
+class ProxyHandler(tornado.web.RequestHandler):
+    """
+    Handler that forwards the requests for a single item (/api/...) or a file
+    (/data/...) to the upstream the experiment belongs to.
+    """
+
+    def initialize(self, app: AggregatorApplication, base: str):
+        self.app = app
+        self.base = base
+
+    async def get(self, url: str):
+        # The experiment name is the second part for the API (<kind>/<name>/...) and
+        # the first part for the data (<name>/...).
+        name_index = 1 if self.base == "api" else 0
+        parts = url.split("/", name_index + 1)
+        if len(parts) != name_index + 2:
+            raise tornado.web.HTTPError(404)
+        resolved = self.app.resolve(parts[name_index])
+        if resolved is None:
+            raise tornado.web.HTTPError(404)
+        upstream, parts[name_index] = resolved
+        upstream_url = upstream.get_url("/{}/{}".format(self.base, "/".join(parts)))
+        if self.request.query:
+            upstream_url = "{}?{}".format(upstream_url, self.request.query)
+        cached = self.app.cache.get(upstream_url)
+        if cached is None:
+            response = await AsyncHTTPClient().fetch(upstream_url, raise_error=False)
+            if response.code != 200:
+                raise tornado.web.HTTPError(response.code)
+            headers = {"Content-Type": response.headers.get("Content-Type", "")}
+            body = response.body
+            # Images refer to their source, which needs to point to the aggregator.
+            if self.base == "api" and parts[0] == "images":
+                body = simplejson.dumps(
+                    prefix_urls(simplejson.loads(body), upstream.prefix),
+                    ignore_nan=True,
+                ).encode("utf-8")
+            self.app.cache.set(upstream_url, headers, body)
+        else:
+            headers, body = cached
+        for key, value in headers.items():
+            self.set_header(key, value)
+        self.write(body)
+
+
+def get_selection(handler: tornado.web.RequestHandler) -> Selection:
+    """
+    Gets the selection of the data from the query arguments:
+    ?name=<name>&exclude=<name>&pattern=<regex>&kind=<kind>&category=<prefix>
+    &start=<step>&end=<step>
+
+    All of them are optional, and name, exclude, kind and category can be given
+    multiple times.
+    """
+    try:
+        return parse_selection(
+            names=handler.get_arguments("name") or None,
+            exclude=handler.get_arguments("exclude") or None,
+            pattern=handler.get_argument("pattern", None),
+            kinds=handler.get_arguments("kind") or None,
+            categories=handler.get_arguments("category") or None,
+            start=handler.get_argument("start", None),
+            end=handler.get_argument("end", None),
+        )
+    except ValueError as e:
+        raise tornado.web.HTTPError(400, str(e))
+
+
+def parse_query_selection(query: str) -> Selection:
+    """
+    Gets the selection of the data from a query string, e.g. "?name=a&kind=scalars",
+    which has the same arguments as the query arguments of get_selection.
+
+    Raises:
+        ValueError: If the selection is not valid.
+    """
+    arguments = urllib.parse.parse_qs(query.lstrip("?"), keep_blank_values=True)
+
+    def get_argument(name: str) -> Optional[str]:
+        # Same as tornado, the last one is used if it is given multiple times.
+        values = arguments.get(name)
+        return None if values is None else values[-1]
+
+    return parse_selection(
+        names=arguments.get("name"),
+        exclude=arguments.get("exclude"),
+        pattern=get_argument("pattern"),
+        kinds=arguments.get("kind"),
+        categories=arguments.get("category"),
+        start=get_argument("start"),
+        end=get_argument("end"),
+    )
 
 
 class ApiHandler(tornado.web.RequestHandler):
@@ -71,7 +343,7 @@ class ApiHandler(tornado.web.RequestHandler):
     Handler for the API to request the data
     """
 
-    def initialize(self, app: Application):
+    def initialize(self, app: Union[Application, AggregatorApplication]):
         self.app = app
 
     async def get(self, url: str):
@@ -80,15 +352,23 @@ class ApiHandler(tornado.web.RequestHandler):
             # The data may contain NaNs, and the regular JSON encoder creates NaN values
             # in the JSON, which are not allowed. With simplejson they can be replaced
             # with null.
-            self.write(simplejson.dumps(self.app.data.truncated, ignore_nan=True))
+            self.write(
+                simplejson.dumps(
+                    self.app.data.select(get_selection(self)), ignore_nan=True
+                )
+            )
         else:
+            assert isinstance(self.app, Application)
             parts = url.split("/", 3)
             if len(parts) == 4:
                 kind, name, step, category = parts
+                data = None
                 if step == "global":
                     data = self.app.data.get(kind, name, step, category)
                 elif step.isdigit():
                     data = self.app.data.get(kind, name, int(step), category)
+                if isinstance(data, FileRef):
+                    data = await self.resolve(data)
 
                 if data is not None:
                     self.set_header("Content-Type", "application/json; charset=UTF-8")
@@ -96,56 +376,537 @@ class ApiHandler(tornado.web.RequestHandler):
                     return
             raise tornado.web.HTTPError(404)
 
+    async def resolve(self, item: FileRef) -> Optional[Dict]:
+        assert isinstance(self.app, Application)
+        try:
+            # Loading large items from disk must not block the server.
+            return await tornado.ioloop.IOLoop.current().run_in_executor(
+                None, self.app.item_cache.resolve, item
+            )
+        except (OSError, ValueError):
+            # The file may have been removed in the meantime.
+            return None
+
+
+class DiffHandler(tornado.web.RequestHandler):
+    """
+    Handler for the diff between the actual and the expected text of a text item:
+    /api/diff/<name>/<step>/<category>?level=char|word|line
+    """
+
+    def initialize(self, app: Application):
+        self.app = app
+
+    async def get(self, name: str, step: str, category: str):
+        level = self.get_argument("level", "char")
+        if level not in DIFF_LEVELS:
+            raise tornado.web.HTTPError(
+                400, "level must be one of {}".format(" | ".join(DIFF_LEVELS))
+            )
+        if step == "global":
+            item = self.app.data.get("texts", name, step, category)
+        elif step.isdigit():
+            item = self.app.data.get("texts", name, int(step), category)
+        else:
+            item = None
+        if item is None:
+            raise tornado.web.HTTPError(404)
+        # Long texts take a while to load and diff, which must not block the server.
+        ioloop = tornado.ioloop.IOLoop.current()
+        try:
+            loaded = await ioloop.run_in_executor(
+                None, self.app.item_cache.resolve, item
+            )
+        except (OSError, ValueError):
+            loaded = None
+        if loaded is None:
+            raise tornado.web.HTTPError(404)
+        ops = await ioloop.run_in_executor(
+            None,
+            self.app.diff_cache.get,
+            (name, step, category),
+            item,
+            loaded,
+            level,
+        )
+        # Without an expected text there is nothing to diff, so it's just the text.
+        response = (
+            {"actual": loaded.get("actual", "")}
+            if ops is None
+            else {"level": level, "diff": ops}
+        )
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(simplejson.dumps(response))
+
+
+def get_search_arguments(
+    handler: tornado.web.RequestHandler, max_limit: int
+) -> Tuple[str, Optional[List[str]], Optional[List[str]], int, int]:
+    """
+    Gets the arguments of the search from the query arguments:
+    ?q=<query>&kind=<kind>&name=<name>&offset=<offset>&limit=<limit>
+
+    Returns:
+        arguments (Tuple[str, Optional[List[str]], Optional[List[str]], int, int]):
+            Query, kinds, names, offset and limit
+    """
+    query = handler.get_argument("q", "")
+    kinds = handler.get_arguments("kind") or None
+    names = handler.get_arguments("name") or None
+    if kinds is not None and any(kind not in SEARCH_KINDS for kind in kinds):
+        raise tornado.web.HTTPError(
+            400, "kind must be one of {}".format(" | ".join(SEARCH_KINDS))
+        )
+    try:
+        offset = int(handler.get_argument("offset", "0"))
+        limit = int(handler.get_argument("limit", "50"))
+    except ValueError:
+        raise tornado.web.HTTPError(400, "offset and limit must be integers")
+    if offset < 0 or limit < 0 or limit > max_limit:
+        raise tornado.web.HTTPError(
+            400, "offset must be >= 0 and limit within 0-{}".format(max_limit)
+        )
+    return query, kinds, names, offset, limit
+
+
+class SearchHandler(tornado.web.RequestHandler):
+    """
+    Handler for the full-text search of the texts, logs and markdown:
+    /api/search?q=<query>&kind=<kind>&name=<name>&offset=<offset>&limit=<limit>
+
+    Both kind and name can be given multiple times.
+    """
+
+    max_limit = 1000
+
+    def initialize(self, app: Application):
+        self.app = app
+
+    async def get(self):
+        query, kinds, names, offset, limit = get_search_arguments(self, self.max_limit)
+        index = self.app.search_index
+
+        def search():
+            # The index is kept up to date in the background, but the latest changes
+            # may not have been indexed yet.
+            index.sync(self.app.data)
+            return index.search(
+                query, kinds=kinds, names=names, offset=offset, limit=limit
+            )
+
+        total, hits = await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, search
+        )
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(
+            simplejson.dumps(
+                {
+                    "total": total,
+                    "offset": offset,
+                    "limit": limit,
+                    "hits": [hit._asdict() for hit in hits],
+                }
+            )
+        )
+
+
+class AggregatedSearchHandler(tornado.web.RequestHandler):
+    """
+    Handler for the full-text search when aggregating, which searches all upstreams
+    and merges their hits by their scores. The scores are only roughly comparable,
+    since each upstream ranks the hits by the statistics of its own data.
+    """
+
+    max_limit = SearchHandler.max_limit
+
+    def initialize(self, app: AggregatorApplication):
+        self.app = app
+
+    async def search_upstream(
+        self,
+        upstream: Upstream,
+        query: str,
+        kinds: Optional[List[str]],
+        names: Optional[List[str]],
+        limit: int,
+    ) -> Tuple[int, List[Dict]]:
+        arguments = [("q", query), ("offset", "0"), ("limit", str(limit))]
+        arguments.extend(("kind", kind) for kind in kinds or [])
+        arguments.extend(("name", name) for name in names or [])
+        response = await AsyncHTTPClient().fetch(
+            upstream.get_url(
+                "/api/search?{}".format(urllib.parse.urlencode(arguments))
+            ),
+            raise_error=False,
+        )
+        # An upstream that is not available just has no hits.
+        if response.code != 200:
+            return 0, []
+        result = simplejson.loads(response.body)
+        hits = result["hits"]
+        for hit in hits:
+            hit["name"] = prefix_name(upstream.prefix, hit["name"])
+        return result["total"], hits
+
+    async def get(self):
+        query, kinds, names, offset, limit = get_search_arguments(self, self.max_limit)
+        # Any hit of an upstream up to the requested page could be part of it.
+        if offset + limit > self.max_limit:
+            raise tornado.web.HTTPError(
+                400,
+                "offset + limit must be at most {} when aggregating".format(
+                    self.max_limit
+                ),
+            )
+        searches = []
+        for upstream in self.app.upstreams:
+            upstream_names = None
+            if names is not None:
+                upstream_names = [
+                    name
+                    for resolved_upstream, name in filter(
+                        None, map(self.app.resolve, names)
+                    )
+                    if resolved_upstream is upstream
+                ]
+                if len(upstream_names) == 0:
+                    continue
+            searches.append(
+                self.search_upstream(
+                    upstream, query, kinds, upstream_names, offset + limit
+                )
+            )
+        results = await asyncio.gather(*searches)
+        hits = sorted(
+            (hit for _, upstream_hits in results for hit in upstream_hits),
+            key=lambda hit: (
+                -hit["score"],
+                hit["name"],
+                hit["kind"],
+                hit["category"],
+                str(hit["step"]),
+            ),
+        )
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(
+            simplejson.dumps(
+                {
+                    "total": sum(total for total, _ in results),
+                    "offset": offset,
+                    "limit": limit,
+                    "hits": hits[offset : offset + limit],
+                }
+            )
+        )
+
+
+class NotAggregatedHandler(tornado.web.RequestHandler):
+    """
+    Handler for the API endpoints that are not available when aggregating, because
+    they need the full data, whereas the aggregator only has the truncated data.
+    """
+
+    def get(self, endpoint: str):
+        raise tornado.web.HTTPError(
+            501,
+            "/api/{} is not available when aggregating other servers, request it "
+            "from the servers directly".format(endpoint),
+        )
+
+
+class AggregateHandler(tornado.web.RequestHandler):
+    """
+    Handler for the statistics of the scalars across groups of experiments:
+    /api/aggregate?by=name&pattern=<regex>
+    /api/aggregate?by=command&ignore=<option>
+
+    Optionally with &category=<scalar>&quantile=<q>, which can be given multiple times
+    just like ignore.
+    """
+
+    def initialize(self, app: Application):
+        self.app = app
+
+    async def get(self):
+        if not HAS_NUMPY:
+            raise tornado.web.HTTPError(
+                501, "Aggregating scalars requires numpy to be installed"
+            )
+        by = self.get_argument("by", "name")
+        if by not in GROUP_BY:
+            raise tornado.web.HTTPError(
+                400, "by must be one of {}".format(" | ".join(GROUP_BY))
+            )
+        categories = self.get_arguments("category") or None
+        try:
+            quantiles = [float(q) for q in self.get_arguments("quantile")]
+        except ValueError:
+            raise tornado.web.HTTPError(400, "quantile must be a number")
+        if any(q < 0 or q > 1 for q in quantiles):
+            raise tornado.web.HTTPError(400, "quantile must be between 0 and 1")
+        # The data may change while aggregating, hence the same version is used for
+        # the grouping and all the statistics.
+        full = self.app.data.full
+        if by == "name":
+            pattern = self.get_argument("pattern")
+            try:
+                groups = group_by_name(full, pattern)
+            except re.error as e:
+                raise tornado.web.HTTPError(400, "invalid pattern: {}".format(e))
+        else:
+            groups = group_by_command(full, ignore=self.get_arguments("ignore"))
+        aggregated = await tornado.ioloop.IOLoop.current().run_in_executor(
+            None,
+            functools.partial(
+                self.app.scalar_aggregator.aggregate,
+                full,
+                groups,
+                categories=categories,
+                quantiles=quantiles or DEFAULT_QUANTILES,
+            ),
+        )
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(simplejson.dumps({"groups": aggregated}, ignore_nan=True))
+
+
+class ExportHandler(tornado.web.RequestHandler):
+    """
+    Handler to export the scalars as a table, which is streamed in batches:
+    /api/export?format=csv|parquet|arrow
+
+    The scalars can be selected with the same query arguments as /api/all.
+    """
+
+    def initialize(self, app: Application):
+        self.app = app
+
+    async def get(self):
+        # Only imported when exporting, since pyarrow is slow to import.
+        from .export import (
+            CONTENT_TYPES,
+            EXPORT_FORMATS,
+            HAS_PYARROW,
+            BufferSink,
+            create_writer,
+            iter_batches,
+            iter_data_scalars,
+        )
+
+        format = self.get_argument("format", "parquet" if HAS_PYARROW else "csv")
+        if format not in EXPORT_FORMATS:
+            raise tornado.web.HTTPError(
+                400, "format must be one of {}".format(" | ".join(EXPORT_FORMATS))
+            )
+        if format != "csv" and not HAS_PYARROW:
+            raise tornado.web.HTTPError(
+                501, "Exporting to {} requires pyarrow to be installed".format(format)
+            )
+        rows = iter_data_scalars(self.app.data, get_selection(self))
+        self.set_header("Content-Type", CONTENT_TYPES[format])
+        self.set_header(
+            "Content-Disposition", 'attachment; filename="scalars.{}"'.format(format)
+        )
+        sink = BufferSink()
+        writer = create_writer(sink, format)
+        io_loop = tornado.ioloop.IOLoop.current()
+        try:
+            for batch in iter_batches(rows):
+                # Encoding the batch (e.g. compressing Parquet) must not block the
+                # server.
+                await io_loop.run_in_executor(None, writer.write_batch, batch)
+                self.write(sink.take())
+                await self.flush()
+        except StreamClosedError:
+            return
+        finally:
+            writer.close()
+        self.write(sink.take())
+
 
 class EventHandler(tornado.web.RequestHandler):
     """
     Handler for the Server Sent Events to publish newly discovered data to the client
+
+    Each connection subscribes to the part of the data that it selected, with the same
+    query arguments as /api/all, and only receives the data when that part changed.
+    The first event is the id of the subscription (event: subscription), with which
+    the subscription can be changed without reconnecting, see SubscriptionHandler.
+
+    The updates are serialised once by the broadcast hub and shared by all
+    connections. A client that falls behind only receives the latest data once it
+    catches up.
     """
 
-    def initialize(self, app: Application):
+    def initialize(self, app: Union[Application, AggregatorApplication]):
         self.app = app
-        self.wait_future = None
+        self.subscriber: Optional[Subscriber] = None
+        self.event_id = 0
         self.set_header("content-type", "text/event-stream")
         self.set_header("cache-control", "no-cache")
         self.set_header("connection", "keep-alive")
 
-    async def publish(self):
+    async def publish(self, subscriber: Subscriber):
         try:
-            event_id = 0
-            self.wait_future = self.app.update_lock.wait()
+            self.write("event: subscription\n")
+            self.write("data: {}\n\n".format(subscriber.id))
+            await self.flush()
             while True:
-                # This is extremely silly. What would be done is that the wait() future
-                # is awaited and when it's resolved, the data is written and the loop
-                # starts over (waits again). But for some unknown reason it just
-                # doesn't resolve at all, even though notify_all() is called and all
-                # waiters are "finished".
-                # To work around that silliness, the loop waits for 1 sec and checks if
-                # the future is resolved and if that's the case the data is written
-                # (since the file watcher has notified that a change happened) and it
-                # begins with a new future.
-                # NOTE: That problem did not occur with debug=True, but oh well.
-                await tornado.gen.sleep(1)
-                if self.wait_future.done():
-                    event_id += 1
-                    self.wait_future = self.app.update_lock.wait()
-                    self.write("event: data\n")
-                    self.write("id: {}\n".format(event_id))
-                    self.write(
-                        "data: {}\n\n".format(
-                            simplejson.dumps(self.app.data.truncated, ignore_nan=True)
-                        )
-                    )
-                    await self.flush()
+                update = await subscriber.get()
+                if update is None:
+                    return
+                self.event_id += 1
+                self.write("event: data\n")
+                self.write("id: {}\n".format(self.event_id))
+                self.write(b"data: ")
+                self.write(update.json)
+                self.write(b"\n\n")
+                # Waits until it has been sent, any updates in the meantime are
+                # coalesced into the latest one.
+                await self.flush()
         except (StreamClosedError, asyncio.CancelledError):
             return
 
     async def get(self):
-        await self.publish()
+        # Each client only receives the part of the data it selected.
+        self.subscriber = self.app.hub.subscribe(get_selection(self))
+        try:
+            await self.publish(self.subscriber)
+        finally:
+            self.app.hub.unsubscribe(self.subscriber)
 
     # Automatically called when the client closes the connection
     def on_connection_close(self):
-        if self.wait_future is not None:
-            self.wait_future.cancel()
+        if self.subscriber is not None:
+            self.subscriber.close()
+
+
+class SubscriptionHandler(tornado.web.RequestHandler):
+    """
+    Handler to change the subscription of a connection to the events, which
+    immediately receives the newly selected data: PUT /events/<id>
+
+    It takes the same query arguments as /api/all.
+    With multiple workers, the request can reach a different worker than the one that
+    has the connection, in which case it is not found and the client needs to
+    reconnect with the new query arguments instead.
+    """
+
+    def initialize(self, app: Union[Application, AggregatorApplication]):
+        self.app = app
+
+    def put(self, subscription_id: str):
+        selection = get_selection(self)
+        subscriber = self.app.hub.subscribers.get(subscription_id)
+        if subscriber is None:
+            raise tornado.web.HTTPError(404, "Subscription not found")
+        self.app.hub.resubscribe(subscriber, selection)
+        self.set_status(204)
+
+
+class WebSocketHandler(tornado.websocket.WebSocketHandler):
+    """
+    Handler for the WebSocket to publish the data to the client in a binary encoding
+    (MessagePack), where the scalars are sent as typed arrays: /ws
+
+    The client first receives the whole data as {"type": "state", "id", "data"},
+    followed by {"type": "patch", "id", "ops"} containing only what changed since.
+    It takes the same query arguments as /api/all to select part of the data.
+    The selection can be changed by sending {"type": "subscribe", "query": "?..."} as
+    JSON, after which the client receives the whole newly selected data as a state.
+
+    A client that falls behind receives a single patch from the data it has to the
+    latest data once it catches up.
+    """
+
+    def initialize(self, app: Union[Application, AggregatorApplication]):
+        self.app = app
+        self.subscriber: Optional[Subscriber] = None
+        self.event_id = 0
+        # The data that the client has, to determine what changed, or None if it needs
+        # the whole data.
+        self.sent: Optional[Dict] = None
+
+    async def get(self, *args, **kwargs):
+        # The selection is parsed before the connection is upgraded, so that an invalid
+        # selection is a regular error response.
+        self.selection = get_selection(self)
+        await super().get(*args, **kwargs)
+
+    def get_compression_options(self) -> Optional[Dict]:
+        # Compresses the messages with the default options, if the client supports it.
+        return {}
+
+    def open(self):
+        self.subscriber = self.app.hub.subscribe(self.selection)
+        tornado.ioloop.IOLoop.current().spawn_callback(self.publish, self.subscriber)
+
+    async def send(self, message: Dict[str, Any]):
+        self.event_id += 1
+        # Waits until it has been sent, any updates in the meantime are coalesced.
+        await self.write_message(pack({**message, "id": self.event_id}), binary=True)
+
+    async def publish(self, subscriber: Subscriber):
+        try:
+            if subscriber.last is not None:
+                self.sent = subscriber.last
+                await self.send({"type": "state", "data": encode_data(self.sent)})
+            while True:
+                update = await subscriber.get()
+                if update is None:
+                    return
+                if self.sent is None:
+                    self.sent = update.data
+                    await self.send({"type": "state", "data": encode_data(self.sent)})
+                    continue
+                ops = diff_data(self.sent, update.data)
+                self.sent = update.data
+                if len(ops) > 0:
+                    await self.send({"type": "patch", "ops": ops})
+        except (tornado.websocket.WebSocketClosedError, asyncio.CancelledError):
+            return
+        finally:
+            self.app.hub.unsubscribe(subscriber)
+
+    async def on_message(self, message: Union[str, bytes]):
+        try:
+            request = simplejson.loads(message)
+            if request.get("type") != "subscribe":
+                raise ValueError("unknown message type: {}".format(request.get("type")))
+            selection = parse_query_selection(request.get("query", ""))
+        except (ValueError, AttributeError) as e:
+            await self.send({"type": "error", "message": str(e)})
+            return
+        if self.subscriber is not None:
+            # The newly selected data is sent as a whole.
+            self.sent = None
+            self.app.hub.resubscribe(self.subscriber, selection)
+
+    def on_close(self):
+        if self.subscriber is not None:
+            self.subscriber.close()
+
+
+# The precompressed files created when building the package, in order of preference.
+PRECOMPRESSED_ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+# The frontend files never change while the server is running, so looking up whether
+# they exist is only done once for each path.
+@functools.lru_cache(maxsize=1024)
+def find_frontend_file(root: str, path: str) -> str:
+    abspath = tornado.web.StaticFileHandler.get_absolute_path(root, path)
+    if not os.path.exists(abspath):
+        abspath = os.path.join(root, "index.html")
+    return abspath
+
+
+@functools.lru_cache(maxsize=1024)
+def find_precompressed_files(abspath: str) -> Tuple[Tuple[str, str], ...]:
+    return tuple(
+        (encoding, abspath + ext)
+        for encoding, ext in PRECOMPRESSED_ENCODINGS
+        if os.path.isfile(abspath + ext)
+    )
 
 
 class FrontendFileHandler(tornado.web.StaticFileHandler):
@@ -154,37 +915,156 @@ class FrontendFileHandler(tornado.web.StaticFileHandler):
 
     It's like a static file handler, except that when the file doesn't exist, index.html
     is served, regardless of the nesting of the path.
+    Files that have been compressed ahead of time are served in place of the original
+    file, if the client accepts the encoding, and the assets, whose names contain the
+    hash of their content, are cached indefinitely.
     """
 
     @classmethod
     def get_absolute_path(cls, root: str, path: str) -> str:
-        abspath = super().get_absolute_path(root, path)
-        if not os.path.exists(abspath):
-            abspath = os.path.join(root, "index.html")
-        return abspath
+        return find_frontend_file(root, path)
 
+    def validate_absolute_path(self, root: str, absolute_path: str) -> Optional[str]:
+        validated_path = super().validate_absolute_path(root, absolute_path)
+        self.uncompressed_path = validated_path
+        if validated_path is None:
+            return None
+        accept_encoding = self.request.headers.get("Accept-Encoding", "")
+        accepted = {enc.split(";")[0].strip() for enc in accept_encoding.split(",")}
+        for encoding, compressed_path in find_precompressed_files(validated_path):
+            if encoding in accepted:
+                self.set_header("Content-Encoding", encoding)
+                return compressed_path
+        return validated_path
 
-def run(log_dir: str, port: int = default_port, debug: bool = False):
-    app = Application(log_dir, debug=debug)
-    server = tornado.httpserver.HTTPServer(app)
+    def get_content_type(self) -> str:
+        # The content type is determined by the original file, not the compressed one.
+        mime_type, _ = mimetypes.guess_type(
+            self.uncompressed_path or self.absolute_path or ""
+        )
+        return mime_type or "application/octet-stream"
+
+    def get_content_size(self) -> int:
+        # The size needs to be from the file that is actually served.
+        assert self.absolute_path is not None
+        return os.path.getsize(self.absolute_path)
+
+    def set_extra_headers(self, path: str):
+        if path.startswith("assets/"):
+            self.set_header("Cache-Control", "public, max-age=31536000, immutable")
+        else:
+            # Everything else, most notably index.html, may change with a new version.
+            self.set_header("Cache-Control", "no-cache")
+
+
+def bind_sockets(port: int) -> List[socket.socket]:
     try:
-        sockets = tornado.netutil.bind_sockets(port)
+        return tornado.netutil.bind_sockets(port)
     except OSError as e:
         # Error code 98: Address already in use
         if e.errno != 98:
             raise
         print(f"⚠️ Port {port} already in use, choosing a random free port instead")
-        sockets = tornado.netutil.bind_sockets(0)
+        return tornado.netutil.bind_sockets(0)
+
+
+def run_scanner(
+    log_dir: str,
+    snapshot_path: Union[str, os.PathLike],
+    active_window: Optional[float] = None,
+):
+    """
+    Scans and watches the log directory and publishes the data as snapshots, which are
+    served by the workers.
+    """
+    from halo import Halo
+
+    with Halo("Scanning files"):
+        data = gather_data(log_dir)
+    # Nobody waits on the condition, the publisher checks the version of the data.
+    file_watcher = FileWatcher(
+        log_dir, data, locks.Condition(), active_window=active_window
+    )
+    publisher = SnapshotPublisher(data, snapshot_path)
+    try:
+        publisher.run()
+    finally:
+        file_watcher.stop()
+        shutil.rmtree(Path(snapshot_path).parent, ignore_errors=True)
+
+
+def run(
+    log_dir: str,
+    port: int = default_port,
+    debug: bool = False,
+    active_window: Optional[float] = None,
+    workers: int = 1,
+    cache_size: int = default_cache_size,
+):
+    if workers > 1:
+        if sys.platform == "win32":
+            raise RuntimeError("Multiple workers are not supported on Windows")
+        if debug:
+            raise RuntimeError("Multiple workers cannot be used in debug mode")
+        # The sockets are bound before forking, so that all workers share them.
+        sockets = bind_sockets(port)
+        actual_port = sockets[0].getsockname()[1]
+        snapshot_path = Path(tempfile.mkdtemp(prefix="lavd-"), SNAPSHOT_FILE)
+        print(f"⇒ Running on http://localhost:{actual_port} with {workers} workers")
+        # One additional process is started, which is the scanner that maintains the
+        # data, whereas all others are the workers that serve it.
+        task_id = tornado.process.fork_processes(workers + 1)
+        if task_id == 0:
+            run_scanner(log_dir, snapshot_path, active_window=active_window)
+            return
+        wait_for_snapshot(snapshot_path)
+        app = Application(log_dir, snapshot_path=snapshot_path, cache_size=cache_size)
+    else:
+        app = Application(
+            log_dir, debug=debug, active_window=active_window, cache_size=cache_size
+        )
+        sockets = bind_sockets(port)
+        actual_port = sockets[0].getsockname()[1]
+        print(f"⇒ Running on http://localhost:{actual_port}")
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+    tornado.ioloop.IOLoop.current().start()
+
+
+def run_aggregator(upstreams: List[str], port: int = default_port, debug: bool = False):
+    app = AggregatorApplication(
+        [parse_upstream(upstream) for upstream in upstreams], debug=debug
+    )
+    sockets = bind_sockets(port)
     actual_port = sockets[0].getsockname()[1]
+    print(f"⇒ Aggregating {len(upstreams)} servers on http://localhost:{actual_port}")
+    server = tornado.httpserver.HTTPServer(app)
     server.add_sockets(sockets)
-    print(f"⇒ Running on http://localhost:{actual_port}")
+    app.start()
     tornado.ioloop.IOLoop.current().start()
 
 
-def parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser()
+def parse_args(
+    args: Optional[List[str]] = None, prog: Optional[str] = None
+) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        # Keeps the commands on separate lines.
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=(
+            "commands:\n"
+            "  lavd serve LOG_DIR             Serves LOG_DIR, even if it is named like "
+            "a command\n"
+            "  lavd export LOG_DIR -o OUTPUT  Exports the scalars as a table "
+            "(see lavd export --help)\n"
+            "  lavd compact EXPERIMENT        Compacts finished experiments "
+            "(see lavd compact --help)\n"
+            "  lavd build-static LOG_DIR OUT  Builds a static version of the "
+            "dashboard (see lavd build-static --help)"
+        ),
+    )
     parser.add_argument(
-        "log_dir", metavar="LOG_DIR", nargs=1, help="Directory containing the logs"
+        "log_dir", metavar="LOG_DIR", nargs="?", help="Directory containing the logs"
     )
     parser.add_argument("-v", "--version", action="version", version=__version__)
     parser.add_argument(
@@ -198,12 +1078,100 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--debug", dest="debug", action="store_true", help="Run server in debug mode"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help=(
+            "Number of worker processes to serve the requests. With more than one "
+            "worker, a separate process scans the log directory and shares the data "
+            "with all workers. [Default: 1]"
+        ),
+    )
+    parser.add_argument(
+        "--active-window",
+        dest="active_window",
+        type=float,
+        help=(
+            "Only watch experiments recursively that have been modified within the "
+            "given number of seconds, all others are checked periodically for new "
+            "activity. Greatly reduces the number of watches for log directories "
+            "with many finished experiments. [Default: watch everything]"
+        ),
+    )
+    parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        type=float,
+        default=default_cache_size / 1024 / 1024,
+        help=(
+            "Maximum size in MiB of the large texts, logs and markdown that are kept "
+            "in memory (per worker), which is measured by the estimated memory of the "
+            "loaded items. "
+            "All others are read from disk when requested. [Default: {:g}]".format(
+                default_cache_size / 1024 / 1024
+            )
+        ),
+    )
+    parser.add_argument(
+        "-u",
+        "--upstream",
+        dest="upstreams",
+        action="append",
+        metavar="[PREFIX=]URL",
+        help=(
+            "Aggregate the data of another lavd server instead of serving a log "
+            "directory. Can be specified multiple times, and the experiments of each "
+            "server are prefixed with PREFIX (the host of the URL if not given)."
+        ),
+    )
+    options = parser.parse_args(args)
+    if options.log_dir is None and options.upstreams is None:
+        parser.error("either LOG_DIR or at least one --upstream is required")
+    if options.log_dir is not None and options.upstreams is not None:
+        parser.error("LOG_DIR and --upstream cannot be used together")
+    return options
+
+
+def main(args: Optional[List[str]] = None):
+    if args is None:
+        args = sys.argv[1:]
+    command = args[0] if len(args) > 0 else None
+    # Subcommands are dispatched before parsing the arguments of the server, since its
+    # log directory is an optional positional argument. A log directory that has the
+    # same name as one of the commands can be served with lavd serve LOG_DIR.
+    if command == "export":
+        from .export import main as export_main
+
+        export_main(args[1:])
+        return
+    if command == "compact":
+        from .compact import main as compact_main
 
+        compact_main(args[1:])
+        return
+    if command == "build-static":
+        from .static_site import main as build_static_main
 
-def main():
-    options = parse_args()
-    run(options.log_dir[0], port=options.port, debug=options.debug)
+        build_static_main(args[1:])
+        return
+    if command == "serve":
+        options = parse_args(args[1:], prog="lavd serve")
+    else:
+        options = parse_args(args)
+    if options.upstreams is not None:
+        run_aggregator(options.upstreams, port=options.port, debug=options.debug)
+    else:
+        run(
+            options.log_dir,
+            port=options.port,
+            debug=options.debug,
+            active_window=options.active_window,
+            workers=options.workers,
+            cache_size=int(options.cache_size * 1024 * 1024),
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,269 @@
+import mmap
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set, Tuple, Union
+
+from .data import Data
+
+SNAPSHOT_FILE = "data.snapshot"
+SHARDS_DIR = "shards"
+
+# Path of a shard within an experiment, either (kind, category) or just (kind,) for
+# the ones without categories, e.g. the command.
+ShardPath = Tuple[str, ...]
+# Full and truncated data of a shard.
+ShardData = Tuple[Any, Any]
+
+
+def write_pickle(value: Any, path: Union[str, os.PathLike]):
+    """
+    Writes the pickled value to the given path.
+
+    It is written to a temporary file first, which is then renamed, so that readers
+    never see a partially written file.
+    """
+    path = Path(path)
+    tmp_path = path.with_name("{}.tmp".format(path.name))
+    with open(tmp_path, "wb") as fd:
+        pickle.dump(value, fd, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_pickle(path: Union[str, os.PathLike]) -> Any:
+    # Memory-mapped rather than read into an intermediate buffer.
+    with open(path, "rb") as fd:
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return pickle.loads(mapped)
+
+
+def iterate_shards(
+    name_data: Dict, truncated_name_data: Dict
+) -> Iterator[Tuple[ShardPath, ShardData]]:
+    """
+    Splits the data of an experiment into its shards, which are the categories,
+    since they are modified independently of each other.
+    """
+    for kind, kind_data in name_data.items():
+        truncated_kind_data = truncated_name_data.get(kind)
+        if kind == "command" or not isinstance(kind_data, dict) or len(kind_data) == 0:
+            yield (kind,), (kind_data, truncated_kind_data)
+            continue
+        for category, category_data in kind_data.items():
+            yield (kind, category), (
+                category_data,
+                (
+                    None
+                    if truncated_kind_data is None
+                    else truncated_kind_data.get(category)
+                ),
+            )
+
+
+def assemble_experiment(shards: Dict[ShardPath, ShardData]) -> Tuple[Dict, Dict]:
+    name_data: Dict = {}
+    truncated_name_data: Dict = {}
+    for path, (value, truncated_value) in shards.items():
+        if len(path) == 1:
+            name_data[path[0]] = value
+            if truncated_value is not None:
+                truncated_name_data[path[0]] = truncated_value
+            continue
+        kind, category = path
+        name_data.setdefault(kind, {})[category] = value
+        if truncated_value is not None:
+            truncated_name_data.setdefault(kind, {})[category] = truncated_value
+    return name_data, truncated_name_data
+
+
+def get_snapshot_id(path: Union[str, os.PathLike]) -> Optional[Tuple[int, int]]:
+    # Every snapshot is a new file (renamed over the old one), hence the inode and
+    # modification time identify a specific snapshot.
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+
+class SnapshotPublisher:
+    """
+    Publishes snapshots of the data whenever it changed, so that other processes can
+    serve the data without having to scan and watch the log directory themselves.
+
+    Each category of an experiment is written to its own file (shard), which is only
+    written again once it has been modified, and the snapshot itself just lists the
+    shards of each experiment. A change therefore only writes the categories that were
+    modified, and the subscribers only need to load those.
+    """
+
+    def __init__(
+        self,
+        data: Data,
+        path: Union[str, os.PathLike],
+        interval: float = 0.5,
+    ):
+        """
+        Arguments:
+            data (Data):
+                Data to publish
+            path (str | os.PathLike):
+                Path to the snapshot file, the shards are stored next to it.
+            interval (float):
+                Minimum number of seconds between two snapshots. Changes within that
+                time are combined into one snapshot.
+                [Default: 0.5]
+        """
+        super().__init__()
+        self.data = data
+        self.path = Path(path)
+        self.shards_dir = self.path.parent / SHARDS_DIR
+        self.interval = interval
+        self.published_version: Optional[int] = None
+        self.stop_event = threading.Event()
+        self.num_shards = 0
+        # Published shards with the data they were written from, which is compared by
+        # identity, since the data is copy-on-write.
+        self.shards: Dict[str, Dict[ShardPath, Tuple[ShardData, str]]] = {}
+        # Shards that are no longer part of the latest snapshot, but are kept until the
+        # next one, since subscribers may still be loading the previous snapshot.
+        self.stale_files: Set[str] = set()
+
+    def write_shard(self, shard: ShardData) -> str:
+        file_name = "{}.shard".format(self.num_shards)
+        self.num_shards += 1
+        write_pickle(shard, self.shards_dir / file_name)
+        return file_name
+
+    def publish_experiment(
+        self, name: str, name_data: Dict, truncated_name_data: Dict
+    ) -> Dict[ShardPath, Tuple[ShardData, str]]:
+        previous = self.shards.get(name, {})
+        shards = {}
+        for path, shard in iterate_shards(name_data, truncated_name_data):
+            published = previous.get(path)
+            if (
+                published is not None
+                and published[0][0] is shard[0]
+                and published[0][1] is shard[1]
+            ):
+                shards[path] = published
+            else:
+                shards[path] = (shard, self.write_shard(shard))
+        return shards
+
+    def publish(self):
+        snapshot = self.data.snapshot()
+        if snapshot.version == self.published_version:
+            return
+        self.shards_dir.mkdir(parents=True, exist_ok=True)
+        full, truncated = snapshot.state
+        shards = {
+            name: self.publish_experiment(name, name_data, truncated.get(name, {}))
+            for name, name_data in full.items()
+        }
+        write_pickle(
+            {
+                name: {path: file_name for path, (_, file_name) in paths.items()}
+                for name, paths in shards.items()
+            },
+            self.path,
+        )
+        current_files = {
+            file_name for paths in shards.values() for _, file_name in paths.values()
+        }
+        for file_name in self.stale_files:
+            try:
+                os.remove(self.shards_dir / file_name)
+            except FileNotFoundError:
+                pass
+        self.stale_files = {
+            file_name
+            for paths in self.shards.values()
+            for _, file_name in paths.values()
+            if file_name not in current_files
+        }
+        self.shards = shards
+        self.published_version = snapshot.version
+
+    def run(self):
+        self.publish()
+        while not self.stop_event.wait(self.interval):
+            self.publish()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class SnapshotSubscriber:
+    """
+    Keeps the data up to date with the snapshots published by a SnapshotPublisher.
+
+    Only the shards that changed are loaded, and the experiments that did not change
+    at all are kept as they are, so they keep their identity, just like in the
+    copy-on-write data of the publisher.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        """
+        Arguments:
+            path (str | os.PathLike):
+                Path to the snapshot file
+        """
+        super().__init__()
+        self.path = Path(path)
+        self.shards_dir = self.path.parent / SHARDS_DIR
+        self.snapshot_id: Optional[Tuple[int, int]] = None
+        # Files of the shards of each experiment in the loaded snapshot.
+        self.files: Dict[str, Dict[ShardPath, str]] = {}
+        self.shards: Dict[str, ShardData] = {}
+        self.data = Data()
+        self.reload()
+
+    def reload(self) -> bool:
+        """
+        Reloads the data if a new snapshot has been published.
+
+        Returns:
+            changed (bool):
+                Whether a new snapshot has been loaded.
+        """
+        snapshot_id = get_snapshot_id(self.path)
+        if snapshot_id is None or snapshot_id == self.snapshot_id:
+            return False
+        full, truncated = self.data.state
+        new_full = {}
+        new_truncated = {}
+        shards = {}
+        try:
+            files = load_pickle(self.path)
+            for name, paths in files.items():
+                for file_name in paths.values():
+                    shard = self.shards.get(file_name)
+                    if shard is None:
+                        shard = load_pickle(self.shards_dir / file_name)
+                    shards[file_name] = shard
+                if paths == self.files.get(name):
+                    new_full[name] = full[name]
+                    new_truncated[name] = truncated[name]
+                else:
+                    new_full[name], new_truncated[name] = assemble_experiment(
+                        {path: shards[file_name] for path, file_name in paths.items()}
+                    )
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, ValueError):
+            # The snapshot may have been replaced in the meantime, or its shards may
+            # have been removed already, the new one will be loaded on the next
+            # attempt.
+            return False
+        self.files = files
+        self.shards = shards
+        self.data = Data(new_full, new_truncated)
+        self.snapshot_id = snapshot_id
+        return True
+
+
+def wait_for_snapshot(path: Union[str, os.PathLike], timeout: float = 0.1):
+    while get_snapshot_id(path) is None:
+        time.sleep(timeout)
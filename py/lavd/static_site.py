@@ -0,0 +1,239 @@
+import argparse
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import simplejson
+
+from .diff import compute_diff
+from .fs import gather_data
+from .items import load_item
+
+package_dir = Path(__file__).absolute().parent
+
+# Routes of the frontend, which get a copy of index.html, since a static file server
+# cannot fall back to it for paths that do not exist.
+FRONTEND_ROUTES = ["scalars", "images", "text", "logs", "markdown"]
+# Tells the frontend to read the data from the static files.
+STATIC_SCRIPT = "<script>window.lavdStatic = true;</script>"
+
+
+class BuildStats(NamedTuple):
+    num_experiments: int = 0
+    num_shards: int = 0
+    num_items: int = 0
+    num_images: int = 0
+
+
+def write_json(path: Path, content: Any):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fd:
+        # NaN and Infinity are not valid JSON, they are null just like in the API.
+        simplejson.dump(content, fd, ignore_nan=True)
+
+
+def iter_category_items(
+    kind_data: Dict,
+) -> Iterator[Tuple[Union[str, int], str, Dict]]:
+    for category, category_data in kind_data.items():
+        global_item = category_data.get("global")
+        if global_item is not None:
+            yield "global", category, global_item
+        for step, item in category_data.get("steps", {}).items():
+            yield step, category, item
+
+
+def diff_text(item: Dict) -> Dict:
+    # Same as the response of /api/diff, at its default level.
+    actual = item.get("actual", "")
+    expected = item.get("expected")
+    if expected is None:
+        return {"actual": actual}
+    return {"level": "char", "diff": compute_diff(actual, expected, level="char")}
+
+
+def copy_if_changed(source: Path, dest: Path) -> bool:
+    # Rebuilding into the same directory only copies the files that changed, which
+    # matters for the images.
+    try:
+        source_stat = source.stat()
+    except OSError:
+        return False
+    try:
+        dest_stat = dest.stat()
+        if (
+            dest_stat.st_size == source_stat.st_size
+            and dest_stat.st_mtime == source_stat.st_mtime
+        ):
+            return True
+    except OSError:
+        pass
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(source, dest)
+    return True
+
+
+def copy_frontend(frontend_dir: Path, out_dir: Path):
+    for source in frontend_dir.rglob("*"):
+        if not source.is_file():
+            continue
+        rel_path = source.relative_to(frontend_dir)
+        # index.html is modified, so the precompressed versions would be outdated.
+        if rel_path.parts[0].startswith("index.html"):
+            continue
+        copy_if_changed(source, out_dir / rel_path)
+    index = (frontend_dir / "index.html").read_text(encoding="utf-8")
+    index = index.replace("</head>", "{}</head>".format(STATIC_SCRIPT), 1)
+    for route in ["", *FRONTEND_ROUTES]:
+        index_path = out_dir / route / "index.html"
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        index_path.write_text(index, encoding="utf-8")
+
+
+def build_static(
+    log_dir: Union[str, os.PathLike],
+    out_dir: Union[str, os.PathLike],
+    frontend_dir: Union[str, os.PathLike] = package_dir / "static",
+    copy_images: bool = True,
+) -> BuildStats:
+    """
+    Builds a static version of the dashboard, which can be hosted by any static file
+    server, without running lavd.
+
+    The data is written as the files, which the frontend would otherwise request from
+    the server:
+        - api/all/index.json: Names of the experiments and their kinds
+        - api/all/<name>/<kind>.json: Truncated data of a kind of an experiment
+        - api/<kind>/<name>/<step>/<category>.json: Items that are too large to be
+          included in the truncated data.
+        - api/diff/<name>/<step>/<category>.json: Diffs of these texts
+        - data/<name>/...: Images
+
+    It needs to be hosted at the root of the domain, since all paths are absolute.
+
+    Arguments:
+        log_dir (str | os.PathLike):
+            Directory containing the logs
+        out_dir (str | os.PathLike):
+            Directory where the static files are written to
+        frontend_dir (str | os.PathLike):
+            Directory of the built frontend
+            [Default: The frontend shipped with the package]
+        copy_images (bool):
+            Whether to copy the images, otherwise they need to be made available
+            separately, e.g. with a symlink.
+            [Default: True]
+
+    Returns:
+        stats (BuildStats):
+            Number of experiments, shards, items and images that were written.
+    """
+    log_dir = Path(log_dir).absolute()
+    out_dir = Path(out_dir).absolute()
+    frontend_dir = Path(frontend_dir)
+    if not (frontend_dir / "index.html").is_file():
+        raise FileNotFoundError(
+            "The frontend has not been built, {} does not exist".format(
+                frontend_dir / "index.html"
+            )
+        )
+    data = gather_data(log_dir)
+    full = data.full
+    truncated = data.truncated
+    api_dir = out_dir / "api"
+    index: Dict[str, List[str]] = {}
+    num_shards = 0
+    num_items = 0
+    num_images = 0
+    for name, name_data in sorted(truncated.items()):
+        index[name] = sorted(name_data.keys())
+        for kind, kind_data in name_data.items():
+            write_json(api_dir / "all" / name / "{}.json".format(kind), kind_data)
+            num_shards += 1
+            if kind == "command":
+                continue
+            full_kind_data = full[name][kind]
+            for step, category, item in iter_category_items(kind_data):
+                if "api" not in item:
+                    continue
+                full_item = load_item(
+                    full_kind_data[category]["global"]
+                    if step == "global"
+                    else full_kind_data[category]["steps"][step]
+                )
+                item_path = Path(name, str(step), "{}.json".format(category))
+                write_json(api_dir / kind / item_path, full_item)
+                num_items += 1
+                if kind == "texts":
+                    write_json(api_dir / "diff" / item_path, diff_text(full_item))
+            if kind == "images" and copy_images:
+                for _, _, item in iter_category_items(full_kind_data):
+                    source = item.get("source", "")
+                    if not source.startswith("/data/"):
+                        continue
+                    rel_path = source[len("/data/") :]
+                    if copy_if_changed(log_dir / rel_path, out_dir / "data" / rel_path):
+                        num_images += 1
+    write_json(api_dir / "all" / "index.json", index)
+    copy_frontend(frontend_dir, out_dir)
+    return BuildStats(
+        num_experiments=len(index),
+        num_shards=num_shards,
+        num_items=num_items,
+        num_images=num_images,
+    )
+
+
+def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="lavd build-static",
+        description=(
+            "Builds a static version of the dashboard, which can be hosted by any "
+            "static file server at the root of a domain"
+        ),
+    )
+    parser.add_argument(
+        "log_dir", metavar="LOG_DIR", help="Directory containing the logs"
+    )
+    parser.add_argument(
+        "out_dir", metavar="OUT_DIR", help="Directory where the files are written to"
+    )
+    parser.add_argument(
+        "--frontend",
+        dest="frontend_dir",
+        default=package_dir / "static",
+        help="Directory of the built frontend [Default: the one shipped with lavd]",
+    )
+    parser.add_argument(
+        "--no-images",
+        dest="copy_images",
+        action="store_false",
+        help="Do not copy the images, they need to be served from OUT_DIR/data",
+    )
+    return parser.parse_args(args)
+
+
+def main(args: Optional[List[str]] = None):
+    options = parse_args(args)
+    if not Path(options.log_dir).is_dir():
+        sys.exit("{} is not a directory".format(options.log_dir))
+    try:
+        stats = build_static(
+            options.log_dir,
+            options.out_dir,
+            frontend_dir=options.frontend_dir,
+            copy_images=options.copy_images,
+        )
+    except FileNotFoundError as e:
+        sys.exit(str(e))
+    print(
+        "Built {} experiments into {}: {} shards, {} items and {} images".format(
+            stats.num_experiments,
+            options.out_dir,
+            stats.num_shards,
+            stats.num_items,
+            stats.num_images,
+        )
+    )
@@ -0,0 +1,322 @@
+import re
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+GROUP_BY = ["name", "command"]
+DEFAULT_QUANTILES = [0.25, 0.5, 0.75]
+
+
+class Group(NamedTuple):
+    name: str
+    members: List[str]
+
+
+def group_by_name(full: Dict, pattern: str) -> List[Group]:
+    """
+    Groups the experiments whose names are the same once the pattern is removed, e.g.
+    the pattern "-seed\\d+" groups "resnet-seed1" and "resnet-seed2" into "resnet".
+    Experiments that do not match the pattern are not part of any group.
+
+    Arguments:
+        full (dict):
+            Full data of the experiments, see Data.full
+        pattern (str):
+            Regular expression of the part of the names that differs within a group
+
+    Returns:
+        groups (List[Group]):
+            Groups of the experiments, sorted by their names
+    """
+    regex = re.compile(pattern)
+    groups: Dict[str, List[str]] = {}
+    for name in sorted(full.keys()):
+        if regex.search(name) is None:
+            continue
+        groups.setdefault(regex.sub("", name), []).append(name)
+    return [Group(name=key, members=members) for key, members in sorted(groups.items())]
+
+
+def group_by_command(full: Dict, ignore: List[str] = []) -> List[Group]:
+    """
+    Groups the experiments that were run with the same command line arguments, except
+    for the ignored options, e.g. ignoring "seed" groups the runs that only differ in
+    their seed. Experiments without a command are not part of any group.
+
+    Arguments:
+        full (dict):
+            Full data of the experiments, see Data.full
+        ignore (List[str]):
+            Names of the options that may differ within a group, without the leading
+            dashes.
+            [Default: []]
+
+    Returns:
+        groups (List[Group]):
+            Groups of the experiments, sorted by their names, which are the arguments
+            they have in common.
+    """
+    groups: Dict[str, List[str]] = {}
+    for name, name_data in sorted(full.items()):
+        command = name_data.get("command")
+        if command is None:
+            continue
+        arguments = command.get("arguments", {})
+        options = {
+            key: value
+            for key, value in arguments.get("options", {}).items()
+            if key not in ignore
+        }
+        key = " ".join(
+            [
+                *[str(value) for value in arguments.get("positional", [])],
+                *["--{}={}".format(k, v) for k, v in sorted(options.items())],
+            ]
+        )
+        groups.setdefault(key, []).append(name)
+    return [Group(name=key, members=members) for key, members in sorted(groups.items())]
+
+
+def to_float(item: Optional[Dict]) -> float:
+    value = None if item is None else item.get("value")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return float("nan")
+    return float(value)
+
+
+def to_arrays(source: Dict) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Converts the steps of a scalar to an array of the steps and one of their values.
+    """
+    steps = [step for step in source if isinstance(step, int)]
+    return (
+        np.fromiter(steps, dtype=np.int64, count=len(steps)),
+        np.fromiter(
+            (to_float(source[step]) for step in steps),
+            dtype=np.float64,
+            count=len(steps),
+        ),
+    )
+
+
+class SeriesStats:
+    """
+    Statistics per step of the same scalar across multiple experiments.
+
+    The values are kept as a matrix of experiments x steps, where missing steps are
+    NaN. When the steps of an experiment change, only its row is replaced and the
+    statistics are only recomputed for the steps whose values changed, which is
+    usually just the few new steps at the end.
+    """
+
+    def __init__(self, num_members: int, quantiles: Tuple[float, ...]):
+        super().__init__()
+        self.quantiles = quantiles
+        # The steps of each member that are in the matrix, the dictionaries are never
+        # modified, hence the same dictionary means that nothing changed.
+        self.sources: List[Optional[Dict]] = [None] * num_members
+        self.steps = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros((num_members, 0), dtype=np.float64)
+        self.stats: Dict[str, Any] = self.empty_stats(0)
+
+    def empty_stats(self, num_steps: int) -> Dict[str, Any]:
+        return {
+            "count": np.zeros(num_steps, dtype=np.int64),
+            "mean": np.full(num_steps, np.nan),
+            "std": np.full(num_steps, np.nan),
+            "min": np.full(num_steps, np.nan),
+            "max": np.full(num_steps, np.nan),
+            "quantiles": np.full((len(self.quantiles), num_steps), np.nan),
+        }
+
+    def add_steps(self, new_steps: "np.ndarray") -> "np.ndarray":
+        steps = np.union1d(self.steps, new_steps)
+        # Existing steps keep their values, they just move to their new columns.
+        columns = np.searchsorted(steps, self.steps)
+        values = np.full((self.values.shape[0], len(steps)), np.nan)
+        values[:, columns] = self.values
+        stats = self.empty_stats(len(steps))
+        for key, stat in self.stats.items():
+            stats[key][..., columns] = stat
+        self.steps = steps
+        self.values = values
+        self.stats = stats
+        return np.searchsorted(steps, new_steps)
+
+    def update(self, sources: List[Optional[Dict]]) -> bool:
+        """
+        Updates the values to the given steps of each member.
+
+        Arguments:
+            sources (List[dict, optional]):
+                Steps of the scalar for each member, or None if a member does not have
+                that scalar.
+
+        Returns:
+            changed (bool):
+                Whether any of the values changed.
+        """
+        changed = [
+            i for i, source in enumerate(sources) if source is not self.sources[i]
+        ]
+        if len(changed) == 0:
+            return False
+        arrays = {i: to_arrays(sources[i] or {}) for i in changed}
+        new_steps = np.setdiff1d(
+            np.concatenate(
+                [np.zeros(0, dtype=np.int64), *[steps for steps, _ in arrays.values()]]
+            ),
+            self.steps,
+        )
+        dirty = np.zeros(len(self.steps) + len(new_steps), dtype=bool)
+        if len(new_steps) > 0:
+            dirty[self.add_steps(new_steps)] = True
+        for i, (steps, values) in arrays.items():
+            row = np.full(len(self.steps), np.nan)
+            row[np.searchsorted(self.steps, steps)] = values
+            old_row = self.values[i]
+            dirty |= ~((row == old_row) | (np.isnan(row) & np.isnan(old_row)))
+            self.values[i] = row
+            self.sources[i] = sources[i]
+        columns = np.flatnonzero(dirty)
+        if len(columns) > 0:
+            self.compute(columns)
+        return True
+
+    def compute(self, columns: "np.ndarray"):
+        values = self.values[:, columns]
+        # Steps without any values are expected, their statistics are just NaN.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            self.stats["count"][columns] = np.sum(~np.isnan(values), axis=0)
+            self.stats["mean"][columns] = np.nanmean(values, axis=0)
+            self.stats["std"][columns] = np.nanstd(values, axis=0)
+            self.stats["min"][columns] = np.nanmin(values, axis=0)
+            self.stats["max"][columns] = np.nanmax(values, axis=0)
+            if len(self.quantiles) > 0:
+                self.stats["quantiles"][:, columns] = np.nanquantile(
+                    values, self.quantiles, axis=0
+                )
+
+    def to_dict(self) -> Dict:
+        # Steps that no longer have any values (e.g. removed) are left out.
+        present = self.stats["count"] > 0
+        return {
+            "steps": self.steps[present].tolist(),
+            "count": self.stats["count"][present].tolist(),
+            "mean": self.stats["mean"][present].tolist(),
+            "std": self.stats["std"][present].tolist(),
+            "min": self.stats["min"][present].tolist(),
+            "max": self.stats["max"][present].tolist(),
+            "quantiles": {
+                str(q): self.stats["quantiles"][i][present].tolist()
+                for i, q in enumerate(self.quantiles)
+            },
+        }
+
+
+class ScalarAggregator:
+    """
+    Aggregates the scalars of groups of experiments, e.g. the same configuration run
+    with different seeds, into statistics per step (count, mean, std, min, max and
+    quantiles).
+
+    The statistics of each group and scalar are cached and only updated for the steps
+    that changed, which makes it cheap to aggregate them repeatedly while the
+    experiments are running.
+
+    Requires numpy
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        Arguments:
+            max_entries (int):
+                Maximum number of statistics (group and scalar) to keep.
+                [Default: 256]
+        """
+        super().__init__()
+        self.max_entries = max_entries
+        self.entries: OrderedDict[Tuple, SeriesStats] = OrderedDict()
+        # Aggregations are computed in a thread pool.
+        self.lock = threading.Lock()
+
+    def get_stats(
+        self,
+        full: Dict,
+        members: List[str],
+        category: str,
+        quantiles: Tuple[float, ...],
+    ) -> Dict:
+        sources = [
+            full.get(name, {}).get("scalars", {}).get(category, {}).get("steps")
+            for name in members
+        ]
+        key = (tuple(members), category, quantiles)
+        with self.lock:
+            series = self.entries.get(key)
+            if series is None:
+                series = SeriesStats(len(members), quantiles)
+                self.entries[key] = series
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            series.update(sources)
+            return series.to_dict()
+
+    def aggregate(
+        self,
+        full: Dict,
+        groups: List[Group],
+        categories: Optional[List[str]] = None,
+        quantiles: List[float] = DEFAULT_QUANTILES,
+    ) -> List[Dict]:
+        """
+        Aggregates the scalars of each group.
+
+        Arguments:
+            full (dict):
+                Full data of the experiments, see Data.full, which must be the same
+                version that the groups were created from.
+            groups (List[Group]):
+                Groups of experiments to aggregate
+            categories (List[str], optional):
+                Scalars to aggregate. If not specified, all scalars of the members
+                are aggregated.
+            quantiles (List[float]):
+                Quantiles to compute, between 0 and 1.
+                [Default: [0.25, 0.5, 0.75]]
+
+        Returns:
+            aggregated (List[dict]):
+                Name, members and the statistics per scalar of each group.
+        """
+        assert HAS_NUMPY, "Aggregating scalars requires numpy to be installed"
+        out = []
+        for group in groups:
+            group_categories = categories
+            if group_categories is None:
+                group_categories = sorted(
+                    {
+                        category
+                        for name in group.members
+                        for category in full.get(name, {}).get("scalars", {})
+                    }
+                )
+            scalars = {}
+            for category in group_categories:
+                scalars[category] = self.get_stats(
+                    full, group.members, category, tuple(quantiles)
+                )
+            out.append(
+                {"name": group.name, "members": group.members, "scalars": scalars}
+            )
+        return out
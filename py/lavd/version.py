@@ -0,0 +1,2 @@
+__version__ = "0.2.7"
+git_commit = "x"
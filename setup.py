@@ -1,9 +1,11 @@
+import gzip
 import json
 import os
 import subprocess
 from pathlib import Path
 from typing import Union
 
+import brotli
 from setuptools import setup
 
 
@@ -23,6 +25,11 @@ version = read_version("package.json")
 readme = read_file("README.md")
 
 requirements = ["halo", "Pillow", "simplejson", "tornado", "tqdm", "watchdog"]
+extra_requirements = {
+    # Keeps the connections to the upstreams alive, instead of opening a new one for
+    # every request.
+    "aggregator": ["pycurl"],
+}
 
 
 try:
@@ -43,8 +50,29 @@ def generate_version():
         version_fd.write('git_commit = "{}"\n'.format(git_hash))
 
 
+# The text based files of the frontend are compressed ahead of time, so that the server
+# can serve them directly instead of compressing them for every request.
+COMPRESSIBLE_EXTENSIONS = [".html", ".js", ".css", ".map", ".json", ".svg", ".txt"]
+
+
+def compress_static():
+    static_dir = root_dir / "py" / "lavd" / "static"
+    if not static_dir.is_dir():
+        return
+    for path in static_dir.rglob("*"):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE_EXTENSIONS:
+            continue
+        content = path.read_bytes()
+        with open(path.with_name(path.name + ".gz"), "wb") as fd:
+            # The mtime is fixed to make the build reproducible.
+            fd.write(gzip.compress(content, compresslevel=9, mtime=0))
+        with open(path.with_name(path.name + ".br"), "wb") as fd:
+            fd.write(brotli.compress(content, mode=brotli.MODE_TEXT))
+
+
 if __name__ == "__main__":
     generate_version()
+    compress_static()
 
     setup(
         name="lavd",
@@ -61,6 +89,7 @@ if __name__ == "__main__":
         include_package_data=True,
         python_requires=">=3.9",
         install_requires=requirements,
+        extras_require=extra_requirements,
         version=version,
         zip_safe=False,
         keywords=["log", "visualise", "visualize", "data"],
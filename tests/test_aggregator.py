@@ -0,0 +1,98 @@
+import simplejson
+from tornado.testing import AsyncHTTPTestCase
+
+from lavd.aggregator import Upstream, parse_steps
+from lavd.server import AggregatorApplication
+
+# Data as it is sent by an upstream, where the steps are strings in the JSON.
+UPSTREAM_DATA = simplejson.loads(
+    simplejson.dumps(
+        {
+            "resnet": {
+                "scalars": {
+                    "loss": {
+                        "steps": {
+                            1: {"value": 0.9},
+                            2: {"value": 0.5},
+                            3: {"value": 0.2},
+                        }
+                    }
+                },
+                "texts": {
+                    "prediction": {
+                        "global": {"actual": "cat"},
+                        "steps": {
+                            2: {"url": "/api/texts/resnet/2/prediction"},
+                        },
+                    }
+                },
+                "command": {"binary": "train.py"},
+            }
+        }
+    )
+)
+
+
+def test_parse_steps():
+    name_data = parse_steps(UPSTREAM_DATA["resnet"])
+    assert list(name_data["scalars"]["loss"]["steps"].keys()) == [1, 2, 3]
+    assert name_data["texts"]["prediction"]["global"] == {"actual": "cat"}
+    assert list(name_data["texts"]["prediction"]["steps"].keys()) == [2]
+    assert name_data["command"] == {"binary": "train.py"}
+
+
+class AggregatorTest(AsyncHTTPTestCase):
+    def get_app(self) -> AggregatorApplication:
+        # The upstream is never started, its data is given directly instead.
+        self.aggregator = AggregatorApplication([("node1", "http://node1:4343")])
+        self.aggregator.upstreams[0].update(UPSTREAM_DATA)
+        return self.aggregator
+
+    def fetch_json(self, path: str):
+        response = self.fetch(path)
+        self.assertEqual(response.code, 200)
+        return simplejson.loads(response.body)
+
+    def test_all_start_end(self):
+        data = self.fetch_json("/api/all?start=2&end=2&kind=scalars")
+        self.assertEqual(
+            data,
+            {"node1:resnet": {"scalars": {"loss": {"steps": {"2": {"value": 0.5}}}}}},
+        )
+
+    def test_all_start(self):
+        data = self.fetch_json("/api/all?start=2")
+        self.assertEqual(
+            list(data["node1:resnet"]["scalars"]["loss"]["steps"].keys()), ["2", "3"]
+        )
+        self.assertEqual(
+            data["node1:resnet"]["texts"]["prediction"],
+            {
+                "global": {"actual": "cat"},
+                "steps": {"2": {"url": "/api/texts/node1:resnet/2/prediction"}},
+            },
+        )
+
+
+def test_events_chunks():
+    received = []
+    upstream = Upstream(
+        "node1", "http://node1:4343", on_change=lambda _, names: received.append(names)
+    )
+    first = UPSTREAM_DATA
+    second = {"resnet": {**UPSTREAM_DATA["resnet"], "command": {"binary": "eval.py"}}}
+    stream = b"".join(
+        [
+            b"event: subscription\ndata: abc\n\n",
+            b"data: " + simplejson.dumps(first).encode("utf-8") + b"\n\n",
+            b"event: data\ndata: " + simplejson.dumps(second).encode("utf-8") + b"\n\n",
+            b"data: {",
+        ]
+    )
+    # Small chunks, so that the events and the separators are split across them.
+    for i in range(0, len(stream), 7):
+        upstream.on_events_chunk(stream[i : i + 7])
+    assert received == [{"resnet"}, {"resnet"}]
+    assert upstream.truncated["node1:resnet"]["command"] == {"binary": "eval.py"}
+    # The incomplete event is kept until the rest of it arrives.
+    assert upstream.buffer == b"data: {"
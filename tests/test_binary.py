@@ -0,0 +1,195 @@
+import copy
+import math
+import struct
+from typing import Any, Callable, Dict, List
+
+from lavd.binary import (
+    EXT_FLOAT64_ARRAY,
+    EXT_UINT32_ARRAY,
+    OP_DELETE,
+    OP_SERIES,
+    OP_SET,
+    TypedArray,
+    diff_data,
+    encode_data,
+    pack,
+    to_series,
+)
+from lavd.data import Data
+
+
+def unpack_array(array: TypedArray) -> List[float]:
+    format = "d" if array.code == EXT_FLOAT64_ARRAY else "I"
+    size = struct.calcsize(format)
+    return list(
+        struct.unpack("<{}{}".format(len(array.data) // size, format), array.data)
+    )
+
+
+def test_to_series():
+    series = to_series({2: {"value": 0.5}, 1: {"value": 1}})
+    assert series is not None
+    steps, values = series
+    assert steps.code == EXT_UINT32_ARRAY
+    assert unpack_array(steps) == [1, 2]
+    assert unpack_array(values) == [1.0, 0.5]
+
+
+def test_to_series_nan():
+    # Both are null in the JSON, hence they are the same in the series.
+    series = to_series({1: {"value": float("nan")}, 2: {"value": None}})
+    assert series is not None
+    assert all(math.isnan(value) for value in unpack_array(series[1]))
+
+
+def test_to_series_without_value():
+    # A step without a value is not the same as NaN, so it is kept as it is.
+    assert to_series({1: {"value": 1.0}, 2: {}}) is None
+
+
+def test_to_series_not_scalar():
+    assert to_series({1: {"value": "text"}}) is None
+    assert to_series({1: {"value": True}}) is None
+    assert to_series({1: {"value": 1.0, "other": 2}}) is None
+
+
+# Counterpart of the client (js/binary.ts), which turns the series back into steps
+# and applies the patches.
+def expand_category(category_data: Any) -> Any:
+    if not isinstance(category_data, dict) or "series" not in category_data:
+        return category_data
+    expanded = {key: value for key, value in category_data.items() if key != "series"}
+    expanded["steps"] = expand_series({}, category_data["series"])
+    return expanded
+
+
+def expand_series(steps: Dict, series: List[TypedArray]) -> Dict:
+    for step, value in zip(unpack_array(series[0]), unpack_array(series[1])):
+        steps[int(step)] = {"value": None if math.isnan(value) else value}
+    return steps
+
+
+def expand_experiment(name_data: Dict) -> Dict:
+    expanded = dict(name_data)
+    if "scalars" in expanded:
+        expanded["scalars"] = {
+            category: expand_category(category_data)
+            for category, category_data in expanded["scalars"].items()
+        }
+    return expanded
+
+
+def expand_at(path: List, value: Any) -> Any:
+    if len(path) == 1:
+        return expand_experiment(value)
+    elif len(path) == 2 and path[1] == "scalars":
+        return expand_experiment({"scalars": value})["scalars"]
+    elif len(path) == 3 and path[1] == "scalars":
+        return expand_category(value)
+    return value
+
+
+def apply_patch(data: Dict, ops: List[List]) -> Dict:
+    data = copy.deepcopy(data)
+    for op, path, *value in ops:
+        parent = data
+        for key in path[:-1]:
+            parent = parent.setdefault(key, {})
+        key = path[-1]
+        if op == OP_DELETE:
+            del parent[key]
+        elif op == OP_SET:
+            parent[key] = copy.deepcopy(expand_at(path, value[0]))
+        elif op == OP_SERIES:
+            category = parent.setdefault(key, {})
+            expand_series(category.setdefault("steps", {}), value[0])
+    return data
+
+
+def expand_data(data: Dict) -> Dict:
+    return {name: expand_experiment(d) for name, d in encode_data(data).items()}
+
+
+def create_data() -> Data:
+    data = Data()
+    with data.transaction():
+        for step in range(3):
+            data.set("scalars", "a", step, "loss", {"value": step / 10})
+            data.set("scalars", "b", step, "loss", {"value": step / 10})
+        data.set("texts", "a", 1, "prediction", {"actual": "cat"})
+        data.set_command("a", {"command": {"binary": "train.py"}})
+    return data
+
+
+def assert_patch(data: Data, modify: Callable[[Data], None]) -> List[List]:
+    old = data.truncated
+    modify(data)
+    new = data.truncated
+    ops = diff_data(old, new)
+    # The patch is sent as MessagePack, hence it must be possible to encode it.
+    pack(ops)
+    assert apply_patch(expand_data(old), ops) == expand_data(new)
+    return ops
+
+
+def test_diff_data_unchanged():
+    data = create_data()
+    assert diff_data(data.truncated, data.truncated) == []
+    assert expand_data(data.truncated) == data.truncated
+
+
+def test_diff_data_new_steps():
+    ops = assert_patch(
+        create_data(), lambda data: data.set("scalars", "a", 3, "loss", {"value": 0.3})
+    )
+    # Only the new step is sent.
+    assert len(ops) == 1
+    op, path, series = ops[0]
+    assert op == OP_SERIES
+    assert path == ["a", "scalars", "loss"]
+    assert unpack_array(series[0]) == [3]
+
+
+def test_diff_data_new_category():
+    ops = assert_patch(
+        create_data(), lambda data: data.set("scalars", "a", 0, "acc", {"value": 0.5})
+    )
+    assert [op for op, *_ in ops] == [OP_SET]
+
+
+def test_diff_data_nan():
+    def modify(data: Data):
+        with data.transaction():
+            data.set("scalars", "a", 3, "loss", {"value": float("nan")})
+            data.set("scalars", "a", 4, "loss", {"value": None})
+
+    assert_patch(create_data(), modify)
+
+
+def test_diff_data_without_value():
+    def modify(data: Data):
+        data.set("scalars", "a", 3, "loss", {})
+
+    ops = assert_patch(create_data(), modify)
+    assert ops == [[OP_SET, ["a", "scalars", "loss", "steps", 3], {}]]
+
+
+def test_diff_data_removed():
+    assert_patch(
+        create_data(), lambda data: data.remove("a", 1, category="loss", kind="scalars")
+    )
+    assert_patch(create_data(), lambda data: data.remove("b"))
+    assert_patch(create_data(), lambda data: data.remove_command("a"))
+
+
+def test_diff_data_items():
+    def modify(data: Data):
+        with data.transaction():
+            data.set("texts", "a", 1, "prediction", {"actual": "dog"})
+            data.set("texts", "a", 2, "prediction", {"actual": "cow"})
+            data.set_command("a", {"command": {"binary": "eval.py"}})
+            data.set("scalars", "c", 0, "loss", {"value": 1.0})
+
+    ops = assert_patch(create_data(), modify)
+    # Experiment b did not change, hence it is not part of the patch.
+    assert all(path[0] != "b" for _, path, *_ in ops)
@@ -0,0 +1,131 @@
+import re
+import threading
+
+from lavd.data import Data, Selection, is_unchanged, select_data
+
+
+def create_data() -> Data:
+    data = Data()
+    with data.transaction():
+        for name in ["a", "b"]:
+            for step in range(3):
+                data.set("scalars", name, step, "loss", {"value": step / 10})
+                data.set("scalars", name, step, "accuracy", {"value": step / 5})
+            data.set("texts", name, "global", "prediction", {"actual": "cat"})
+            data.set_command(name, {"command": {"binary": "train.py"}})
+    return data
+
+
+def test_set_keeps_unchanged_subtrees():
+    data = create_data()
+    old_full, old_truncated = data.state
+    old_version = data.version
+    data.set("scalars", "a", 3, "loss", {"value": 0.3})
+    full, truncated = data.state
+    assert data.version == old_version + 1
+    # Only the dictionaries along the path to the new item are new.
+    assert full is not old_full
+    assert full["a"] is not old_full["a"]
+    assert full["a"]["scalars"] is not old_full["a"]["scalars"]
+    assert full["a"]["scalars"]["loss"]["steps"] is not (
+        old_full["a"]["scalars"]["loss"]["steps"]
+    )
+    assert full["b"] is old_full["b"]
+    assert full["a"]["texts"] is old_full["a"]["texts"]
+    assert full["a"]["command"] is old_full["a"]["command"]
+    assert full["a"]["scalars"]["accuracy"] is old_full["a"]["scalars"]["accuracy"]
+    for step in range(3):
+        assert (
+            full["a"]["scalars"]["loss"]["steps"][step]
+            is old_full["a"]["scalars"]["loss"]["steps"][step]
+        )
+    assert truncated["b"] is old_truncated["b"]
+    # The previous version has not been modified.
+    assert 3 not in old_full["a"]["scalars"]["loss"]["steps"]
+    assert 3 not in old_truncated["a"]["scalars"]["loss"]["steps"]
+
+
+def test_remove_keeps_unchanged_subtrees():
+    data = create_data()
+    old_full, _ = data.state
+    data.remove("a", 1, category="loss", kind="scalars")
+    full, _ = data.state
+    assert list(full["a"]["scalars"]["loss"]["steps"].keys()) == [0, 2]
+    assert full["b"] is old_full["b"]
+    assert full["a"]["scalars"]["accuracy"] is old_full["a"]["scalars"]["accuracy"]
+    assert full["a"]["texts"] is old_full["a"]["texts"]
+    assert 1 in old_full["a"]["scalars"]["loss"]["steps"]
+
+    data.remove("b")
+    assert "b" not in data.full
+    assert data.full["a"] is full["a"]
+
+
+def test_remove_nothing():
+    data = create_data()
+    full, _ = data.state
+    # Removing something that does not exist does not copy anything.
+    data.remove("a", 7, category="loss", kind="scalars")
+    assert data.full["a"] is full["a"]
+    assert data.full["b"] is full["b"]
+
+
+def test_transaction_single_version():
+    data = create_data()
+    old_state = data.state
+    old_version = data.version
+    seen = []
+    with data.transaction():
+        data.set("scalars", "a", 3, "loss", {"value": 0.3})
+        steps = data.current_state()[0]["a"]["scalars"]["loss"]["steps"]
+        data.set("scalars", "a", 4, "loss", {"value": 0.4})
+        # Dictionaries created within the transaction are modified in place.
+        assert data.current_state()[0]["a"]["scalars"]["loss"]["steps"] is steps
+        # Other threads only see the previous version until it is finished.
+        thread = threading.Thread(target=lambda: seen.append(data.current_state()))
+        thread.start()
+        thread.join()
+        assert data.state is old_state
+    assert seen == [old_state]
+    assert data.version == old_version + 1
+    assert list(data.full["a"]["scalars"]["loss"]["steps"].keys()) == [0, 1, 2, 3, 4]
+    assert data.full["b"] is old_state[0]["b"]
+
+
+def test_transaction_does_not_modify_previous_version():
+    data = create_data()
+    with data.transaction():
+        data.set("scalars", "a", 3, "loss", {"value": 0.3})
+    previous = data.full
+    previous_steps = previous["a"]["scalars"]["loss"]["steps"]
+    # The dictionaries of the previous transaction are visible, so they are copied.
+    with data.transaction():
+        data.set("scalars", "a", 4, "loss", {"value": 0.4})
+    assert data.full["a"]["scalars"]["loss"]["steps"] is not previous_steps
+    assert 4 not in previous_steps
+    assert len(data.owned) == 0
+
+
+def test_snapshot():
+    data = create_data()
+    snapshot = data.snapshot()
+    data.set("texts", "a", "global", "prediction", {"actual": "dog"})
+    assert snapshot.full["a"]["texts"]["prediction"]["global"] == {"actual": "cat"}
+    assert snapshot.full["b"] is data.full["b"]
+
+
+def test_select_shares_unchanged():
+    data = create_data()
+    selection = Selection(kinds=["scalars"], pattern=re.compile("^a$"), start=1)
+    selected = select_data(data.full, selection)
+    assert selected["b"] == {}
+    assert list(selected["a"]["scalars"]["loss"]["steps"].keys()) == [1, 2]
+    assert is_unchanged(selected, select_data(data.full, selection))
+    # Changes outside of the selection are not noticed.
+    data.set("texts", "a", "global", "prediction", {"actual": "dog"})
+    data.set("scalars", "b", 3, "loss", {"value": 0.3})
+    assert is_unchanged(selected, select_data(data.full, selection))
+    data.set("scalars", "a", 3, "loss", {"value": 0.3})
+    assert not is_unchanged(selected, select_data(data.full, selection))
+    # Everything is selected as it is.
+    assert select_data(data.full, Selection()) is data.full
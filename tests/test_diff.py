@@ -0,0 +1,109 @@
+import random
+from typing import List
+
+import pytest
+
+from lavd.diff import (
+    ADDED,
+    DIFF_LEVELS,
+    DIRECT_DIFF_LIMIT,
+    EQUAL,
+    REMOVED,
+    DiffCache,
+    compute_diff,
+)
+from lavd.items import FileRef
+
+WORDS = ["the", "cat", "sat", "on", "a", "mat", "dog", "ran", ".", ",", "\n"]
+
+
+def random_text(rng: random.Random, num_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(num_words))
+
+
+def mutate(rng: random.Random, text: str, num_edits: int) -> str:
+    chars = list(text)
+    for _ in range(num_edits):
+        i = rng.randrange(len(chars) + 1)
+        if rng.random() < 0.5 and i < len(chars):
+            del chars[i]
+        else:
+            chars.insert(i, rng.choice("abc \n"))
+    return "".join(chars)
+
+
+def join_ops(ops: List[List[str]], ops_to_keep: List[str]) -> str:
+    return "".join(value for op, value in ops if op in ops_to_keep)
+
+
+def assert_round_trip(actual: str, expected: str, level: str):
+    ops = compute_diff(actual, expected, level=level)
+    assert join_ops(ops, [EQUAL, REMOVED]) == actual
+    assert join_ops(ops, [EQUAL, ADDED]) == expected
+    for op, value in ops:
+        assert op in [EQUAL, REMOVED, ADDED]
+        assert len(value) > 0
+    # Consecutive operations of the same kind are merged.
+    for (op, _), (next_op, _) in zip(ops, ops[1:]):
+        assert op != next_op
+
+
+@pytest.mark.parametrize("level", DIFF_LEVELS)
+@pytest.mark.parametrize(
+    "actual,expected",
+    [
+        ("", ""),
+        ("", "added"),
+        ("removed", ""),
+        ("same", "same"),
+        ("the cat sat", "the dog sat"),
+        ("line 1\nline 2\n", "line 1\nline two\nline 3"),
+        ("abc", "xyz"),
+    ],
+)
+def test_round_trip(actual: str, expected: str, level: str):
+    assert_round_trip(actual, expected, level)
+
+
+@pytest.mark.parametrize("level", DIFF_LEVELS)
+def test_round_trip_random(level: str):
+    rng = random.Random(0)
+    for _ in range(50):
+        actual = random_text(rng, rng.randrange(50))
+        expected = mutate(rng, actual, rng.randrange(10))
+        assert_round_trip(actual, expected, level)
+
+
+@pytest.mark.parametrize("level", DIFF_LEVELS)
+def test_round_trip_long(level: str):
+    rng = random.Random(1)
+    actual = random_text(rng, 2000)
+    expected = mutate(rng, actual, 50)
+    # Long enough to be diffed with the coarser tokens first.
+    assert len(actual) * len(expected) > DIRECT_DIFF_LIMIT
+    assert_round_trip(actual, expected, level)
+
+
+def test_diff():
+    assert compute_diff("the cat sat", "the dog sat", level="word") == [
+        [EQUAL, "the "],
+        [REMOVED, "cat"],
+        [ADDED, "dog"],
+        [EQUAL, " sat"],
+    ]
+
+
+def test_diff_cache():
+    cache = DiffCache()
+    ref = FileRef("a.txt", "text", size=10, mtime_ns=1)
+    item = {"actual": "the cat sat", "expected": "the dog sat"}
+    ops = cache.get(("a", 1, "prediction"), ref, item)
+    # Equal references are the same version of the text.
+    same_ref = FileRef("a.txt", "text", size=10, mtime_ns=1)
+    assert cache.get(("a", 1, "prediction"), same_ref, dict(item)) is ops
+    changed_ref = FileRef("a.txt", "text", size=11, mtime_ns=2)
+    changed = {"actual": "the cat sat", "expected": "the cat ran"}
+    assert cache.get(("a", 1, "prediction"), changed_ref, changed) == compute_diff(
+        changed["actual"], changed["expected"]
+    )
+    assert cache.get(("a", 1, "prediction"), ref, {"actual": "cat"}) is None
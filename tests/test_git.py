@@ -0,0 +1,63 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from lavd.git import compute_git_diff, prefetch_git_diff
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+
+
+def run_git(*args: str, cwd: Path):
+    subprocess.run(
+        [
+            "git",
+            "-c",
+            "user.name=lavd",
+            "-c",
+            "user.email=lavd@example.com",
+            *args,
+        ],
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+@pytest.fixture
+def repo_path(tmp_path: Path) -> Path:
+    run_git("init", cwd=tmp_path)
+    (tmp_path / "latin1.txt").write_bytes("caf\xe9\n".encode("latin-1"))
+    run_git("add", "latin1.txt", cwd=tmp_path)
+    run_git("commit", "-m", "Initial commit", cwd=tmp_path)
+    return tmp_path
+
+
+def test_diff_not_utf8(repo_path: Path):
+    (repo_path / "latin1.txt").write_bytes("cr\xe8me br\xfbl\xe9e\n".encode("latin-1"))
+    diff = compute_git_diff(repo_path)
+    assert "latin1.txt" in diff
+    assert "�" in diff
+
+
+def test_prefetch_diff_not_utf8(repo_path: Path):
+    (repo_path / "latin1.txt").write_bytes("cr\xe8me br\xfbl\xe9e\n".encode("latin-1"))
+    future = prefetch_git_diff(repo_path)
+    assert "latin1.txt" in future.result(timeout=10)
+
+
+def test_prefetch_diff_error(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    def fail(repo_path):
+        raise RuntimeError("diff failed")
+
+    monkeypatch.setattr("lavd.git.compute_git_diff", fail)
+    future = prefetch_git_diff(tmp_path)
+    # The error is set on the future, rather than leaving it unresolved.
+    with pytest.raises(RuntimeError, match="diff failed"):
+        future.result(timeout=10)
+
+
+def test_no_repo():
+    assert compute_git_diff(None) == ""
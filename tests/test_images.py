@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from lavd.images import to_pil_image, to_pil_images, to_uint8_array
+
+
+@pytest.mark.parametrize(
+    "values,dtype",
+    [
+        ([-5, 0, 100, 255, 300, 7], np.int32),
+        ([-5, 0, 100, 255, 300, 7], np.int64),
+        ([1000, 0, 100, 255, 300, 7], np.uint16),
+        ([-5, 0, 100, 127, -128, 7], np.int8),
+    ],
+)
+def test_integer_array(values, dtype):
+    array = np.array(values, dtype=dtype).reshape(1, 2, 3)
+    converted = to_uint8_array(array)
+    assert converted.dtype == np.uint8
+    assert converted.tolist() == np.clip(array, 0, 255).tolist()
+    image = to_pil_image(array)
+    assert image.mode == "RGB"
+    assert image.size == (2, 1)
+
+
+def test_label_map():
+    labels = np.arange(12, dtype=np.int64).reshape(3, 4)
+    image = to_pil_image(labels)
+    assert image.mode == "L"
+    assert np.asarray(image).tolist() == labels.tolist()
+
+
+def test_float_and_bool_array():
+    floats = np.array([-1.0, 0.0, 0.5, 1.0, 2.0])
+    assert to_uint8_array(floats).tolist() == [0, 0, 127, 255, 255]
+    assert to_uint8_array(np.array([True, False])).tolist() == [255, 0]
+
+
+def test_copy():
+    array = np.zeros((2, 2, 3), dtype=np.uint8)
+    assert np.shares_memory(to_uint8_array(array), array)
+    assert not np.shares_memory(to_uint8_array(array, copy=True), array)
+    images = to_pil_images(array[np.newaxis], copy=True)
+    array[:] = 255
+    assert np.asarray(images[0]).max() == 0
+
+
+def test_tensor_same_as_array():
+    torch = pytest.importorskip("torch")
+    array = np.array([[[-5, 0, 100], [255, 300, 7]]], dtype=np.int64)
+    # Tensors are channels first.
+    tensor = torch.from_numpy(array).permute(2, 0, 1)
+    assert to_uint8_array(tensor).tolist() == to_uint8_array(array).tolist()
+    mask = np.array([[True, False]])
+    assert (
+        to_uint8_array(torch.from_numpy(mask)).tolist() == to_uint8_array(mask).tolist()
+    )
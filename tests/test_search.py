@@ -0,0 +1,177 @@
+import pickle
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from lavd.data import Data
+from lavd.items import FileRef
+from lavd.search import SearchIndex
+
+
+def write_log(path: Path, messages: List[str], mode: str = "w") -> FileRef:
+    with open(path, mode, encoding="utf-8") as fd:
+        for message in messages:
+            fd.write("2024-01-01T00:00:00\tinfo\t{}\n".format(message))
+    return FileRef.from_file(path, "log")
+
+
+def logs_data(logs: Dict[str, FileRef], texts: Dict[str, str] = {}) -> Data:
+    full = {
+        name: {
+            "logs": {"train": {"global": item}},
+            **(
+                {"texts": {"prediction": {"steps": {1: {"actual": texts[name]}}}}}
+                if name in texts
+                else {}
+            ),
+        }
+        for name, item in logs.items()
+    }
+    return Data(full, {})
+
+
+def search_names(index: SearchIndex, query: str) -> List[str]:
+    _, hits = index.search(query)
+    return sorted(hit.name for hit in hits)
+
+
+def assert_same_as_fresh(index: SearchIndex, data: Data):
+    fresh = SearchIndex()
+    fresh.sync(data)
+    assert index.postings == fresh.postings
+    assert {key: doc.length for key, doc in index.docs.items()} == {
+        key: doc.length for key, doc in fresh.docs.items()
+    }
+    assert index.total_length == fresh.total_length
+    assert len(index.stale) == 0
+
+
+def test_sync_append(tmp_path: Path):
+    log = write_log(tmp_path / "a.log", ["epoch started"])
+    index = SearchIndex()
+    index.sync(logs_data({"a": log}))
+    assert search_names(index, "epoch") == ["a"]
+    assert search_names(index, "finished") == []
+
+    appended = write_log(tmp_path / "a.log", ["epoch finished"], mode="a")
+    data = logs_data({"a": appended})
+    index.sync(data)
+    assert search_names(index, "epoch finished") == ["a"]
+    assert index.docs[("logs", "a", "global", "train")].end == appended.size
+    assert_same_as_fresh(index, data)
+
+
+def test_sync_changed_files(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    logs = {
+        name: write_log(tmp_path / "{}.log".format(name), ["loading", name])
+        for name in ["a", "b", "c"]
+    }
+    index = SearchIndex()
+    index.sync(logs_data(logs))
+    assert search_names(index, "loading") == ["a", "b", "c"]
+
+    # Rewritten rather than appended, so the tokens of the old files are unknown.
+    logs = {
+        name: write_log(tmp_path / "{}.log".format(name), ["done"]) for name in logs
+    }
+    data = logs_data(logs)
+    num_passes = 0
+    remove_stale = index.remove_stale
+
+    def count_remove_stale():
+        nonlocal num_passes
+        num_passes += 1
+        remove_stale()
+
+    monkeypatch.setattr(index, "remove_stale", count_remove_stale)
+    index.sync(data)
+    # The postings of all changed files are removed in a single pass.
+    assert num_passes == 1
+    assert search_names(index, "loading") == []
+    assert search_names(index, "done") == ["a", "b", "c"]
+    assert_same_as_fresh(index, data)
+
+
+def test_sync_removal(tmp_path: Path):
+    logs = {
+        name: write_log(tmp_path / "{}.log".format(name), ["common", name])
+        for name in ["a", "b"]
+    }
+    index = SearchIndex()
+    index.sync(logs_data(logs, texts={"a": "cat", "b": "dog"}))
+    assert search_names(index, "common") == ["a", "b"]
+    assert search_names(index, "cat") == ["a"]
+
+    data = logs_data({"b": logs["b"]}, texts={"b": "dog"})
+    index.sync(data)
+    assert search_names(index, "common") == ["b"]
+    assert search_names(index, "cat") == []
+    assert "a" not in index.postings
+    assert_same_as_fresh(index, data)
+
+
+def test_sync_unchanged_experiments(tmp_path: Path):
+    log = write_log(tmp_path / "a.log", ["epoch"])
+    data = logs_data({"a": log}, texts={"a": "cat"})
+    index = SearchIndex()
+    index.sync(data)
+    indexed = dict(index.docs)
+    # Only the text changed, the log is the same dictionary.
+    full = data.full
+    changed = Data(
+        {
+            "a": {
+                **full["a"],
+                "texts": {"prediction": {"steps": {1: {"actual": "dog"}}}},
+            }
+        },
+        {},
+    )
+    index.sync(changed)
+    key = ("logs", "a", "global", "train")
+    assert index.docs[key] is indexed[key]
+    assert search_names(index, "dog") == ["a"]
+    assert search_names(index, "cat") == []
+    assert_same_as_fresh(index, changed)
+
+
+def test_sync_not_blocking(tmp_path: Path):
+    index = SearchIndex()
+    data = logs_data({"a": write_log(tmp_path / "a.log", ["epoch"])})
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def hold_lock():
+        with index.lock:
+            acquired.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    acquired.wait()
+    try:
+        assert not index.sync(data, blocking=False)
+    finally:
+        release.set()
+        thread.join()
+    assert index.sync(data, blocking=False)
+    assert search_names(index, "epoch") == ["a"]
+
+
+def test_sync_new_snapshot(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    log = write_log(tmp_path / "a.log", ["epoch"])
+    data = logs_data({"a": log}, texts={"a": "cat"})
+    index = SearchIndex()
+    index.sync(data)
+    # A snapshot that has been loaded again consists of new, but equal, objects.
+    snapshot = Data(*pickle.loads(pickle.dumps(data.state)))
+    monkeypatch.setattr(
+        "lavd.search.count_tokens", lambda *args: pytest.fail("indexed again")
+    )
+    index.sync(snapshot)
+    assert search_names(index, "epoch") == ["a"]
+    assert search_names(index, "cat") == ["a"]
+    key = ("texts", "a", 1, "prediction")
+    assert index.docs[key].item is snapshot.full["a"]["texts"]["prediction"]["steps"][1]
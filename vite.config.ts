@@ -5,4 +5,9 @@ export default defineConfig({
   // React refresh is the hot reloading supported by React,
   // which keeps the state of components when rebuilding.
   plugins: [reactRefresh()],
+  build: {
+    // The server serves everything in the assets directory as immutable, which
+    // is only possible because the file names contain the hash of the content.
+    assetsDir: "assets",
+  },
 });